@@ -0,0 +1,90 @@
+// Callbacks that only compare dropdown values or pass a store through, run in the browser without a round trip to
+// the server. Registered in var_summary_app.py with `ClientsideFunction(namespace = "var_summary", ...)`.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    var_summary: {
+        toggle_duplicate_modal: function (first_var, second_var, third_var, close_click, is_open) {
+            if (first_var != null && second_var != null && third_var != null) {
+                if (second_var !== "No Selection" && third_var === "No Selection") {
+                    if (first_var === second_var) {
+                        return !is_open;
+                    } else if (close_click) {
+                        return is_open;
+                    }
+                } else if (second_var !== "No Selection" && third_var !== "No Selection") {
+                    if (first_var === second_var || first_var === third_var || second_var === third_var) {
+                        return !is_open;
+                    } else if (close_click) {
+                        return is_open;
+                    }
+                }
+                return null;
+            }
+            return window.dash_clientside.no_update;
+        },
+
+        duplicate_message: function (first_var, second_var, third_var) {
+            function markdown_output(var_type) {
+                return `  
+                All variables supplied must be unique.  
+                  
+                | variable | | value |
+                | --- | --- | ---: |
+                | first | = | ${first_var} |
+                | second | = | ${second_var} |
+                | Third | = | ${third_var} |  
+                
+                ${var_type} are similar.
+               `;
+            }
+
+            if (first_var != null && second_var != null && third_var != null) {
+                let duplicate_value;
+
+                if (second_var !== "No Selection" && third_var === "No Selection") {
+                    duplicate_value = ["first", "second"];
+                } else if (second_var !== "No Selection" && third_var !== "No Selection") {
+                    if (first_var === second_var && first_var === third_var) {
+                        duplicate_value = "All";
+                    } else if (first_var === third_var) {
+                        duplicate_value = ["first", "third"];
+                    } else if (second_var === third_var) {
+                        duplicate_value = ["second", "third"];
+                    } else if (first_var === second_var) {
+                        duplicate_value = ["first", "second"];
+                    } else {
+                        duplicate_value = "";
+                    }
+                } else {
+                    return null;
+                }
+
+                if (Array.isArray(duplicate_value)) {
+                    return markdown_output(`The ${duplicate_value[0]} and ${duplicate_value[1]} variable`);
+                }
+                return markdown_output("All variables");
+            }
+            return window.dash_clientside.no_update;
+        },
+
+        // A tab only receives the version it shows once it is opened, so an upload does not compute the outputs of
+        // every tab at once. The stores hold version ids, the summary tab uses the cleaned version once there is one.
+        open_tab: function (active_tab, data_version, cleaned_version, check_version, summary_version) {
+            const no_update = window.dash_clientside.no_update;
+
+            if (data_version == null) {
+                throw window.dash_clientside.PreventUpdate;
+            }
+
+            if (active_tab === "tab_data_check" && check_version !== data_version) {
+                return [data_version, no_update];
+            }
+
+            const to_summary = cleaned_version != null ? cleaned_version : data_version;
+            if (active_tab === "data_summary_tab" && summary_version !== to_summary) {
+                return [no_update, to_summary];
+            }
+
+            return [no_update, no_update];
+        }
+    }
+});
@@ -0,0 +1,3 @@
+"""
+Benchmarks of the app, run each module from the repository root, e.g. `python -m benchmarks.render`.
+"""
@@ -0,0 +1,380 @@
+"""
+Replay user sessions against the Dash callback endpoint with concurrent virtual users.
+
+    python -m benchmarks.load_test --users 8 --sessions 3
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --server-pids 1234 1235 --users 16
+
+A session uploads a CSV file, shows the table, opens the Data Check tab, cleans two variables, selects variables and
+runs a summary, then opens the correlation plot, polling background jobs the way the page does. The request payloads
+are built from `/_dash-dependencies`, so they follow the callbacks of the app.
+
+Without `--url` the app is imported and served in process through the Flask test client, nothing else is needed.
+The report gives the p50/p95/p99 latency and the number of round trips of each callback, the session and request
+throughput and the resident memory of the server process(es).
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import urllib.request
+import uuid
+from threading import Thread, Lock, Event
+
+
+class DashClient:
+    def __init__(self, url = None, server = None):
+        """
+        parameter
+        ---------
+        url    [string (Optional)] The address of a running app.
+        server [flask.Flask (Optional)] The server of an imported app, used when `url` is None.
+        """
+        self.url = url
+        self._test_client = server.test_client() if url is None else None
+        self.dependencies = self._get("/_dash-dependencies")
+        self.initial_values = {}
+        self._walk_layout(self._get("/_dash-layout"))
+
+    def call(self, output_key, values, triggered):
+        """
+        parameter
+        ---------
+        output_key [string] A component property written by the callback, e.g. "store_data.data".
+        values     [dictionary] The values of the callback inputs and states, by "id.property".
+        triggered  [list] The "id.property" of the inputs that changed.
+
+        return
+        ------
+        The callback output by component id (None when the callback prevented the update), the request and the
+        response size in bytes.
+        """
+        dep = self._find(output_key)
+
+        def props(items):
+            return [{"id": item["id"], "property": item["property"],
+                     "value": values.get(f"{item['id']}.{item['property']}")} for item in items]
+
+        if dep["output"].startswith(".."):
+            outputs = [dict(zip(["id", "property"], out.rsplit(".", 1))) for out in dep["output"].strip(".").split("...")]
+        else:
+            outputs = dict(zip(["id", "property"], dep["output"].rsplit(".", 1)))
+
+        body = json.dumps({"output": dep["output"], "outputs": outputs, "inputs": props(dep["inputs"]),
+                           "state": props(dep["state"]), "changedPropIds": triggered}).encode()
+
+        status, content = self._post("/_dash-update-component", body)
+        if status == 204:
+            return None, len(body), 0
+        if status != 200:
+            raise RuntimeError(f"{output_key} returned HTTP {status}")
+
+        return json.loads(content)["response"], len(body), len(content)
+
+    def clientside_outputs(self):
+        return [dep["output"] for dep in self.dependencies if dep.get("clientside_function") is not None]
+
+    def _walk_layout(self, node):
+        """
+        Collect the initial properties of the components with an id, the values the page starts with.
+        """
+        if isinstance(node, list):
+            for child in node:
+                self._walk_layout(child)
+        elif isinstance(node, dict) and "props" in node:
+            props = node["props"]
+            if isinstance(props.get("id"), str):
+                self.initial_values.update({f"{props['id']}.{prop}": value for prop, value in props.items()
+                                            if prop not in ["id", "children"]})
+            self._walk_layout(props.get("children"))
+
+    def _find(self, output_key):
+        for dep in self.dependencies:
+            if output_key in dep["output"].strip(".").split("..."):
+                return dep
+        raise KeyError(output_key)
+
+    def _get(self, path):
+        if self.url is None:
+            return self._test_client.get(path).get_json()
+
+        with urllib.request.urlopen(self.url + path) as response:
+            return json.loads(response.read())
+
+    def _post(self, path, body):
+        if self.url is None:
+            response = self._test_client.post(path, data = body, content_type = "application/json")
+            return response.status_code, response.get_data()
+
+        request = urllib.request.Request(self.url + path, data = body, headers = {"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+        self.errors = []
+        self._lock = Lock()
+
+    def add(self, name, seconds, request_bytes, response_bytes):
+        with self._lock:
+            self.calls.append((name, seconds, request_bytes, response_bytes))
+
+    def error(self, message):
+        with self._lock:
+            self.errors.append(message)
+
+
+class Session:
+    def __init__(self, client, recorder, csv_contents, poll_interval = 0.2, timeout = 120):
+        self.client = client
+        self.recorder = recorder
+        self.csv_contents = csv_contents
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.values = {**client.initial_values, "session_id.data": uuid.uuid4().hex}
+
+    def call(self, name, output_key, triggered, **values):
+        self.values.update({key.replace("__", "."): value for key, value in values.items()})
+
+        start = time.perf_counter()
+        response, request_bytes, response_bytes = self.client.call(output_key, self.values, triggered)
+        self.recorder.add(name, time.perf_counter() - start, request_bytes, response_bytes)
+
+        for component_id, props in (response or {}).items():
+            for prop, value in props.items():
+                self.values[f"{component_id}.{prop}"] = value
+
+        return response or {}
+
+    def poll(self, name, output_key, poll_input, done):
+        """
+        Call a polling callback until `done(response)`, like the `dcc.Interval` of the page.
+        """
+        deadline = time.time() + self.timeout
+        n_intervals = 0
+
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            n_intervals += 1
+            response = self.call(name, output_key, [poll_input], **{poll_input.replace(".", "__"): n_intervals})
+            if done(response):
+                return response
+
+        raise TimeoutError(f"{name} did not finish in {self.timeout} seconds")
+
+    def run(self):
+        # Data Choice tab: upload and show the table.
+        response = self.call("data_choice", "store_data.data", ["upload_data.contents"],
+                             upload_data__contents = [self.csv_contents], upload_data__filename = ["sales.csv"],
+                             upload_data__last_modified = [time.time()], use_demo_data__n_clicks = None)
+        if "store_data" not in response:
+            raise RuntimeError("the upload did not create a table")
+
+        self.call("display_data", "display_data.children", ["store_data.data"])
+
+        # Data Check tab: the clientside gate hands over the version.
+        self.values["check_data.data"] = self.values["store_data.data"]
+        self.call("update_data_inspection_summary", "data_inspection_summary.children", ["check_data.data"])
+        self.call("check_for", "data_check_output.children", ["numeric_summary.n_clicks"],
+                  numeric_summary__n_clicks = 1)
+
+        # Data Cleaning tab: change the type of two text variables.
+        self.call("update_variable_names", "change_character_var.options", ["store_schema.data"])
+        self.call("clean_data", "store_cleaned_data.data", ["store_data.data"])
+        self.call("clean_data", "store_cleaned_data.data", ["change_integer_var.value"],
+                  change_integer_var__value = ["Quantity"], change_float_var__value = ["Tax"])
+        self.call("clean_data", "store_cleaned_data.data", ["clean.n_clicks"], clean__n_clicks = 1)
+        self.call("dropped_empty_value_modal", "drop_empty_value.children", ["clean.n_clicks"])
+        self.poll("clean_data (poll)", "store_cleaned_data.data", "clean_poll.n_intervals",
+                  lambda response: response.get("clean_poll", {}).get("disabled") is True)
+
+        # Summary tab.
+        self.values["summary_data.data"] = self.values.get("store_cleaned_data.data") or self.values["store_data.data"]
+        self.call("update_summary_schema", "summary_schema.data", ["summary_data.data"])
+        self.call("update_cleaned_variable_names", "first_variable.options", ["summary_schema.data"])
+        self.call("update_plot_agg_type", "plot_type.options", ["first_variable.value"],
+                  first_variable__value = "Product line", second_variable__value = "Total")
+        self.values.update({"plot_type.value": None, "drop_outlier.value": None, "num_unique_obs.value": 10,
+                            "output_type.value": "plot", "num_rows.value": 10})
+        self.call("create_summary", "summary_output.children", ["agg_function.value"])
+        response = self.call("create_summary", "summary_output.children", ["run_summary.n_clicks"],
+                             run_summary__n_clicks = 1)
+        if response.get("summary_poll", {}).get("disabled") is False:
+            self.poll("create_summary (poll)", "summary_output.children", "summary_poll.n_intervals",
+                      lambda response: response.get("summary_poll", {}).get("disabled") is True)
+
+        # Correlation plot.
+        self.call("corr_div_output", "add_corr_div.children", ["summary_schema.data"])
+        self.values.update({"corr_method.value": "pearson", "corr_top_k.value": 50})
+        response = self.call("create_correlation", "other_output.children", ["plot_corr.value"],
+                             plot_corr__value = True)
+        if response.get("corr_poll", {}).get("disabled") is False:
+            self.poll("create_correlation (poll)", "other_output.children", "corr_poll.n_intervals",
+                      lambda response: response.get("corr_poll", {}).get("disabled") is True)
+
+
+def rss_bytes(pid = "self"):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if pid == "self":
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024     # peak, not current, outside Linux.
+    return None
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(round(share * (len(values) - 1))), len(values) - 1)]
+
+
+def load_test(client, csv_contents, users = 4, sessions = 2, poll_interval = 0.2, server_pids = ("self",)):
+    """
+    parameter
+    ---------
+    client       [DashClient]
+    csv_contents [string] The upload contents of the CSV file ("data:text/csv;base64,...").
+    users        [integer] The number of concurrent virtual users.
+    sessions     [integer] The number of sessions each user runs one after the other.
+    server_pids  [list] The processes whose resident memory is sampled.
+
+    return
+    ------
+    A dictionary with the latency percentiles and round trips of each callback, the throughput and the memory.
+    """
+    recorder = Recorder()
+    stop = Event()
+    memory = {pid: {"start": rss_bytes(pid), "peak": rss_bytes(pid)} for pid in server_pids}
+
+    def sample_memory():
+        while not stop.wait(0.2):
+            for pid in server_pids:
+                current = rss_bytes(pid)
+                if current is not None:
+                    memory[pid]["peak"] = max(memory[pid]["peak"] or 0, current)
+
+    def user():
+        for _ in range(sessions):
+            try:
+                Session(client, recorder, csv_contents, poll_interval = poll_interval).run()
+            except Exception as e:
+                recorder.error(repr(e))
+
+    sampler = Thread(target = sample_memory, daemon = True)
+    sampler.start()
+
+    start = time.perf_counter()
+    threads = [Thread(target = user) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    sampler.join()
+    for pid in server_pids:
+        memory[pid]["end"] = rss_bytes(pid)
+
+    callbacks = {}
+    for name, seconds, request_bytes, response_bytes in recorder.calls:
+        stats = callbacks.setdefault(name, {"seconds": [], "request_bytes": 0, "response_bytes": 0})
+        stats["seconds"].append(seconds)
+        stats["request_bytes"] += request_bytes
+        stats["response_bytes"] += response_bytes
+
+    n_sessions = users * sessions - len(recorder.errors)
+
+    return {
+        "users": users,
+        "sessions": n_sessions,
+        "errors": recorder.errors,
+        "elapsed_seconds": elapsed,
+        "sessions_per_second": n_sessions / elapsed,
+        "requests_per_second": len(recorder.calls) / elapsed,
+        "round_trips_per_session": len(recorder.calls) / max(n_sessions, 1),
+        "clientside_callbacks": client.clientside_outputs(),
+        "callbacks": {
+            name: {"calls": len(stats["seconds"]),
+                   "p50": percentile(stats["seconds"], 0.50),
+                   "p95": percentile(stats["seconds"], 0.95),
+                   "p99": percentile(stats["seconds"], 0.99),
+                   "request_bytes": stats["request_bytes"] / len(stats["seconds"]),
+                   "response_bytes": stats["response_bytes"] / len(stats["seconds"])}
+            for name, stats in callbacks.items()
+        },
+        "memory": {str(pid): mem for pid, mem in memory.items()},
+    }
+
+
+def csv_upload_contents(rows = None, path = "m_sales.csv"):
+    if rows is None:
+        with open(path, "rb") as f:
+            content = f.read()
+    else:
+        from benchmarks.synthetic import sales_table
+        content = sales_table(rows).to_csv(index = False).encode()
+
+    return "data:text/csv;base64," + base64.b64encode(content).decode()
+
+
+def print_report(report):
+    print(f"{'callback':<34} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req KB':>8} {'resp KB':>9}")
+    for name, stats in sorted(report["callbacks"].items(), key = lambda item: -item[1]["p95"]):
+        print(f"{name:<34} {stats['calls']:>6} {stats['p50'] * 1e3:9.1f} {stats['p95'] * 1e3:9.1f} "
+              f"{stats['p99'] * 1e3:9.1f} {stats['request_bytes'] / 1e3:8.1f} {stats['response_bytes'] / 1e3:9.1f}")
+
+    print(f"\n{report['sessions']} sessions by {report['users']} users in {report['elapsed_seconds']:.1f}s: "
+          f"{report['sessions_per_second']:.2f} sessions/s, {report['requests_per_second']:.1f} requests/s, "
+          f"{report['round_trips_per_session']:.1f} round trips per session")
+    print(f"{len(report['clientside_callbacks'])} callbacks run in the browser without a round trip")
+
+    for pid, mem in report["memory"].items():
+        if mem["start"] is not None:
+            print(f"RSS of {pid}: {mem['start'] / 1e6:.0f} MB at start, {mem['peak'] / 1e6:.0f} MB peak, "
+                  f"{mem['end'] / 1e6:.0f} MB at the end")
+
+    for error in report["errors"]:
+        print(f"error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help = "address of a running app, the app is served in process when omitted")
+    parser.add_argument("--server-pids", nargs = "+", help = "processes to sample the memory of (with --url)")
+    parser.add_argument("--users", type = int, default = 4)
+    parser.add_argument("--sessions", type = int, default = 2, help = "sessions per user")
+    parser.add_argument("--rows", type = int, help = "upload a synthetic table of this size instead of m_sales.csv")
+    parser.add_argument("--poll-interval", type = float, default = 0.2)
+    parser.add_argument("--output", help = "save the report as JSON")
+    args = parser.parse_args()
+
+    if args.url is None:
+        sys.path.insert(0, os.getcwd())
+        import var_summary_app
+        client, server_pids = DashClient(server = var_summary_app.server), ["self"]
+    else:
+        client, server_pids = DashClient(url = args.url.rstrip("/")), args.server_pids or []
+
+    report = load_test(client, csv_upload_contents(args.rows), users = args.users, sessions = args.sessions,
+                       poll_interval = args.poll_interval, server_pids = server_pids)
+    print_report(report)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2)
+
+
+if __name__ == "__main__":
+    main()
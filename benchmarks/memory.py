@@ -0,0 +1,165 @@
+"""
+Measure the memory used by each stage of the upload, clean and summarize flow on synthetic sales tables.
+
+    python -m benchmarks.memory --rows 1e4 1e5 1e6
+    python -m benchmarks.memory --rows 1e6 --budget parse_contents=4 clean=2 --output memory.json
+
+Each stage runs under tracemalloc and reports its allocation peak (the most memory Python held at once above what it
+held before the stage) and the change of the process's resident memory. Both are also given as multiples of the
+size of the uploaded CSV file, the unit of the budgets: a stage whose peak exceeds its budget makes the command exit
+with status 1, so a new copy of the table in one of the stages shows up as a failure.
+"""
+import argparse
+import base64
+import gc
+import json
+import sys
+import time
+import tracemalloc
+import warnings
+
+import custom_functions as cf
+from benchmarks.load_test import rss_bytes
+from benchmarks.summary import environment
+from benchmarks.synthetic import sales_table
+from dataset_store import DatasetStore
+
+
+# Peak allocation of each stage, as a multiple of the CSV file size: the measured ratios with some headroom.
+default_budgets = {
+    "parse_contents": 7.0,
+    "store_create": 1.5,
+    "store_get": 0.5,
+    "clean": 5.0,
+    "summarize": 1.0,
+}
+
+
+def measure(fn):
+    """
+    return
+    ------
+    The result of `fn()`, its tracemalloc peak and the change of the resident memory in bytes.
+    """
+    gc.collect()
+    rss_before = rss_bytes()
+    current_before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+
+    result = fn()
+
+    _, peak = tracemalloc.get_traced_memory()
+    rss_after = rss_bytes()
+
+    return result, peak - current_before, rss_after - rss_before
+
+
+def stages(n_rows, app):
+    """
+    The stages of one user session: `parse_contents()` decodes and reads the upload, the dataset store keeps the
+    table and hands it back to the callbacks, the cleaning plan converts Quantity and Tax and `wrapper_summary()`
+    aggregates the cleaned table. Each stage passes its result to the next one.
+
+    return
+    ------
+    The size of the CSV file and a list of (stage name, function) pairs.
+    """
+    csv = sales_table(n_rows).to_csv(index = False).encode()
+    contents = "data:text/csv;base64," + base64.b64encode(csv).decode()
+    del csv
+
+    store = DatasetStore()
+    plan = cf.cleaning_plan(change_int = ["Quantity"], change_float = ["Tax"])
+    state = {}
+
+    def parse():
+        state["df"] = app.parse_contents(contents, "sales.csv", time.time())
+
+    def create():
+        state["version"] = store.create(state.pop("df"))
+
+    def get():
+        state["df"] = store.get(state["version"])
+
+    def clean():
+        cleaned = cf.apply_cleaning_plan(df = state.pop("df"), plan = plan)
+        state["cleaned_version"] = store.commit(state["version"], cleaned, cf.describe_cleaning_plan(plan))
+
+    def summarize():
+        cf.wrapper_summary(w_df = store.get(state["cleaned_version"]), first_variable = "Product line",
+                           second_variable = "Total", third_variable = None, num_agg_type = "mean",
+                           output_type = "table")
+
+    return len(contents) * 3 // 4, [("parse_contents", parse), ("store_create", create), ("store_get", get),
+                                    ("clean", clean), ("summarize", summarize)]
+
+
+def run(rows, budgets = default_budgets):
+    """
+    parameter
+    ---------
+    rows    [list] The table sizes to measure.
+    budgets [dictionary] The allowed peak allocation of each stage, as a multiple of the CSV file size.
+
+    return
+    ------
+    A dictionary with the environment and a list of results, one per stage and table size.
+    """
+    import var_summary_app as app
+
+    results = []
+    tracemalloc.start()
+
+    try:
+        for n_rows in rows:
+            csv_bytes, steps = stages(n_rows, app)
+
+            for name, fn in steps:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    _, peak, rss_delta = measure(fn)
+
+                budget = budgets.get(name)
+                res = {"stage": name, "rows": n_rows, "csv_bytes": csv_bytes, "peak_bytes": peak,
+                       "rss_delta_bytes": rss_delta, "peak_ratio": peak / csv_bytes,
+                       "rss_ratio": rss_delta / csv_bytes, "budget": budget,
+                       "over_budget": budget is not None and peak / csv_bytes > budget}
+                results.append(res)
+
+                print(f"{name:<16} {n_rows:>10,} rows {peak / 1e6:10.1f} MB peak ({res['peak_ratio']:5.2f}x CSV) "
+                      f"{rss_delta / 1e6:10.1f} MB RSS ({res['rss_ratio']:5.2f}x) {'OVER BUDGET' if res['over_budget'] else ''}",
+                      file = sys.stderr)
+    finally:
+        tracemalloc.stop()
+
+    return {"environment": environment(), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type = float, nargs = "+", default = [1e4, 1e5])
+    parser.add_argument("--budget", nargs = "+", default = [], metavar = "STAGE=RATIO",
+                        help = f"peak allocation budgets as multiples of the CSV size, defaults: {default_budgets}")
+    parser.add_argument("--output", help = "save the results as JSON")
+    args = parser.parse_args()
+
+    budgets = dict(default_budgets)
+    for item in args.budget:
+        stage, ratio = item.split("=")
+        budgets[stage] = float(ratio)
+
+    result = run([int(n_rows) for n_rows in args.rows], budgets = budgets)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent = 2)
+
+    over = [res for res in result["results"] if res["over_budget"]]
+    for res in over:
+        print(f"{res['stage']} at {res['rows']:,} rows: peak {res['peak_ratio']:.2f}x the CSV size, budget "
+              f"{res['budget']}x")
+    sys.exit(1 if over != [] else 0)
+
+
+if __name__ == "__main__":
+    main()
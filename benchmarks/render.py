@@ -0,0 +1,78 @@
+"""
+Time `create_dataframe()` for narrow and wide tables.
+
+    python -m benchmarks.render --rows 10000 --columns 10 1000
+
+Reports the first render of a schema (column specs built), a repeated render (column specs cached), a render with
+server side paging (only the first page encoded) and the time to serve one sorted and filtered page.
+"""
+import argparse
+import time
+
+from numpy.random import default_rng
+from pandas import DataFrame
+
+import component_functions as comp_fun
+
+
+def make_frame(n_rows, n_columns, seed = 0):
+    rng = default_rng(seed)
+    columns = {}
+
+    for i in range(n_columns):
+        if i % 4 == 3:
+            columns[f"category_{i}"] = rng.choice(["a", "b", "c", "d"], size = n_rows)
+        else:
+            columns[f"value_{i}"] = rng.normal(size = n_rows)
+
+    return DataFrame(columns)
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def benchmark(n_rows, n_columns, page_size = 20, repeat = 5):
+    df = make_frame(n_rows, n_columns)
+    sort_col = comp_fun.clean_column_name(df.columns[0])
+
+    comp_fun.column_specs.cache_clear()
+    start = time.perf_counter()
+    comp_fun.create_dataframe(df.head(page_size), page_size = page_size)
+    first = time.perf_counter() - start
+
+    return {
+        "rows": n_rows,
+        "columns": n_columns,
+        "first_render_s": first,
+        "cached_render_s": best_of(lambda: comp_fun.create_dataframe(df.head(page_size), page_size = page_size), repeat),
+        "full_table_render_s": best_of(lambda: comp_fun.create_dataframe(df, page_size = page_size), 1),
+        "server_paged_render_s": best_of(lambda: comp_fun.create_dataframe(df, page_size = page_size,
+                                                                           table_id = "benchmark"), repeat),
+        "sorted_filtered_page_s": best_of(lambda: comp_fun.table_page(df, 3, page_size,
+                                                                      [{"column_id": sort_col, "direction": "desc"}],
+                                                                      f"{{{sort_col}}} gt 0"), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type = int, default = 10000)
+    parser.add_argument("--columns", type = int, nargs = "+", default = [10, 1000])
+    parser.add_argument("--repeat", type = int, default = 5)
+    args = parser.parse_args()
+
+    for n_columns in args.columns:
+        result = benchmark(args.rows, n_columns, repeat = args.repeat)
+        print(", ".join(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}"
+                        for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
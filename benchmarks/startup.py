@@ -0,0 +1,112 @@
+"""
+Time the start of a worker: importing the app and the first requests that load what the import no longer does.
+
+    python -m benchmarks.startup --repeat 5 --output startup.json
+    python -m benchmarks.startup --repeat 5 --compare before.json
+    python -m benchmarks.startup --app-dir ../checkout-of-an-older-commit --output before.json
+
+Each run starts a new Python process, as a gunicorn worker does, and measures the import of `var_summary_app` (wall
+time, resident memory and the number of modules), then the first "Use Demo Data" click and the first plot, which
+import the plotting modules on first use. The best of `--repeat` runs of each measure is kept. `--compare` prints the
+change from a saved run, `--app-dir` times the app in another directory, e.g. a checkout of an older commit.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.summary import environment
+
+
+# Run in a new interpreter, prints one JSON line.
+probe = """
+import json, sys, time
+start = time.perf_counter()
+import var_summary_app as app
+result = {"import_seconds": time.perf_counter() - start, "modules": len(sys.modules),
+          "plotly_imported": "plotly.express" in sys.modules}
+
+from benchmarks.load_test import rss_bytes
+result["import_rss_bytes"] = rss_bytes()
+
+start = time.perf_counter()
+df = app.demo_data() if hasattr(app, "demo_data") else app.demo_df       # older versions read it at import.
+result["demo_seconds"] = time.perf_counter() - start
+
+start = time.perf_counter()
+app.cf.wrapper_summary(w_df = df, first_variable = "Total", second_variable = None, third_variable = None,
+                       output_type = "plot")
+result["first_plot_seconds"] = time.perf_counter() - start
+
+print(json.dumps(result))
+"""
+
+# name: (unit, scale)
+measures = {
+    "import_seconds": ("ms", 1e3),
+    "import_rss_bytes": ("MB", 1e-6),
+    "demo_seconds": ("ms", 1e3),
+    "first_plot_seconds": ("ms", 1e3),
+    "modules": ("", 1),
+}
+
+
+def run_once(cwd):
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    out = subprocess.run([sys.executable, "-c", probe], cwd = cwd, env = env, capture_output = True, text = True,
+                         check = True).stdout
+
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(repeat = 5, cwd = "."):
+    """
+    parameter
+    ---------
+    repeat [integer] The number of new processes to time, the best of each measure is kept.
+    cwd    [string] The directory of the app.
+
+    return
+    ------
+    A dictionary with the environment, the best of each measure and the runs.
+    """
+    run_once(cwd)                                        # fills the bytecode and demo data caches, not timed.
+
+    runs = [run_once(cwd) for _ in range(repeat)]
+    best = {name: min(res[name] for res in runs) for name in measures}
+    best["plotly_imported"] = any(res["plotly_imported"] for res in runs)
+
+    return {"environment": environment(), "best": best, "runs": runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--app-dir", default = ".", help = "the directory of the app to time")
+    parser.add_argument("--output", help = "save the results as JSON")
+    parser.add_argument("--compare", help = "a saved run to compare with")
+    args = parser.parse_args()
+
+    result = run(repeat = args.repeat, cwd = args.app_dir)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent = 2)
+
+    old = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)["best"]
+
+    for name, (unit, scale) in measures.items():
+        new_value = result["best"][name] * scale
+        line = f"{name:<20} {new_value:10,.1f} {unit:<2}"
+        if old is not None:
+            line += f"   before {old[name] * scale:10,.1f} {unit:<2}  change {new_value - old[name] * scale:+10,.1f} {unit}"
+        print(line)
+    print(f"plotly imported at start: {result['best']['plotly_imported']}")
+
+
+if __name__ == "__main__":
+    main()
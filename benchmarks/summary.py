@@ -0,0 +1,210 @@
+"""
+Time every summary path of `custom_functions` on synthetic sales tables.
+
+    python -m benchmarks.summary run --rows 1000 10000 100000 --output before.json
+    python -m benchmarks.summary run --rows 1000 10000 100000 --output after.json
+    python -m benchmarks.summary compare before.json after.json --threshold 0.2
+
+`run` times each branch of `wrapper_summary()` (as a table and as a plot) and the data check and cleaning functions,
+and saves the best of `--repeat` runs of each case to a JSON file. `compare` prints the change of every case between
+two runs and exits with status 1 when a case is slower by more than `--threshold` (as a share of the old time).
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy
+import pandas
+
+import custom_functions as cf
+from benchmarks.synthetic import sales_table, typed_sales_table
+
+
+# name: (first, second and third variable, plot type, aggregation)
+summary_cases = {
+    "numeric": (["Total", None, None], None, "mean"),
+    "character": (["City", None, None], None, "mean"),
+    "datetime": (["Date", None, None], None, "mean"),
+    "numeric_numeric": (["Total", "Rating", None], None, "mean"),
+    "character_character": (["City", "Payment", None], None, "mean"),
+    "character_numeric": (["Product line", "Total", None], None, "mean"),
+    "datetime_numeric": (["Date", "Total", None], None, "sum"),
+    "numeric_3": (["Total", "Rating", "cogs"], "2d", "mean"),
+    "character_3": (["Branch", "City", "Payment"], None, "mean"),
+    "numeric_character_character": (["Total", "City", "Gender"], None, "mean"),
+    "character_numeric_numeric": (["City", "Total", "Rating"], None, "mean"),
+    "datetime_numeric_character": (["Date", "Total", "City"], None, "sum"),
+}
+
+
+def data_cases(raw, typed):
+    """
+    return
+    ------
+    A dictionary of case names and functions timing the data check, cleaning and correlation functions.
+    """
+    return {
+        "numeric_description": lambda: cf.numeric_description(df = typed),
+        "chr_unique_value": lambda: cf.chr_unique_value(df = raw, max_n = 10),
+        "get_missing_values": lambda: cf.get_missing_values(df = raw),
+        "change_dtype_integer": lambda: cf.change_dtype(df = raw, variables = "Quantity", to_type = "integer"),
+        "change_dtype_date": lambda: cf.change_dtype(df = raw, variables = "Date", to_type = "date"),
+        "extract_datetime": lambda: cf.extract_datetime(df = typed, date_col = "Date", which = "month"),
+        "corr_matrix": lambda: cf.corr_matrix(df = typed),
+    }
+
+
+def summary_call(typed, variables, plt_type, agg_fun, output_type):
+    return lambda: cf.wrapper_summary(typed, first_variable = variables[0], second_variable = variables[1],
+                                      third_variable = variables[2], plt_type = plt_type, num_agg_type = agg_fun,
+                                      output_type = output_type)
+
+
+def best_of(fn, repeat, warmup = 1):
+    for _ in range(warmup):
+        fn()                                             # imports and caches filled on first use are not timed.
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return min(times), sum(times) / len(times)
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+                                check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(),
+            "pandas": pandas.__version__, "numpy": numpy.__version__, "machine": platform.machine()}
+
+
+def run(rows, repeat = 3, cases = None, output_types = ("table", "plot"), warmup = 1):
+    """
+    parameter
+    ---------
+    rows         [list] The table sizes to time.
+    repeat       [integer] The number of runs of each case, the best is kept.
+    warmup       [integer] The number of untimed runs of each case before the timed ones.
+    cases        [list (Optional)] Only time the cases with these names.
+    output_types [list] The output types of the summary cases.
+
+    return
+    ------
+    A dictionary with the environment and a list of results, one per case and table size.
+    """
+    results = []
+
+    for n_rows in rows:
+        raw = sales_table(n_rows)
+        typed = typed_sales_table(n_rows)
+
+        timed = dict(data_cases(raw, typed))
+        for name, (variables, plt_type, agg_fun) in summary_cases.items():
+            for output_type in output_types:
+                timed[f"wrapper_summary.{name}.{output_type}"] = summary_call(typed, variables, plt_type, agg_fun,
+                                                                              output_type)
+
+        for name, fn in timed.items():
+            if cases is not None and name not in cases and name.split(".")[0] not in cases:
+                continue
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                try:
+                    best, mean = best_of(fn, repeat, warmup)
+                except Exception as e:
+                    results.append({"case": name, "rows": n_rows, "error": repr(e)})
+                    continue
+
+            results.append({"case": name, "rows": n_rows, "seconds": best, "mean_seconds": mean, "repeat": repeat})
+            print(f"{name:<55} {n_rows:>10,} rows {best:10.4f}s", file = sys.stderr)
+
+    return {"environment": environment(), "results": results}
+
+
+def compare(old, new, threshold = 0.2, min_seconds = 0.005):
+    """
+    parameter
+    ---------
+    old, new    [dictionary] The outputs of `run()`.
+    threshold   [float] A case is a regression when its new time is more than (1 + threshold) times the old time.
+    min_seconds [float] Cases faster than this in both runs are never flagged, their differences are noise.
+
+    return
+    ------
+    A list of the compared cases, each with the old and new time, their ratio and a `regression` flag.
+    """
+    old_times = {(res["case"], res["rows"]): res.get("seconds") for res in old["results"]}
+    report = []
+
+    for res in new["results"]:
+        key = (res["case"], res["rows"])
+        old_seconds, new_seconds = old_times.get(key), res.get("seconds")
+
+        if old_seconds is None or new_seconds is None:
+            continue
+
+        ratio = new_seconds / old_seconds if old_seconds > 0 else float("inf")
+        regression = ratio > 1 + threshold and max(old_seconds, new_seconds) >= min_seconds
+        report.append({"case": res["case"], "rows": res["rows"], "old_seconds": old_seconds,
+                       "new_seconds": new_seconds, "ratio": ratio, "regression": regression})
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    run_parser = commands.add_parser("run", help = "time the cases and save the results")
+    run_parser.add_argument("--rows", type = float, nargs = "+", default = [1e3, 1e4, 1e5],
+                            help = "table sizes, from 1e3 to 1e7")
+    run_parser.add_argument("--repeat", type = int, default = 3)
+    run_parser.add_argument("--warmup", type = int, default = 1)
+    run_parser.add_argument("--cases", nargs = "+", help = "only these cases (e.g. corr_matrix wrapper_summary)")
+    run_parser.add_argument("--output", default = "benchmark_summary.json")
+
+    compare_parser = commands.add_parser("compare", help = "compare two saved runs")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type = float, default = 0.2)
+    compare_parser.add_argument("--min-seconds", type = float, default = 0.005)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        result = run([int(n_rows) for n_rows in args.rows], repeat = args.repeat, cases = args.cases,
+                     warmup = args.warmup)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent = 2)
+        print(f"Saved {len(result['results'])} results to {args.output}")
+
+    else:
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+
+        report = compare(old, new, threshold = args.threshold, min_seconds = args.min_seconds)
+        for res in report:
+            flag = "REGRESSION" if res["regression"] else ""
+            print(f"{res['case']:<55} {res['rows']:>10,} {res['old_seconds']:10.4f}s {res['new_seconds']:10.4f}s "
+                  f"{res['ratio']:6.2f}x {flag}")
+
+        regressions = [res for res in report if res["regression"]]
+        print(f"{len(regressions)} regression(s) in {len(report)} compared cases")
+        sys.exit(1 if regressions != [] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Synthetic tables with the schema of the demo data (`m_sales.csv`) at any number of rows.
+
+    from benchmarks.synthetic import sales_table
+    df = sales_table(1_000_000)
+
+Like the demo data, Quantity, Tax, Date and Time are read as text: Quantity and Tax hold a few whitespace only values
+so that the cleaning steps have something to drop. `typed_sales_table()` returns the table after the cleaning a user
+would apply (Quantity integer, Tax float, Date datetime), which every summary branch can use.
+"""
+from numpy import round as np_round, where
+from numpy.random import default_rng
+from pandas import DataFrame, date_range, Series
+
+
+branches = {"A": "Yangon", "B": "Mandalay", "C": "Naypyitaw"}
+product_lines = ["Health and beauty", "Electronic accessories", "Home and lifestyle", "Sports and travel",
+                 "Food and beverages", "Fashion accessories"]
+payments = ["Ewallet", "Cash", "Credit card"]
+
+tax_rate = 0.05
+
+
+def sales_table(n_rows, seed = 0, empty_rate = 0.001):
+    """
+    parameter
+    ---------
+    n_rows     [integer] The number of rows.
+    seed       [integer] The seed of the random generator, the same seed gives the same table.
+    empty_rate [float] The share of Quantity and Tax values replaced by ' '.
+
+    return
+    ------
+    A pandas dataframe with the columns and data types of `m_sales.csv`.
+    """
+    rng = default_rng(seed)
+
+    branch = rng.choice(list(branches.keys()), size = n_rows)
+    unit_price = np_round(rng.uniform(10, 100, size = n_rows), 2)
+    quantity = rng.integers(1, 11, size = n_rows)
+    tax = unit_price * quantity * tax_rate
+    cogs = unit_price * quantity
+
+    # A pool of formatted dates and times, sampling from it avoids formatting millions of values.
+    dates = [f"{day.month}/{day.day}/{day.year}" for day in date_range("2019-01-01", "2019-03-30", freq = "D")]
+    times = [f"{hour}:{minute:02d}" for hour in range(10, 21) for minute in range(60)]
+
+    empty = rng.random(size = n_rows) < empty_rate
+
+    return DataFrame({
+        "Branch": branch,
+        "City": Series(branch).map(branches).to_numpy(),
+        "Customer type": rng.choice(["Member", "Normal"], size = n_rows),
+        "Gender": rng.choice(["Female", "Male"], size = n_rows),
+        "Product line": rng.choice(product_lines, size = n_rows),
+        "Unit price": unit_price,
+        "Quantity": where(empty, " ", quantity.astype(str)).astype(object),
+        "Tax": where(empty, " ", tax.round(4).astype(str)).astype(object),
+        "Total": (cogs + tax).round(4),
+        "Date": rng.choice(dates, size = n_rows),
+        "Time": rng.choice(times, size = n_rows),
+        "Payment": rng.choice(payments, size = n_rows),
+        "cogs": cogs.round(2),
+        "gross margin percentage": 100 * tax_rate / (1 + tax_rate),
+        "gross income": tax.round(4),
+        "Rating": np_round(rng.uniform(4, 10, size = n_rows), 1),
+    })
+
+
+def typed_sales_table(n_rows, seed = 0):
+    """
+    return
+    ------
+    `sales_table()` with the empty values dropped, Quantity as int64, Tax as float64 and Date as datetime64[ns].
+    """
+    df = sales_table(n_rows, seed = seed)
+    df = df.loc[(df["Quantity"] != " ") & (df["Tax"] != " ")].reset_index(drop = True)
+
+    return df.assign(Quantity = df["Quantity"].astype("int64"),
+                     Tax = df["Tax"].astype("float64"),
+                     Date = df["Date"].astype("datetime64[ns]"))
@@ -2,13 +2,21 @@ import dash
 from dash import dcc, html, dash_table
 import dash_bootstrap_components as dbc
 from dash.dash_table.Format import Format, Scheme, Group
+from pandas import Series, CategoricalDtype
 from pandas.api.types import is_numeric_dtype
 from string import punctuation
+from math import ceil
+from functools import lru_cache
+from numpy import arange, flatnonzero
 
 
 datetime_type = ["second", "minute", "hour", "day", "month", "month_name", "quarter", "year", "day_of_year", "week_of_year"]
 outlier_values = ["weak_lower", "weak_upper", "weak_both", "strong_lower", "strong_upper", "strong_both"]
 
+# The operators of a DataTable `filter_query`, the longer symbols are checked before the ones they contain.
+filter_operators = [["ge ", ">="], ["le ", "<="], ["lt ", "<"], ["gt ", ">"], ["ne ", "!="], ["eq ", "="],
+                    ["contains "], ["datestartswith "]]
+
 
 def have_empty_values_markdown(value):  # change conversion to conce
     """
@@ -30,21 +38,157 @@ def have_empty_values_markdown(value):  # change conversion to conce
                """
 
 
-def clean_column_names(df):
-    clean_names = []
+punctuation_to_space = str.maketrans(punctuation, " " * len(punctuation))
+
+# Every table uses the same number format, it is converted to its JSON form once.
+number_format = Format(nully = "N/A", precision = 2, scheme = Scheme.fixed, group = Group.yes, groups = 3).to_plotly_json()
+
+
+@lru_cache(maxsize = 4096)
+def clean_column_name(col):
+    return str(col).translate(punctuation_to_space).title()
 
-    for col in df.columns.to_list():
-        for letter in col:
-            if letter in punctuation:
-                col = col.replace(letter, " ")
-        clean_names.append(col.title())
 
-    df.columns = clean_names
+def clean_column_names(df):
+    df.columns = [clean_column_name(col) for col in df.columns.to_list()]
     return df
 
 
-def create_dataframe(df, page_size = 10, align_text = "left", increase_col_width = None, tbl_height = None):
-    d_tbl = clean_column_names(df)
+def table_schema(df):
+    """
+    :return: the (name, dtype) pairs of a dataframe, the key of its cached column specs.
+    """
+    return tuple(zip(df.columns.to_list(), df.dtypes.to_list()))
+
+
+@lru_cache(maxsize = 64)
+def column_specs(schema):
+    """
+    :param schema: the output of `table_schema()`.
+    :return: the DataTable column definitions of the schema, built once and shared, they must not be modified.
+    """
+    return tuple(
+        {"name": clean_column_name(col), "id": clean_column_name(col), "format": number_format,
+         "type": "numeric" if is_numeric_dtype(dtype) else None} for col, dtype in schema
+    )
+
+
+def encode_records(df, ids):
+    """
+    :param df: the rows to send, usually a single page.
+    :param ids: the column ids of the table, in the order of `df` columns.
+    :return: the rows as a list of records, the same as `df.to_dict("records")` with the column ids as keys.
+    """
+    # A single conversion to python objects instead of one per column (or per cell).
+    return [dict(zip(ids, row)) for row in df.to_numpy(dtype = object).tolist()]
+
+
+def preview_note(text):
+    return html.P(text, className = "card-text")
+
+
+def split_filter_part(filter_part):
+    """
+    :param filter_part: one condition of a DataTable `filter_query` such as '{Unit Price} ge 10'.
+    :return: the column id, the operator and the value, or None for each when the condition is not understood.
+    """
+    for operator_type in filter_operators:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find("{") + 1: name_part.rfind("}")]
+
+                value_part = value_part.strip()
+                if value_part == "":
+                    return None, None, None
+
+                quote = value_part[0]
+                if quote == value_part[-1] and quote in ("'", '"', "`"):
+                    value = value_part[1: -1].replace("\\" + quote, quote)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                return name, operator_type[0].strip(), value
+
+    return None, None, None
+
+
+def filter_rows(df, filter_query, column_ids = None):
+    """
+    :param df: a dataframe.
+    :param filter_query: the `filter_query` of a DataTable, conditions joined by ' && '.
+    :param column_ids: a dictionary of the column ids shown by the table and the matching `df` columns (Optional).
+    :return: a boolean series of the rows matching every condition.
+    """
+    column_ids = {col: col for col in df.columns.to_list()} if column_ids is None else column_ids
+    keep = Series(True, index = df.index)
+
+    for filter_part in filter_query.split(" && "):
+        col_name, operator, value = split_filter_part(filter_part)
+
+        if col_name not in column_ids:
+            continue
+
+        column = df[column_ids[col_name]]
+        try:
+            # Missing values match no text, whether they read "None" (object) or "nan" (category) as text.
+            if operator == "contains":
+                keep &= column.astype(str).str.contains(str(value), case = False, regex = False) & column.notna()
+            elif operator == "datestartswith":
+                keep &= column.astype(str).str.startswith(str(value)) & column.notna()
+            elif operator in ("eq", "ne") and not is_numeric_dtype(column):
+                text = str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+                match = column.astype(str) == text
+                keep &= match if operator == "eq" else ~match
+            else:
+                if isinstance(column.dtype, CategoricalDtype):
+                    column = column.astype(object)       # unordered categories only compare for equality.
+                keep &= getattr(column, operator)(value).fillna(False)
+        except TypeError:
+            keep &= False                                # e.g. a number compared with text.
+
+    return keep
+
+
+def table_page(df, page_current = 0, page_size = 10, sort_by = None, filter_query = None):
+    """
+    :param df: the full table.
+    :param page_current: the index of the page shown by the table.
+    :param page_size: the number of rows in a page.
+    :param sort_by: the `sort_by` of a DataTable, a list of {"column_id", "direction"}.
+    :param filter_query: the `filter_query` of a DataTable.
+    :return: the records of the requested page and the number of pages.
+    """
+    ids = [spec["id"] for spec in column_specs(table_schema(df))]
+    column_ids = dict(zip(ids, df.columns.to_list()))
+
+    # Only row positions are filtered and sorted, the frame itself is never copied.
+    rows = arange(df.shape[0]) if not filter_query else flatnonzero(filter_rows(df, filter_query, column_ids).to_numpy())
+
+    sort_by = [col for col in (sort_by or []) if col["column_id"] in column_ids]
+    if sort_by != []:
+        keys = df[[column_ids[col["column_id"]] for col in sort_by]].iloc[rows].reset_index(drop = True)
+        order = keys.sort_values(keys.columns.to_list(), ascending = [col["direction"] == "asc" for col in sort_by],
+                                 na_position = "last", kind = "mergesort").index.to_numpy()
+        rows = rows[order]
+
+    page_current = page_current or 0
+    page = df.iloc[rows[page_current * page_size: (page_current + 1) * page_size]]
+
+    return encode_records(page, ids), max(ceil(len(rows) / page_size), 1)
+
+
+def create_dataframe(df, page_size = 10, align_text = "left", increase_col_width = None, tbl_height = None,
+                     table_id = None):
+    """
+    :param table_id: the id of the table (Optional). A table with an id is paged, sorted and filtered on the server:
+                     it only receives the rows of its current page, a callback on its `page_current`, `sort_by` and
+                     `filter_query` sends the others (see `table_page()`).
+    """
+    columns = column_specs(table_schema(df))
 
     if increase_col_width is not None:
         cell_conditional = [{"if": {"column_id": increase_col_width[0]}, "width": increase_col_width[1]}]
@@ -56,19 +200,20 @@ def create_dataframe(df, page_size = 10, align_text = "left", increase_col_width
         table_style["height"] = tbl_height
 
 
+    if table_id is not None:
+        data, page_count = table_page(df, page_current = 0, page_size = page_size)
+        server_side = {"id": table_id, "page_action": "custom", "page_current": 0, "page_count": page_count,
+                       "sort_action": "custom", "sort_mode": "multi", "sort_by": [],
+                       "filter_action": "custom", "filter_query": ""}
+    else:
+        data, server_side = encode_records(df, [spec["id"] for spec in columns]), {}
+
+
     return html.Div(
         [
             dash_table.DataTable(
-                data = d_tbl.to_dict("records"),
-                columns = [
-                    {"name": col, "id": col,
-                     "format": Format(nully = "N/A",
-                                      precision = 2,
-                                      scheme = Scheme.fixed,
-                                      group  = Group.yes,
-                                      groups = 3,
-                                      ), "type": "numeric" if is_numeric_dtype(d_tbl[col]) else None} for col in d_tbl.columns
-                ],
+                data = data,
+                columns = list(columns),
                 #{"specifier": ".2f"},
                 page_size = page_size,
                 style_table = table_style,
@@ -80,11 +225,62 @@ def create_dataframe(df, page_size = 10, align_text = "left", increase_col_width
                     {"if": {"row_index": "odd"}, "backgroundColor": "#F8F9FA", "color": "#000000"},
                         ],
                 style_cell_conditional = cell_conditional,
+                **server_side,
             )
         ]
     )
 
 
+def job_progress(status):
+    """
+    :param status: a job status returned by `JobManager.status()`.
+    :return: a progress bar with the current step and the number of rows processed.
+    """
+    if status is None:
+        return []
+
+    step = status["step"] or 0
+    total = status["total"] or 1
+    label = f"Step {step} of {status['total']}" if status["total"] else ""
+    rows = f" | {status['rows']:,} rows processed" if status["rows"] is not None else ""
+
+    return html.Div(
+        [
+            dbc.Progress(value = round(100 * step / total), label = label, striped = True, animated = True),
+            html.Small(f"{status['message']}{rows}", className = "card-text"),
+        ]
+    )
+
+
+def sample_note(sample_info):
+    """
+    :param sample_info: the output of `custom_functions.sample_error()`.
+    :return: a note with the sample size and the margins of error of an approximate summary.
+    """
+    means = "".join(f", mean of {var} ±{margin:,.4g}" for var, margin in sample_info["mean_margins"].items())
+
+    return html.Small(
+        f"Approximate: computed from a random sample of {sample_info['rows']:,} of {sample_info['total_rows']:,} rows. "
+        f"Margins of error (95%): shares ±{100 * sample_info['share_margin']:.2f} points{means}. "
+        f"Counts and sums are those of the sample.",
+        className = "card-text"
+    )
+
+
+def strategy_note(plan):
+    """
+    :param plan: the output of `planner.plan_summary()`.
+    :return: a note with the strategy used to compute a summary and why.
+    """
+    text = f"Strategy: {plan['strategy']} ({plan['reason']}"
+    if "exact_seconds" in plan:
+        text += f", about {plan['exact_seconds']:.1f}s exactly for a budget of {plan['latency_budget']:.1f}s"
+    if plan["strategy"] == "binned":
+        text += f", numeric variables binned to {plan['bins']} values"
+
+    return html.Small(text + ").", className = "card-text d-block")
+
+
 def create_graph(graph_object):
     return html.Div(
         [
@@ -0,0 +1,260 @@
+"""
+Correlation matrices computed once per table version.
+
+`pearson_matrix()` computes pairwise complete Pearson correlations (the same rows pandas `DataFrame.corr()` uses for
+each pair of variables) with a few matrix multiplications over a NaN mask, instead of a loop over pairs.
+`CorrelationCache` keeps the numeric values, their rank transform and the full matrices of recent table versions,
+so selecting a subset of variables only slices a cached matrix.
+
+For very wide tables `top_correlations()` streams blocks of columns through the same kernel and only keeps the
+strongest pairs, so memory depends on the block size and the number of pairs kept, not on the number of columns.
+"""
+from collections import OrderedDict
+from threading import Lock
+import heapq
+import warnings
+
+from numpy import isnan, where, sqrt, errstate, clip, nan, nanmean, float64, fill_diagonal, diag, abs as np_abs, \
+    triu, ones, flatnonzero, argpartition, maximum
+from pandas import DataFrame
+
+
+methods = ["pearson", "spearman"]
+
+# Above this number of variables the full matrix is not computed, only the strongest pairs are searched for.
+max_matrix_columns = 200
+
+
+def numeric_values(df):
+    """
+    return
+    ------
+    The values of a numeric dataframe as a float64 array, missing values are NaN.
+    """
+    return df.to_numpy(dtype = float64, na_value = nan)
+
+
+def rank_values(values):
+    """
+    return
+    ------
+    The average rank of each value within its column, missing values stay NaN. Pearson correlations of the ranks
+    are Spearman correlations.
+    """
+    return DataFrame(values).rank(method = "average").to_numpy(dtype = float64)
+
+
+def centered_block(values):
+    """
+    return
+    ------
+    The values shifted by their column mean with missing values set to 0, and the float mask of present values.
+    Shifting does not change a correlation but keeps the sums of `cross_pearson()` well conditioned.
+    """
+    present = ~isnan(values)
+
+    with warnings.catch_warnings(), errstate(invalid = "ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)     # columns with only missing values.
+        centered = where(present, values - nanmean(values, axis = 0), 0.0)
+
+    return centered, present.astype(float64)
+
+
+def cross_pearson(block_a, block_b, min_periods = 2):
+    """
+    parameter
+    ---------
+    block_a, block_b [tuple] The output of `centered_block()` for two sets of columns of the same rows.
+    min_periods [integer] The minimum number of rows both variables must have for a correlation.
+
+    return
+    ------
+    The pairwise complete Pearson correlations between the columns of `block_a` (rows) and `block_b` (columns),
+    and the number of rows used for each pair.
+    """
+    x, mask_x = block_a
+    y, mask_y = block_b
+
+    n = mask_x.T @ mask_y                               # rows where both variables are present.
+    sum_x = x.T @ mask_y                                # sum of x over the rows where x and y are present.
+    sum_y = mask_x.T @ y
+    sum_xx = (x * x).T @ mask_y
+    sum_yy = mask_x.T @ (y * y)
+    sum_xy = x.T @ y
+
+    with errstate(invalid = "ignore", divide = "ignore"):
+        cov = n * sum_xy - sum_x * sum_y
+        var = (n * sum_xx - sum_x ** 2) * (n * sum_yy - sum_y ** 2)
+        corr = cov / sqrt(var)
+
+    return where((n >= min_periods) & (var > 0), clip(corr, -1, 1), nan), n
+
+
+def pearson_matrix(values, min_periods = 2):
+    """
+    parameter
+    ---------
+    values      [np.ndarray] A 2 dimensional float array, one column per variable, missing values are NaN.
+    min_periods [integer] The minimum number of rows both variables must have for a correlation.
+
+    return
+    ------
+    The pairwise complete Pearson correlation matrix as an array.
+    """
+    block = centered_block(values)
+    corr, _ = cross_pearson(block, block, min_periods)
+
+    fill_diagonal(corr, where(isnan(diag(corr)), nan, 1.0))
+
+    return corr
+
+
+def correlation_frame(values, names):
+    return DataFrame(pearson_matrix(values), index = names, columns = names)
+
+
+def column_values(df, columns, method = "pearson"):
+    values = numeric_values(df[columns])
+    return rank_values(values) if method == "spearman" else values
+
+
+def top_correlations(df, columns = None, method = "pearson", k = 50, threshold = None, block_size = 256,
+                     progress = None):
+    """
+    parameter
+    ---------
+    df         [pd.DataFrame]
+    columns    [list] The numeric variables to search, all columns of `df` when None.
+    method     [string] Either "pearson" or "spearman".
+    k          [integer] The number of pairs to keep.
+    threshold  [float (Optional)] Only keep pairs with an absolute correlation of at least this value.
+    block_size [integer] The number of columns multiplied at once. Memory used is about
+               rows x 2 x block_size values plus block_size x block_size correlations.
+    progress   [function (Optional)] Called as `progress(step, n_steps, rows = ..., message = ...)` after each block
+               of rows of the matrix.
+
+    return
+    ------
+    A pandas dataframe of the strongest pairs ranked by absolute correlation, and the correlation matrix of only the
+    variables involved in those pairs.
+    """
+    columns = df.columns.to_list() if columns is None else columns
+    floor = 0.0 if threshold is None else threshold
+    heap = []
+    n_blocks = -(-len(columns) // block_size)
+
+    for a_start in range(0, len(columns), block_size):
+        block_a = centered_block(column_values(df, columns[a_start:a_start + block_size], method))
+
+        for b_start in range(a_start, len(columns), block_size):
+            if b_start == a_start:
+                block_b = block_a
+            else:
+                block_b = centered_block(column_values(df, columns[b_start:b_start + block_size], method))
+
+            corr, n = cross_pearson(block_a, block_b)
+            strength = where(isnan(corr), -1.0, np_abs(corr))
+
+            if b_start == a_start:                       # each pair once, without the diagonal.
+                strength = where(triu(ones(strength.shape, dtype = bool), k = 1), strength, -1.0)
+
+            limit = maximum(floor, heap[0][0]) if len(heap) == k else floor
+            candidates = flatnonzero(strength >= limit)
+
+            if len(candidates) > k:
+                candidates = candidates[argpartition(-strength.flat[candidates], k - 1)[:k]]
+
+            for cand in candidates:
+                i, j = divmod(int(cand), strength.shape[1])
+                item = (float(strength[i, j]), a_start + i, b_start + j, float(corr[i, j]), int(n[i, j]))
+
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heappushpop(heap, item)
+
+        if progress is not None:
+            progress(a_start // block_size + 1, n_blocks, rows = df.shape[0],
+                     message = f"Searched {min(a_start + block_size, len(columns))} of {len(columns)} variables")
+
+    pairs = DataFrame([{"Variable 1": columns[i], "Variable 2": columns[j], "Correlation": corr_val, "Rows": rows}
+                       for _, i, j, corr_val, rows in sorted(heap, reverse = True)],
+                      columns = ["Variable 1", "Variable 2", "Correlation", "Rows"])
+
+    involved = list(OrderedDict.fromkeys(pairs["Variable 1"].to_list() + pairs["Variable 2"].to_list()))
+    corr_mtx = correlation_frame(column_values(df, involved, method), involved)
+
+    return pairs, corr_mtx
+
+
+class CorrelationCache:
+    def __init__(self, max_versions = 4):
+        """
+        parameter
+        ---------
+        max_versions [integer] The number of table versions to keep values and matrices for.
+        """
+        self.max_versions = max_versions
+
+        self._values = OrderedDict()
+        self._matrices = OrderedDict()
+        self._lock = Lock()
+
+    def values(self, version, df, method = "pearson"):
+        """
+        parameter
+        ---------
+        version [string] The id of the table version `df` belongs to.
+        df      [pd.DataFrame] The numeric variables of the table.
+        method  [string] Either "pearson" for the values or "spearman" for their rank transform.
+
+        return
+        ------
+        The variable names and a float array of values, cached per version and method.
+        """
+        key = (version, method)
+
+        with self._lock:
+            if key in self._values:
+                self._values.move_to_end(key)
+                return self._values[key]
+
+        if method == "spearman":
+            names, values = self.values(version, df, "pearson")
+            values = rank_values(values)
+        else:
+            names, values = df.columns.to_list(), numeric_values(df)
+
+        with self._lock:
+            self._values[key] = (names, values)
+            self._trim(self._values)
+
+        return names, values
+
+    def matrix(self, version, method = "pearson", *search):
+        """
+        parameter
+        ---------
+        search The variables, k and threshold of a `top_correlations()` search, nothing for the full matrix.
+
+        return
+        ------
+        The cached correlation matrix (or search result) of a version, or None.
+        """
+        with self._lock:
+            key = (version, method) + search
+            if key in self._matrices:
+                self._matrices.move_to_end(key)
+                return self._matrices[key]
+
+    def store_matrix(self, version, method, corr_mtx, *search):
+        with self._lock:
+            self._matrices[(version, method) + search] = corr_mtx
+            self._trim(self._matrices)
+
+    def _trim(self, cache):
+        versions = list(OrderedDict.fromkeys(key[0] for key in cache.keys()))
+
+        for version in versions[:-self.max_versions]:
+            for key in [key for key in cache.keys() if key[0] == version]:
+                del cache[key]
@@ -1,13 +1,16 @@
-from pandas import DataFrame, Series, DatetimeIndex, concat
-from plotly.express import histogram, box, violin, bar, line, scatter, scatter_3d, pie
-from plotly.graph_objects import Heatmap, Layout, Figure
-from plotly.figure_factory import create_annotated_heatmap
+from pandas import DataFrame, Series, DatetimeIndex, concat, to_numeric
+from pandas.api.types import is_numeric_dtype, is_bool_dtype, CategoricalDtype
 from string import punctuation, ascii_letters
-from numpy import nan, array, where, append, around
+from numpy import nan, array, where, append, around, frompyfunc
 from dash import html
-from collections import Counter
+from collections import Counter, OrderedDict
+from threading import Lock
 import warnings
 
+import correlation
+
+# plotly is the slowest import of the app, the plotting functions import it on first use so the workers start without it.
+
 
 
 
@@ -71,6 +74,109 @@ def match_arg(x, valid_arg):
         
         
 # Data cleaning --------------------------------------------------------------------------------------------------------
+def compact_column(values, max_unique_ratio = 0.5):
+    """
+    parameter
+    ---------
+    values           [pd.Series]
+    max_unique_ratio [float] Character variables with fewer unique values than this share of the rows are converted
+                     to category.
+
+    return
+    ------
+    The variable with a compact data type, or `values` itself when there is none. Integers are downcast to the
+    smallest integer type. Floats are kept in float64: the sums and means of the summaries would otherwise be computed
+    in float32 and differ from those of the uploaded table.
+    """
+    if values.dtype == "object":
+        if values.shape[0] > 0 and values.nunique() < max_unique_ratio * values.shape[0]:
+            return values.astype("category")
+
+    elif is_numeric_dtype(values) and not is_bool_dtype(values):
+        if values.dtype.kind in "iu":
+            return to_numeric(values, downcast = "integer" if values.dtype.kind == "i" else "unsigned")
+
+    return values
+
+
+def optimize_dtypes(df, max_unique_ratio = 0.5):
+    """
+    parameter
+    ---------
+    df               [pd.DataFrame] A table as it was read from the uploaded file.
+    max_unique_ratio [float] Passed to `compact_column()`.
+
+    return
+    ------
+    The table with compact data types and a dictionary with the memory used before (`bytes_before`) and after
+    (`bytes_after`) and the variables changed (`columns`, {variable: [old data type, new data type]}).
+    """
+    f_tbl = df.copy(deep = False)
+    changed = {}
+
+    for var in f_tbl.columns.to_list():
+        values = f_tbl[var]
+        f_tbl[var] = compact_column(values, max_unique_ratio = max_unique_ratio)
+
+        if f_tbl[var].dtype != values.dtype:
+            changed[var] = [values.dtype.name, f_tbl[var].dtype.name]
+
+    return f_tbl, {"bytes_before": int(df.memory_usage(index = True, deep = True).sum()),
+                   "bytes_after": int(f_tbl.memory_usage(index = True, deep = True).sum()),
+                   "columns": changed}
+
+
+def column_memory(values):
+    """
+    parameter
+    ---------
+    values [pd.Series]
+
+    return
+    ------
+    A dictionary with the data type and deep memory usage of the variable (`dtype`, `bytes`) and the same for its
+    `compact_column()` (`compact_dtype`, `compact_bytes`).
+    """
+    compact = compact_column(values)
+
+    return {"dtype": values.dtype.name, "bytes": int(values.memory_usage(index = False, deep = True)),
+            "compact_dtype": compact.dtype.name, "compact_bytes": int(compact.memory_usage(index = False, deep = True))}
+
+
+def format_bytes(n_bytes):
+    for unit in ["B", "KB", "MB"]:
+        if abs(n_bytes) < 1000:
+            return f"{n_bytes:,.0f} {unit}" if unit == "B" else f"{n_bytes:,.1f} {unit}"
+        n_bytes /= 1000
+
+    return f"{n_bytes:,.2f} GB"
+
+
+def memory_usage_table(memory_stats):
+    """
+    parameter
+    ---------
+    memory_stats [dictionary] {variable: the output of `column_memory()`}, e.g. from `DatasetStore.column_stats()`.
+
+    return
+    ------
+    A pandas dataframe with the memory used by each variable, the largest first, and what a compact data type would use.
+    """
+    f_tbl = DataFrame({"Variable": list(memory_stats.keys()),
+                       "Data Type": [stats["dtype"] for stats in memory_stats.values()],
+                       "bytes": [stats["bytes"] for stats in memory_stats.values()],
+                       "Compact Data Type": [stats["compact_dtype"] for stats in memory_stats.values()],
+                       "compact_bytes": [stats["compact_bytes"] for stats in memory_stats.values()]})
+
+    f_tbl = f_tbl.sort_values(by = "bytes", ascending = False)
+    f_tbl["Share"] = (f_tbl["bytes"] / max(f_tbl["bytes"].sum(), 1) * 100).round(1).astype(str) + "%"
+    f_tbl["Memory"] = f_tbl["bytes"].map(format_bytes)
+    f_tbl["Compact Memory"] = f_tbl["compact_bytes"].map(format_bytes)
+    f_tbl["Savings"] = (f_tbl["bytes"] - f_tbl["compact_bytes"]).map(format_bytes)
+
+    return f_tbl[["Variable", "Data Type", "Memory", "Share", "Compact Data Type", "Compact Memory", "Savings"]]
+
+
 def to_bool(df, variable):
     """
     parameter
@@ -85,17 +191,17 @@ def to_bool(df, variable):
     valid_bool = ["t", "true", "f", "false"]
     replace_bool = {"t": True,  "true": True, "f": False, "false": False}
     
-    if df[variable].dtype in ["int64", "float64"] and df[variable].nunique() != 2:
+    if is_numeric_dtype(df[variable]) and df[variable].nunique() != 2:
         warnings.warn(f"can not convert {list(sorted(df[variable].unique()))[0:5]} to boolean")
         return df[variable]
 
-    elif df[variable].dtype not in ["int64", "float64"]:
+    elif not is_numeric_dtype(df[variable]):
         if all(x not in valid_bool for x in list(df[variable].str.lower().unique())):
             warnings.warn(f"can not convert {list(sorted(df[variable].unique()))[0:5]} to boolean")
             return df[variable]
     
     else:
-        if df[variable].dtype in ["int64", "float64"]:
+        if is_numeric_dtype(df[variable]):
             return df[variable].astype("bool")
         else:
             return df[variable].str.lower().map(replace_bool)
@@ -131,34 +237,115 @@ def to_number(df, variable, num_type):
         return df[variable].astype(num_type) if num_type == "float" else df[variable].astype("float64").astype("int64")
 
 
-def get_empty_object(df, variables):
+def _is_blank(value):
+    return isinstance(value, str) and value.isspace()
+
+is_blank = frompyfunc(_is_blank, 1, 1)
+
+
+def empty_value_profile(df):
+    """
+    parameter
+    ---------
+    df [pd.DataFrame]
+
+    return
+    ------
+    A dictionary with `cells` a boolean dataframe marking whitespace-only values (such as ' ') in every character
+    variable, `counts` the number of such values in each variable and `rows` a row mask which is True when any
+    character variable in the row is empty.
+    """
+    chr_tbl = df.select_dtypes(include = ["object", "category"])
+
+    cells = DataFrame(is_blank(chr_tbl.to_numpy()).astype(bool), index = chr_tbl.index, columns = chr_tbl.columns)
+
+    return {"cells": cells, "counts": cells.sum(), "rows": cells.any(axis = "columns")}
+
+
+empty_profile_cache = OrderedDict()
+empty_profile_lock = Lock()          # the callbacks of a worker run in several threads.
+
+def cached_empty_value_profile(df, version, max_versions = 4):
+    """
+    parameter
+    ---------
+    df      [pd.DataFrame]
+    version [string] A key identifying the content of `df`, the profile is computed once for each version.
+    max_versions [integer] The number of profiles to keep.
+
+    return
+    ------
+    The output of `empty_value_profile()`.
+    """
+    with empty_profile_lock:
+        if version in empty_profile_cache:
+            empty_profile_cache.move_to_end(version)
+            return empty_profile_cache[version]
+
+    profile = empty_value_profile(df)                  # computed outside the lock, other versions don't wait.
+
+    with empty_profile_lock:
+        empty_profile_cache[version] = profile
+
+        while len(empty_profile_cache) > max_versions:
+            empty_profile_cache.popitem(last = False)
+
+    return profile
+
+
+def empty_cells(df, variables, profile = None):
+    """
+    parameter
+    ---------
+    df        [pd.DataFrame]
+    variables [string] A variable or list of variables from the data.
+    profile   [dictionary (Optional)] The output of `empty_value_profile()` for the data `df` was derived from.
+              Rows are matched by index, so the profile is still valid after rows have been dropped.
+
+    return
+    ------
+    A boolean dataframe marking whitespace-only values in the character variable(s).
+    """
+    variables = variables if isinstance(variables, list) else [variables]
+    variables = [var for var in variables if df[var].dtype == "object" or isinstance(df[var].dtype, CategoricalDtype)]
+
+    if profile is not None and df.index.is_unique:
+        known = [var for var in variables if var in profile["cells"].columns]
+    else:
+        known = []
+
+    cells = profile["cells"][known].reindex(df.index, fill_value = False) if known != [] else None
+
+    rest = [var for var in variables if var not in known]
+    if rest != []:
+        rest_cells = empty_value_profile(df[rest])["cells"]
+        cells = rest_cells if cells is None else concat([cells, rest_cells], axis = "columns")
+
+    if cells is None:
+        return DataFrame(index = df.index)
+
+    return cells[variables]
+
+
+def get_empty_object(df, variables, profile = None):
     """
     :param df: dataframe
     :param variables: variable from the dataframe
+    :param profile: the output of `empty_value_profile()` (Optional)
     :return: a dictionary with a boolean type if variable(s) have missing values and the variable(s) name(s)
     """
-    if isinstance(variables, list):
-        f_df = df[variables]
-
-        mis_list = []
-        for var in f_df.columns:
-            bool_vals = f_df[var] == ' '
-            mis_list.append(bool_vals.sum())
+    counts = empty_cells(df, variables, profile).sum()
+    mis_vars = counts[counts > 0].index.to_list()
 
-        if any([var > 0 for var in mis_list]):
-            mis_vars = [ind for ind, val in enumerate(mis_list) if val]
-            mis_vars = f_df.iloc[:, mis_vars].columns.to_list()
-            return {"bool": True, "variables": mis_vars}
-        else:
-            return {"bool": False}
+    if mis_vars == []:
+        return {"bool": False}
+    elif isinstance(variables, list):
+        return {"bool": True, "variables": mis_vars}
     else:
-        bool_vals = df[variables] == ' '
-        if bool_vals.sum() > 0:
-            return {"bool": True, "variables": variables}
-        else:
-            return {"bool": False}
+        return {"bool": True, "variables": variables}
 
-def remove_missing_values_gb(df, variables):
+
+def remove_missing_values_gb(df, variables, profile = None):
     f_tbl = df.copy()
 
     if isinstance(variables, list):
@@ -173,11 +360,7 @@ def remove_missing_values_gb(df, variables):
                 f_tbl = f_tbl.dropna(axis="index", how="any", subset=valid_variables)
 
             if f_tbl.shape[0] != 0:
-                empty_vals = get_empty_object(f_tbl, valid_variables)
-
-                if empty_vals["bool"]:
-                    for var in empty_vals["variables"]:
-                        f_tbl = f_tbl[f_tbl[var] != ' ']
+                f_tbl = f_tbl.loc[~empty_cells(f_tbl, valid_variables, profile).any(axis = "columns")]
 
             if f_tbl.shape[0] == 0:
                 raise IndexError("The output returned an empty table after removing `Nan` values.")
@@ -193,10 +376,7 @@ def remove_missing_values_gb(df, variables):
                 f_tbl = f_tbl.loc[f_tbl[variables].notna()]
 
             if f_tbl.shape[0] != 0:
-                empty_val = get_empty_object(f_tbl, variables)
-
-                if empty_val["bool"]:
-                    f_tbl = f_tbl.loc[f_tbl[variables] != ' ']
+                f_tbl = f_tbl.loc[~empty_cells(f_tbl, variables, profile).any(axis = "columns")]
 
             if f_tbl.shape[0] == 0:
                 raise IndexError("The output returned an empty table after removing `Nan` values.")
@@ -206,7 +386,7 @@ def remove_missing_values_gb(df, variables):
             return None
 
 
-def change_dtype(df, variables, to_type):
+def change_dtype(df, variables, to_type, profile = None):
     """
     parameter
     ---------
@@ -214,6 +394,7 @@ def change_dtype(df, variables, to_type):
     variables [string] A variable or list of variables to change the data type.
     to_type   [string] The type of data type to change to. can be any of "character", "integer", 
                      "float", "date", "boolean"
+    profile   [dictionary (Optional)] The output of `empty_value_profile()`, passed to `remove_missing_values_gb()`.
     return
     ------
     A pandas dataframe.
@@ -224,9 +405,14 @@ def change_dtype(df, variables, to_type):
 
     f_tbl = df.copy()
 
-    f_tbl = remove_missing_values_gb(df=f_tbl, variables=variables)
+    f_tbl = remove_missing_values_gb(df=f_tbl, variables=variables, profile=profile)
 
     if f_tbl is not None:
+        # Categories are converted through their values, not their codes.
+        for var in (variables if isinstance(variables, list) else [variables]):
+            if isinstance(f_tbl[var].dtype, CategoricalDtype):
+                f_tbl[var] = f_tbl[var].astype("object")
+
         if isinstance(variables, list):
             for var in variables:
                 if to_type == "boolean":
@@ -297,15 +483,16 @@ def is_missing_values(df, variables, missing_what):
                 return {"bool": False}
 
 
-def check_for(what, df, variables):
+def check_for(what, df, variables, profile = None):
     """
     :param what: the condition to check. any of empty_values, missing_all_values, missing_some_values
     :param df: dataframe.
     :param variables: variable(s) from the dataframe.
+    :param profile: the output of `empty_value_profile()`, only used when checking for empty_values.
     :return: a dictionary with a boolean type if variable(s) have missing values and the variable(s) name(s).
     """
     if what == "empty_values":
-        return get_empty_object(df, variables)
+        return get_empty_object(df, variables, profile)
     elif what == "missing_all_values":
         return is_missing_values(df, variables, "all")
     elif  what == "missing_some_values":
@@ -541,6 +728,144 @@ def clean_data(df, variables = None, to_type = None, how = None, percentage = No
         
 
 
+def cleaning_plan(drop_missing = None, percentage = None, change_chr = None, change_int = None, change_float = None,
+                  change_bool = None, change_date = None, date_var = None, which = None):
+    """
+    parameter
+    ---------
+    drop_missing [string] How to drop missing values. passed to `drop_missing_values()`.
+    percentage   [integer] Passed to `drop_missing_values()` when drop_missing is "percent_missing".
+    change_chr, change_int, change_float, change_bool, change_date [list] Variables to convert to a character,
+                 integer, float, boolean or datetime data type.
+    date_var     [string] A variable with datetime64[ns] data type to extract further date values from.
+    which        [string] The kind of date to extract from `date_var`.
+
+    return
+    ------
+    A dictionary with the cleaning steps to apply, in the order they will be applied.
+    """
+    if drop_missing == "percent_missing" and percentage is None:
+        drop_missing = None
+
+    change_vars = {"character": change_chr, "integer": change_int, "float": change_float, "boolean": change_bool,
+                   "date": change_date}
+
+    return {
+        "drop_missing": drop_missing,
+        "percentage": percentage if drop_missing == "percent_missing" else None,
+        "change_dtype": [[to_type, variables] for to_type, variables in change_vars.items() if variables],
+        "date_var": date_var if which else None,
+        "which": which if date_var is not None else None
+    }
+
+
+def describe_cleaning_plan(plan):
+    """
+    return
+    ------
+    A short description of the cleaning steps in a plan returned by `cleaning_plan()`.
+    """
+    drop_labels = {"all_cols": "Dropped columns with missing values", "all_rows": "Dropped rows with missing values",
+                   "cols_all_na": "Dropped columns with only missing values",
+                   "rows_all_na": "Dropped rows when all records are missing",
+                   "percent_missing": f"Dropped columns with less than {plan['percentage']}% non missing values"}
+
+    steps = []
+    if plan["drop_missing"] is not None:
+        steps.append(drop_labels[plan["drop_missing"]])
+
+    for to_type, variables in plan["change_dtype"]:
+        variables = ", ".join(variables) if isinstance(variables, list) else variables
+        steps.append(f"{variables} to {to_type}")
+
+    if plan["date_var"] is not None:
+        which = ", ".join(plan["which"]) if isinstance(plan["which"], list) else plan["which"]
+        steps.append(f"Extracted {which} from {plan['date_var']}")
+
+    return "; ".join(steps) if steps != [] else "No change"
+
+
+def is_empty_plan(plan):
+    return plan["drop_missing"] is None and plan["change_dtype"] == [] and plan["date_var"] is None
+
+
+def apply_cleaning_plan(df, plan, profile = None, progress = None):
+    """
+    parameter
+    ---------
+    df       [pd.DataFrame]
+    plan     [dictionary] The cleaning steps to apply, as returned by `cleaning_plan()`.
+    profile  [dictionary (Optional)] The output of `empty_value_profile()` for `df`, passed to `change_dtype()`.
+    progress [function (Optional)] Called as progress(step, total, rows, message) after each step.
+
+    return
+    ------
+    A pandas dataframe.
+    """
+    n_steps = (plan["drop_missing"] is not None) + len(plan["change_dtype"]) + (plan["date_var"] is not None)
+    step = 0
+
+    def report(message):
+        if progress is not None:
+            progress(step, n_steps, rows = f_tbl.shape[0], message = message)
+
+    f_tbl = df.copy()
+
+    if plan["drop_missing"] is not None:
+        f_tbl = drop_missing_values(df = f_tbl, how = plan["drop_missing"], percentage = plan["percentage"])
+        step += 1
+        report("Dropped missing values")
+
+    for to_type, variables in plan["change_dtype"]:
+        f_tbl = change_dtype(df = f_tbl, variables = variables, to_type = to_type, profile = profile)
+        step += 1
+        report(f"Changed data type to {to_type}")
+
+    if plan["date_var"] is not None:
+        f_tbl = extract_datetime(df = f_tbl, date_col = plan["date_var"], which = plan["which"])
+        step += 1
+        report("Extracted datetime values")
+
+    return f_tbl
+
+
+def sample_rows(df, n_rows = 100, how = "head", by = None, random_state = 0):
+    """
+    parameter
+    ---------
+    df     [pd.DataFrame]
+    n_rows [integer] The number of rows to keep.
+    how    [string] Either "head" for the first rows or "stratified" for a random sample that keeps the share of
+           each unique value of `by`.
+    by     [string (Optional)] A character variable to stratify on. when None the character variable with the
+           fewest unique values is used.
+
+    return
+    ------
+    A pandas dataframe with at most `n_rows` rows.
+    """
+    match_arg(how, ["head", "stratified"])
+
+    if df.shape[0] <= n_rows:
+        return df
+
+    if how == "stratified":
+        if by is None:
+            chr_vars = get_dtype(df = df, dtype = "character", return_names = True)
+            by = df[chr_vars].nunique().idxmin() if chr_vars != [] else None
+
+        if by is not None:
+            frac = n_rows / df.shape[0]
+            f_tbl = df.groupby(by, group_keys = False, dropna = False, observed = True).apply(
+                lambda grp: grp.sample(n = max(1, round(grp.shape[0] * frac)), random_state = random_state)
+            )
+            return f_tbl.sort_index().head(n_rows)
+
+        return df.sample(n = n_rows, random_state = random_state).sort_index()
+
+    return df.head(n_rows)
+
+
 def get_dtype(df, dtype, return_names = False):
     """
     parameter
@@ -556,7 +881,7 @@ def get_dtype(df, dtype, return_names = False):
 
     if return_names:
         if dtype == "numeric":
-            var_names = df.select_dtypes(include = ["int64", "float64", "number"]).columns.to_list()
+            var_names = df.select_dtypes(include = ["number"]).columns.to_list()
         elif dtype == "character":
             var_names = df.select_dtypes(include = ["object", "category"]).columns.to_list()
         elif dtype == "datetime":
@@ -565,7 +890,7 @@ def get_dtype(df, dtype, return_names = False):
 
     else:
         if dtype == "numeric":
-            f_tbl = df.select_dtypes(include = ["int64", "float64", "number"])
+            f_tbl = df.select_dtypes(include = ["number"])
         elif dtype == "character":
             f_tbl = df.select_dtypes(include = ["object", "category"])
         elif dtype == "datetime":
@@ -892,6 +1217,7 @@ def single_num_distribution_out(df, variable, dis_type = "hist", drop_outlier =
         f_tbl = df
 
     if output_type == "plot":
+        from plotly.express import histogram, box, violin
         match_arg(dis_type, ["hist", "box", "vio"])
 
         var_name = str.replace(variable, "_", " ").title()
@@ -967,6 +1293,7 @@ def num_relationship_out(df, variables, drop_outlier = None, p_color = None, plo
         f_tbl = df
 
     if output_type == "plot":
+        from plotly.express import scatter, scatter_3d
         p_color = [plt_color["point"]] if p_color is None else p_color
         p_template = "plotly_white"
         clean_lab = [clean_plot_label(var) for var in variables]
@@ -1073,6 +1400,7 @@ def one_char_out(df, variable, p_type = "bar", p_color = None, num_unique_obs =
     f_tbl = char_count(df = df, variables = variable)
 
     if output_type == "plot":
+        from plotly.express import bar, pie
         match_arg(p_type, ["bar", "pie"])
 
         var_lab = clean_plot_label(label = variable)
@@ -1147,6 +1475,7 @@ def multi_char_out(df, variables, p_color = None, num_unique_obs = 15, output_ty
     f_tbl = char_count(df, variables)
 
     if output_type == "plot":
+        from plotly.express import bar
         s_variables = sort_chr_vars(df = f_tbl, variables = variables)
 
         plot_label = [clean_plot_label(char_var) for char_var in s_variables]
@@ -1226,15 +1555,18 @@ def char_num_summary(df, chr_var1, num_var1, chr_var2 = None, num_var2 = None):
     """
     aggregate_summary = ["min", "mean", "median", "max", "sum"]
     
+    # With observed = True pandas lists category groups in order of appearance, sort_index() keeps the sorted order.
     if chr_var2 is None and num_var2 is None:
-        f_tbl = df.groupby(chr_var1)[num_var1].agg(aggregate_summary).reset_index()
+        f_tbl = df.groupby(chr_var1, observed = True)[num_var1].agg(aggregate_summary).sort_index().reset_index()
         
     elif chr_var2 is None and num_var2 is not None:
-        f_tbl = df.groupby(chr_var1)[[num_var1, num_var2]].agg(aggregate_summary).reset_index()
+        f_tbl = df.groupby(chr_var1, observed = True)[[num_var1, num_var2]].agg(aggregate_summary).sort_index() \
+            .reset_index()
         f_tbl.columns = f_tbl.columns.map("_".join).str.strip("_") 
         
     elif chr_var2 is not None and num_var2 is None:
-        f_tbl = df.groupby([chr_var1, chr_var2])[num_var1].agg(aggregate_summary).reset_index()
+        f_tbl = df.groupby([chr_var1, chr_var2], observed = True)[num_var1].agg(aggregate_summary).sort_index() \
+            .reset_index()
         
     return f_tbl
 
@@ -1264,6 +1596,7 @@ def single_char_num_out(df, chr_var, num_var, agg_fun = "mean", drop_outlier = N
     f_tbl = char_num_summary(df = f_tbl, chr_var1 = chr_var, num_var1 = num_var)
 
     if output_type == "plot":
+        from plotly.express import bar
         match_arg(agg_fun, ["min", "mean", "median", "max", "sum"])
 
         plot_labels = [clean_plot_label(var) for var in [chr_var, num_var]]
@@ -1337,6 +1670,7 @@ def one_chr_two_num_out(df, chr_var, num_var1, num_var2, p_color = group_color,
 
 
     if output_type == "plot":
+        from plotly.express import scatter
         f_tbl = char_lump(df = f_tbl, variable = chr_var, keep_n = 10, others = "Others")
         p_chr_var = chr_var + "_lump" if chr_var + "_lump" in f_tbl.columns else chr_var
 
@@ -1387,6 +1721,7 @@ def one_num_two_chr_out(df, num_var, chr_var1, chr_var2, agg_fun = "mean", drop_
         f_tbl = df
 
     if output_type == "plot":
+        from plotly.express import bar
         match_arg(agg_fun, ["min", "mean", "median", "max", "sum"])
         for chr_var in [chr_var1, chr_var2]:
             f_tbl = char_lump(df=f_tbl, variable=chr_var, keep_n=10, others="Others")
@@ -1458,6 +1793,7 @@ def one_date_summary_out(df, date_var, n_bin = None, p_color = None, output_type
     """
 
     if output_type == "plot":
+        from plotly.express import histogram
         p_tl = clean_plot_label(date_var)
         f_fig = histogram(data_frame = df,
                           x = date_var,
@@ -1495,9 +1831,11 @@ def date_summary(df, date_var, num_var, chr_var = None):
     if df[date_var].nunique() < df.shape[0]:
         aggregate_fun = ["min", "mean", "median", "max", "sum"]
         if chr_var is None:
-            f_tbl = df.groupby(date_var)[num_var].agg(aggregate_fun).reset_index()
+            f_tbl = df.groupby(date_var, observed = True)[num_var].agg(aggregate_fun).sort_index().reset_index()
         else:
-            f_tbl = df.groupby([date_var, chr_var])[num_var].agg(aggregate_fun).reset_index()
+            # Sorted as without observed = True, which lists category groups in order of appearance.
+            f_tbl = df.groupby([date_var, chr_var], observed = True)[num_var].agg(aggregate_fun).sort_index() \
+                .reset_index()
         
         return f_tbl
     else:
@@ -1530,6 +1868,7 @@ def date_summary_out(df, date_var, num_var, chr_var = None, agg_fun = "mean", dr
     f_tbl = date_summary(df = f_tbl, date_var = date_var, num_var = num_var, chr_var = chr_var)
 
     if output_type == "plot":
+        from plotly.express import line
         clean_names = [date_var, num_var] if chr_var is None else [date_var, num_var, chr_var]
         plot_label = [clean_plot_label(var) for var in clean_names]
         agg_labels = {"min": "Minimum", "mean": "Average", "median": "Median", "max": "Maximum", "sum": "Total"}
@@ -1572,6 +1911,7 @@ def date_summary_out(df, date_var, num_var, chr_var = None, agg_fun = "mean", dr
 
 def empty_out(output_type):
     if output_type == "plot":
+        from plotly.express import bar
         f_plt = bar(template = "plotly_white")
         return f_plt
     elif output_type == "table":
@@ -1601,36 +1941,112 @@ def dtype_variable(dt_dict, data_type):
     return dv_out
 
 
-def get_vars_dtypes(df, variables):
+useable_dtypes = {"object": "character", "category": "character", "bool": "character", "int64": "numeric",
+                  "float64": "numeric", "datetime64[ns]": "datetime", "datetime64[ns, UTC]": "datetime"}
+
+
+def dtype_class(dtype):
+    """
+    return
+    ------
+    The class of a pandas data type used by the app: 'character', 'numeric' or 'datetime', None for other types.
+    """
+    if dtype.kind in "iuf":
+        return "numeric"                                 # any size, e.g. after `optimize_dtypes()`.
+
+    return useable_dtypes.get(dtype.name)
+
+
+def get_vars_dtypes(df, variables, dtypes = None):
     """
     parameters
     -----------
     df [pd.DataFrame]
     variables [string] A variable or variables from the data.
+    dtypes [dictionary (Optional)] The variable names and their class (the `dtypes` of `table_schema()`), when
+           supplied `df` is not used.
 
     return
     ------
     A dictionary with the variable name and the data type.
     """
+    variables = variables if isinstance(variables, list) else [variables]
 
-    def is_dtype(f_df, f_variable):
-        useable_dtypes = {"object": "character", "category": "character", "bool": "character", "int64": "numeric",
-                          "float64": "numeric", "datetime64[ns]": "datetime", "datetime64[ns, UTC]": "datetime"}
+    if dtypes is not None:
+        return {var: dtypes[var] for var in variables}
 
-        for dt in useable_dtypes.keys():
-            if f_df[f_variable].dtype.name == dt:
-                out_dtype = useable_dtypes[dt]
-        return out_dtype
+    return {var: dtype_class(df[var].dtype) for var in variables}
 
-    var_dict = {}
 
-    if isinstance(variables, list):
-        for var in variables:
-            var_dict[var] = is_dtype(df, var)
-    else:
-        var_dict[variables] = is_dtype(df, variables)
+def table_schema(df, version = None):
+    """
+    parameters
+    -----------
+    df      [pd.DataFrame]
+    version [string (Optional)] The id of the table version.
+
+    return
+    ------
+    A JSON serializable dictionary with the variable `columns`, their class (`dtypes`) and the number of unique values
+    of the character variables (`nunique`), all the callbacks building dropdowns need.
+    """
+    dtypes = {var: dtype_class(df[var].dtype) for var in df.columns.to_list()}
+
+    return {"version": version,
+            "columns": df.columns.to_list(),
+            "dtypes": dtypes,
+            "nunique": {var: int(df[var].nunique()) for var, dt in dtypes.items() if dt == "character"}}
+
+
+schema_cache = OrderedDict()
+schema_lock = Lock()
+
+def cached_table_schema(df, version, max_versions = 8):
+    """
+    return
+    ------
+    The output of `table_schema()`, computed once for each version.
+    """
+    with schema_lock:
+        if version in schema_cache:
+            schema_cache.move_to_end(version)
+            return schema_cache[version]
 
-    return var_dict
+    schema = table_schema(df, version)
+
+    with schema_lock:
+        schema_cache[version] = schema
+
+        while len(schema_cache) > max_versions:
+            schema_cache.popitem(last = False)
+
+    return schema
+
+
+def sample_error(sample, total_rows, variables, confidence_z = 1.96):
+    """
+    parameter
+    ---------
+    sample       [pd.DataFrame] A uniform random sample of the table.
+    total_rows   [integer] The number of rows of the table.
+    variables    [list] The variables of the summary, None values are ignored.
+    confidence_z [float] The normal quantile of the confidence level, 1.96 for 95%.
+
+    return
+    ------
+    A dictionary with the sample size (`rows`), the table size (`total_rows`), the margin of error of a share of
+    rows (`share_margin`, the worst case, for a share of 50%) and of the mean of each numeric variable
+    (`mean_margins`), with the finite population correction.
+    """
+    n_rows = sample.shape[0]
+    fpc = ((total_rows - n_rows) / max(total_rows - 1, 1)) ** 0.5
+
+    numeric_vars = [var for var in variables if var is not None and dtype_class(sample[var].dtype) == "numeric"]
+
+    return {"rows": n_rows,
+            "total_rows": total_rows,
+            "share_margin": confidence_z * (0.25 / n_rows) ** 0.5 * fpc,
+            "mean_margins": {var: float(confidence_z * sample[var].std() / n_rows ** 0.5 * fpc) for var in numeric_vars}}
 
 
 def wrapper_summary(w_df,
@@ -1760,13 +2176,14 @@ def wrapper_summary(w_df,
     return output
 
 
-def check_dtype(df, variables, ckeck_for):
+def check_dtype(df, variables, ckeck_for, dtypes = None):
     """
     parameter
     ---------
     df  [pd.DataFrame]
     variables list/str variables from the data.
     ckeck_for [string] What to check for either 'plot_type' or 'agg_fun'
+    dtypes [dictionary (Optional)] The variable classes of `table_schema()`, used instead of `df`.
 
     value
     -----
@@ -1779,12 +2196,12 @@ def check_dtype(df, variables, ckeck_for):
         if len(supplied_var) == 1:
             avaliable_var = " ".join(supplied_var)
 
-            vars_dt = get_vars_dtypes(df = df, variables = avaliable_var)
+            vars_dt = get_vars_dtypes(df = df, variables = avaliable_var, dtypes = dtypes)
 
             return vars_dt[avaliable_var]
 
         elif len(supplied_var) == 3:
-            vars_dt = get_vars_dtypes(df = df, variables = supplied_var)
+            vars_dt = get_vars_dtypes(df = df, variables = supplied_var, dtypes = dtypes)
             if is_all_dtype("numeric", vars_dt):
                 return "scatter_num"
             else:
@@ -1794,7 +2211,7 @@ def check_dtype(df, variables, ckeck_for):
 
     elif ckeck_for == "agg_fun":
         if len(supplied_var) > 1:
-            vars_dt = get_vars_dtypes(df=df, variables = supplied_var)
+            vars_dt = get_vars_dtypes(df=df, variables = supplied_var, dtypes = dtypes)
 
             if len(supplied_var) == 2:
                 if is_all_dtype(dtype = ["character", "numeric"], dt_dict = vars_dt):
@@ -1849,8 +2266,8 @@ def create_data_type_table(df):
                        "Missing Values": null_values})
 
     f_tbl.loc[f_tbl["Data Type"] == "object", "Data Type"] = "Character"
-    f_tbl.loc[f_tbl["Data Type"] == "float64", "Data Type"] = "Float"
-    f_tbl.loc[f_tbl["Data Type"] == "int64", "Data Type"] = "Integer"
+    f_tbl.loc[f_tbl["Data Type"].str.startswith("float"), "Data Type"] = "Float"
+    f_tbl.loc[f_tbl["Data Type"].str.match(r"u?int\d+$"), "Data Type"] = "Integer"
     f_tbl.loc[f_tbl["Data Type"] == "datetime64[ns]", "Data Type"] = "Datetime"
     f_tbl.loc[f_tbl["Data Type"] == "datetime64[ns, UTC]", "Data Type"] = "Datetime[UTC]"
     f_tbl.loc[f_tbl["Data Type"] == "category", "Data Type"] = "Category"
@@ -1859,11 +2276,13 @@ def create_data_type_table(df):
     return f_tbl
 
 
-def table_structure(df):
+def table_structure(df, memory_report = None, memory_stats = None):
     """
     parameter
     ---------
-    df [pd.DataFrame]
+    df            [pd.DataFrame]
+    memory_report [dictionary (Optional)] The report of `optimize_dtypes()` for the table.
+    memory_stats  [dictionary (Optional)] {variable: the output of `column_memory()`} for the table.
 
     return
     ------
@@ -1871,16 +2290,31 @@ def table_structure(df):
     """
 
     f_tbl_shape = df.shape
-    number_Float_vars = len(df.select_dtypes(["float64"]).columns.to_list())
-    number_integer_vars = len(df.select_dtypes(["int64"]).columns.to_list())
-    number_character_vars = len(df.select_dtypes(["object"]).columns.to_list())
+    number_Float_vars = len(df.select_dtypes(["floating"]).columns.to_list())
+    number_integer_vars = len(df.select_dtypes(["integer"]).columns.to_list())
+    number_character_vars = len(df.select_dtypes(["object", "category"]).columns.to_list())
     number_boolean_vars = len(df.select_dtypes(["bool"]).columns.to_list())
     number_datetime_vars = len(df.select_dtypes(["datetime64[ns]", "datetime64[ns, UTC]"]).columns.to_list())
 
     c_row = "rows" if f_tbl_shape[0] > 1 else "row"
     c_col = "columns" if f_tbl_shape[1] > 1 else "column"
+
+    memory = ""
+    if memory_stats is not None:
+        total = sum(stats["bytes"] for stats in memory_stats.values())
+        savings = sum(stats["bytes"] - stats["compact_bytes"] for stats in memory_stats.values())
+        n_compact = sum(stats["compact_dtype"] != stats["dtype"] for stats in memory_stats.values())
+        memory = f"It uses {format_bytes(total)} of memory"
+        memory += f", {format_bytes(savings)} more could be saved by compact data types for {n_compact} variable(s)." \
+            if n_compact > 0 else "."
+
+    if memory_report is not None:
+        saved = memory_report["bytes_before"] - memory_report["bytes_after"]
+        memory += (f" {format_bytes(saved)} were saved at upload by compact data types for "
+                   f"{len(memory_report['columns'])} variable(s).")
+
     return f"""
-            Data has {f_tbl_shape[0]:,} {c_row} and {f_tbl_shape[1]} {c_col}.  
+            Data has {f_tbl_shape[0]:,} {c_row} and {f_tbl_shape[1]} {c_col}. {memory}  
               
                 
             | -Data Type- |  -Number Of Variables- |
@@ -1895,25 +2329,47 @@ def table_structure(df):
 
 
 def get_matrix_var(df):
-    return df.select_dtypes(["int64", "float64"]).columns.to_list()
+    return df.select_dtypes(["integer", "floating"]).columns.to_list()
 
 
-def corr_matrix(df, variables = None, plt_bg_color="#E9ECEF"):
+def corr_matrix(df, variables = None, plt_bg_color="#E9ECEF", method = "pearson", corr_mtx = None):
     """
     :param df: a dataframe with numerical data types
     :param variables: a list of numerical variables from the data.
     :param plt_bg_color: plot background color.
+    :param method: either 'pearson' or 'spearman'.
+    :param corr_mtx: the full correlation matrix of `df` (Optional), when supplied nothing is recomputed and
+                     `variables` only slice it.
     :return: plotly object
     """
-    f_df = df.select_dtypes(["int64", "float64"])
+    match_arg(method, correlation.methods)
+
+    if corr_mtx is None:
+        f_df = df[get_matrix_var(df)]
+
+        values = correlation.numeric_values(f_df)
+        if method == "spearman":
+            values = correlation.rank_values(values)
+
+        corr_mtx = correlation.correlation_frame(values, f_df.columns.to_list())
 
     if variables is not None:
         if len(variables) >= 2:
-            f_df = f_df[variables]
+            corr_mtx = corr_mtx.loc[variables, variables]
         else:
-            f_df
+            corr_mtx
 
-    corr_mtx = f_df.corr()
+    return plot_corr_matrix(corr_mtx, plt_bg_color)
+
+
+def plot_corr_matrix(corr_mtx, plt_bg_color="#E9ECEF"):
+    """
+    :param corr_mtx: a correlation matrix.
+    :param plt_bg_color: plot background color.
+    :return: plotly object
+    """
+    from plotly.graph_objects import Heatmap, Layout, Figure
+    from plotly.figure_factory import create_annotated_heatmap
 
     if corr_mtx.shape != (0, 0):
         if corr_mtx.shape[1] <= 8:
@@ -0,0 +1,820 @@
+"""
+Server side store for the tables used by the app.
+
+Every uploaded table is saved as a root version and every cleaning step creates a new version from its parent.
+A version only holds references to column buffers: a column that a step leaves unchanged is shared with the parent
+version instead of being copied, so memory grows with the columns that actually changed. The `dcc.Store`
+components of the app only carry version ids.
+
+`DatasetStore` keeps the tables in the memory of one process. Past its memory budget it spills the least recently
+used datasets to column files on the local disk and memory maps them back on their next use, and it deletes the
+datasets nobody used for a while. `SharedDatasetStore` keeps the columns and versions in a directory on the local disk
+instead, so every worker process of the app sees the same datasets and memory maps the same column files read only
+rather than holding its own copy of each table.
+"""
+from collections import OrderedDict
+from threading import RLock
+import itertools
+import json
+import os
+import pickle
+import tempfile
+import time
+import uuid
+
+import numpy
+from pandas import DataFrame, Series, RangeIndex, Categorical, CategoricalDtype, concat
+
+
+# An unset or zero budget never spills.
+default_memory_budget = int(float(os.environ.get("VAR_SUMMARY_MEMORY_BUDGET", "0"))) or None
+default_spill_dir = os.environ.get("VAR_SUMMARY_SPILL_DIR", os.path.join(tempfile.gettempdir(), "var_summary_spill"))
+default_ttl_seconds = float(os.environ.get("VAR_SUMMARY_DATASET_TTL", 4 * 3600))
+
+
+def write_atomic(path, write):
+    """
+    Call `write(f)` on a temporary file renamed to `path` once written, so no reader ever sees a partial file.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def write_column(path, values):
+    """
+    Save the values of a column (a pandas series) to `path` + ".npy" and / or ".pkl": numeric, boolean and datetime
+    values and the codes of a category column as a numpy file that `read_column()` memory maps, the categories and
+    any other values (e.g. text) pickled.
+    """
+    if isinstance(values.dtype, CategoricalDtype):
+        write_atomic(f"{path}.npy", lambda f: numpy.save(f, values.cat.codes.to_numpy()))
+        write_atomic(f"{path}.pkl", lambda f: pickle.dump((values.cat.categories, values.cat.ordered), f))
+    elif isinstance(values.dtype, numpy.dtype) and values.dtype.kind in "biufmM":
+        write_atomic(f"{path}.npy", lambda f: numpy.save(f, values.to_numpy()))
+    else:
+        write_atomic(f"{path}.pkl", lambda f: pickle.dump(values.array, f))
+
+
+def read_column(path):
+    """
+    return
+    ------
+    The values saved by `write_column()`, numpy files are memory mapped read only.
+    """
+    if os.path.exists(f"{path}.npy"):
+        values = numpy.load(f"{path}.npy", mmap_mode = "r")
+
+        if os.path.exists(f"{path}.pkl"):
+            with open(f"{path}.pkl", "rb") as f:
+                categories, ordered = pickle.load(f)
+            values = Categorical.from_codes(values, categories = categories, ordered = ordered)
+
+        return values
+
+    with open(f"{path}.pkl", "rb") as f:
+        return pickle.load(f)
+
+
+def remove_files(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class DatasetVersion:
+    def __init__(self, version_id, root_id, parent_id, columns, description, n_rows = None, index = None):
+        """
+        parameter
+        ---------
+        version_id  [string] The id of this version.
+        root_id     [string] The id of the uploaded table this version was derived from.
+        parent_id   [string] The id of the version this version was derived from, None for an upload.
+        columns     [list] A list of (variable name, column key) pairs in the order of the table.
+        description [string] A description of the step that created this version.
+        n_rows      [integer] The number of rows of the table.
+        index       [any] Where the store keeps the row index of the table, None when the columns carry it.
+        """
+        self.version_id = version_id
+        self.root_id = root_id
+        self.parent_id = parent_id
+        self.columns = columns
+        self.description = description
+        self.n_rows = n_rows
+        self.index = index
+        self.redo_id = None
+
+
+class DatasetStore:
+    def __init__(self, max_frames = 2, max_samples = 4, memory_budget = default_memory_budget,
+                 spill_dir = default_spill_dir, ttl_seconds = default_ttl_seconds):
+        """
+        parameter
+        ---------
+        max_frames    [integer] The number of materialized tables to keep, the column buffers of every version
+                      are kept regardless.
+        max_samples   [integer] The number of row samples to keep, see `sample()`.
+        memory_budget [integer (Optional)] The number of bytes of column buffers to keep in memory. Past it the least
+                      recently used datasets are spilled to `spill_dir` until the next `get()` of one of their versions.
+        ttl_seconds   [number (Optional)] A dataset none of whose versions was used for this long is deleted.
+        """
+        self.max_frames = max_frames
+        self.max_samples = max_samples
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.ttl_seconds = ttl_seconds
+
+        # Called as `observer(version_id, frame, seconds)` after each `get()`, e.g. to record metrics.
+        self.observer = None
+
+        self._versions = {}
+        self._columns = {}
+        self._column_refs = {}
+        self._column_stats = {}
+        self._frames = OrderedDict()
+        self._samples = OrderedDict()
+        self._keys = itertools.count()
+        self._lock = RLock()
+
+        # Last use of each dataset by root id, least recent first, and the spilled columns with their index and name.
+        self._used = OrderedDict()
+        self._column_bytes = {}
+        self._spilled = {}
+        self._spill_files = set()
+        self._spill_prefix = uuid.uuid4().hex
+        self.stats = {"spilled": 0, "reloaded": 0, "expired": 0, "spilled_bytes": 0}
+
+    # Versions -------------------------------------------------------------------------------------------------------
+    def create(self, df, description = "Upload"):
+        """
+        Save an uploaded table as a new root version and return its id. Expired datasets are deleted first.
+        """
+        self.expire()
+        return self._add(df, parent = None, description = description)
+
+    def commit(self, parent_id, df, description = "Cleaning step"):
+        """
+        Save `df` as a new version derived from `parent_id` and return its id. Columns equal to the parent's
+        columns share the parent's buffers. Raises a KeyError when the parent is unknown, e.g. expired.
+        """
+        with self._lock:
+            parent = self._version(parent_id)
+            if parent is None:
+                raise KeyError(f"Unknown dataset version {parent_id}, it may have expired.")
+
+            version_id = self._add(df, parent = parent, description = description)
+            parent.redo_id = version_id
+            self._save_version(parent)
+
+        return version_id
+
+    def get(self, version_id):
+        """
+        return
+        ------
+        The table of a version as a pandas dataframe, or None if the version is unknown. The returned frame is
+        shared between callers and must not be modified in place.
+        """
+        start = time.perf_counter()
+        f_tbl = self._get(version_id)
+
+        if self.observer is not None and f_tbl is not None:
+            self.observer(version_id, f_tbl, time.perf_counter() - start)
+
+        return f_tbl
+
+    def _get(self, version_id):
+        with self._lock:
+            version = self._version(version_id)
+            if version is None:
+                return None
+
+            self._use(version.root_id)
+            if version_id in self._frames:
+                self._frames.move_to_end(version_id)
+                return self._frames[version_id]
+
+            if version.columns == []:
+                f_tbl = DataFrame()
+            else:
+                # Side by side without copying, a dictionary with `columns` reindexes datetime columns very slowly.
+                f_tbl = concat([self._column(key, version) for _, key in version.columns], axis = "columns",
+                               copy = False, keys = [name for name, _ in version.columns])
+
+            self._frames[version_id] = f_tbl
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last = False)
+
+            self._enforce_budget()
+            return f_tbl
+
+    def sample(self, version_id, n_rows, seed = 0):
+        """
+        return
+        ------
+        A uniform random sample of `n_rows` rows of a version, in the order of the table, or the whole table when it
+        has no more rows than that. The sample is drawn once and reused. None if the version is unknown.
+        """
+        key = (version_id, n_rows, seed)
+
+        with self._lock:
+            if key in self._samples:
+                self._samples.move_to_end(key)
+                return self._samples[key]
+
+        f_tbl = self.get(version_id)
+        if f_tbl is None or f_tbl.shape[0] <= n_rows:
+            return f_tbl
+
+        s_tbl = f_tbl.sample(n = n_rows, random_state = seed).sort_index()
+
+        with self._lock:
+            if version_id in self:
+                self._samples[key] = s_tbl
+                while len(self._samples) > self.max_samples:
+                    self._samples.popitem(last = False)
+
+        return s_tbl
+
+    def version(self, version_id):
+        return self._version(version_id)
+
+    def __contains__(self, version_id):
+        return self._version(version_id) is not None
+
+    # Undo / Redo ----------------------------------------------------------------------------------------------------
+    def undo(self, version_id):
+        """
+        return
+        ------
+        The id of the parent version, or None when `version_id` is an upload.
+        """
+        with self._lock:
+            version = self._version(version_id)
+            if version is None or version.parent_id is None:
+                return None
+
+            parent = self._version(version.parent_id)
+            parent.redo_id = version_id
+            self._save_version(parent)
+            return version.parent_id
+
+    def redo(self, version_id):
+        """
+        return
+        ------
+        The id of the version most recently undone or committed from `version_id`, or None.
+        """
+        version = self._version(version_id)
+        return None if version is None else version.redo_id
+
+    def history(self, version_id):
+        """
+        return
+        ------
+        A list of the descriptions of the steps that lead to a version, starting from the upload.
+        """
+        steps = []
+        version = self._version(version_id)
+
+        while version is not None:
+            steps.append(version.description)
+            version = self._version(version.parent_id)
+
+        return steps[::-1]
+
+    # Clean up -------------------------------------------------------------------------------------------------------
+    def drop_dataset(self, version_id):
+        """
+        Remove every version derived from the same upload as `version_id` and release their column buffers.
+        """
+        with self._lock:
+            version = self._version(version_id)
+            if version is None:
+                return
+
+            for vid in self._root_versions(version.root_id):
+                self._delete_version(vid)
+                self._frames.pop(vid, None)
+
+            for key in [key for key in self._samples if key[0] not in self]:
+                del self._samples[key]
+            self._used.pop(version.root_id, None)
+
+    def expire(self, now = None):
+        """
+        Delete the datasets none of whose versions was used for `ttl_seconds`.
+
+        return
+        ------
+        The number of deleted datasets.
+        """
+        if self.ttl_seconds is None:
+            return 0
+
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [root_id for root_id, used in self._used.items() if now - used > self.ttl_seconds]
+            for root_id in expired:
+                self.drop_dataset(root_id)
+            self.stats["expired"] += len(expired)
+
+        return len(expired)
+
+    def column_nbytes(self):
+        """
+        return
+        ------
+        The number of bytes held by the column buffers in memory. shared buffers are counted once.
+        """
+        with self._lock:
+            return sum(self._column_bytes[key] for key in self._columns)
+
+    def metrics(self):
+        """
+        return
+        ------
+        A dictionary with the number of `spilled`, `reloaded` and `expired` datasets, the `spilled_bytes` written to
+        disk, the `memory_bytes` of the column buffers in memory and the number of `datasets` and `spilled_datasets`.
+        """
+        with self._lock:
+            spilled_roots = {self._versions[vid].root_id for vid in self._versions
+                             if any(key in self._spilled for _, key in self._versions[vid].columns)}
+            return {**self.stats, "memory_bytes": self.column_nbytes(), "datasets": len(self._used),
+                    "spilled_datasets": len(spilled_roots)}
+
+    def column_stats(self, version_id, compute):
+        """
+        parameter
+        ---------
+        version_id [string] A version id.
+        compute    [function] Computes the statistics of a column (a pandas series).
+
+        return
+        ------
+        A dictionary of {variable name: statistics} for the columns of the version, or None if the version is
+        unknown. Statistics are cached by column buffer, so a column shared by several versions is computed once.
+        The cache assumes one `compute` function per store.
+        """
+        with self._lock:
+            version = self._version(version_id)
+            if version is None:
+                return None
+            columns = [(name, key, self._column(key, version)) for name, key in version.columns]
+            stats = {key: self._column_stats[key] for _, key, _ in columns if key in self._column_stats}
+
+        for _, key, values in columns:
+            if key not in stats:
+                stats[key] = compute(values)
+
+        with self._lock:
+            for _, key, _ in columns:
+                if key in self._columns:
+                    self._column_stats[key] = stats[key]
+
+        return {name: stats[key] for name, key, _ in columns}
+
+    # Storage --------------------------------------------------------------------------------------------------------
+    # Versions and column buffers live in dictionaries of this process, `SharedDatasetStore` keeps them in files.
+    def _version(self, version_id):
+        return self._versions.get(version_id)
+
+    def _save_version(self, version):
+        self._versions[version.version_id] = version
+
+    def _root_versions(self, root_id):
+        return [vid for vid, ver in self._versions.items() if ver.root_id == root_id]
+
+    def _delete_version(self, version_id):
+        for _, key in self._versions.pop(version_id).columns:
+            self._release_column(key)
+
+    def _column(self, key, version):
+        if key not in self._columns:
+            self._reload(version.root_id)
+
+        return self._columns[key]
+
+    def _put_column(self, values):
+        key = next(self._keys)
+        self._columns[key] = values.copy()
+        self._column_refs[key] = 0
+        self._column_bytes[key] = self._columns[key].memory_usage(index = False, deep = True)
+        return key
+
+    def _put_index(self, df, parent):
+        return None
+
+    def _retain(self, key):
+        self._column_refs[key] += 1
+
+    # Internals ------------------------------------------------------------------------------------------------------
+    def _add(self, df, parent, description):
+        with self._lock:
+            version_id = uuid.uuid4().hex
+            parent_columns = {} if parent is None else dict(parent.columns)
+
+            columns = []
+            for name in df.columns.to_list():
+                key = parent_columns.get(name)
+
+                if key is None or not self._same_column(self._column(key, parent), df[name]):
+                    key = self._put_column(df[name])
+
+                self._retain(key)
+                columns.append((name, key))
+
+            root_id = version_id if parent is None else parent.root_id
+            self._save_version(DatasetVersion(version_id, root_id, None if parent is None else parent.version_id,
+                                              columns, description, n_rows = df.shape[0],
+                                              index = self._put_index(df, parent)))
+            self._use(root_id)
+            self._enforce_budget()
+            return version_id
+
+    @staticmethod
+    def _same_column(stored, new):
+        return stored.dtype == new.dtype and stored.shape == new.shape and stored.equals(new)
+
+    def _release_column(self, key):
+        self._column_refs[key] -= 1
+
+        if self._column_refs[key] == 0:
+            del self._column_refs[key]
+            self._columns.pop(key, None)
+            self._column_stats.pop(key, None)
+            self._column_bytes.pop(key, None)
+            self._spilled.pop(key, None)
+
+            if key in self._spill_files:
+                self._spill_files.discard(key)
+                path = self._spill_path(key)
+                remove_files(f"{path}.npy", f"{path}.pkl", f"{path}.index.pkl")
+
+    # Spilling -------------------------------------------------------------------------------------------------------
+    def _use(self, root_id):
+        self._used[root_id] = time.time()
+        self._used.move_to_end(root_id)
+
+    def _enforce_budget(self):
+        # The most recently used dataset stays in memory even when it alone exceeds the budget.
+        if self.memory_budget is None:
+            return
+
+        for root_id in list(self._used)[:-1]:
+            if self.column_nbytes() <= self.memory_budget:
+                break
+            self._spill(root_id)
+
+    def _root_keys(self, root_id):
+        return {key for vid in self._root_versions(root_id) for _, key in self._versions[vid].columns}
+
+    def _spill(self, root_id):
+        keys = [key for key in self._root_keys(root_id) if key in self._columns]
+        if keys == []:
+            return
+
+        os.makedirs(self.spill_dir, exist_ok = True)
+        for key in keys:
+            values = self._columns.pop(key)
+            path = self._spill_path(key)
+
+            # A column reloaded from disk and spilled again is not written twice.
+            if key not in self._spill_files:
+                write_column(path, values)
+                if not isinstance(values.index, RangeIndex):
+                    write_atomic(f"{path}.index.pkl", lambda f: pickle.dump(values.index, f))
+                self._spill_files.add(key)
+                self.stats["spilled_bytes"] += self._column_bytes[key]
+
+            self._spilled[key] = (values.index if isinstance(values.index, RangeIndex) else None, values.name)
+
+        for vid in self._root_versions(root_id):
+            self._frames.pop(vid, None)
+        for key in [key for key in self._samples if self._version(key[0]).root_id == root_id]:
+            del self._samples[key]
+
+        self.stats["spilled"] += 1
+
+    def _reload(self, root_id):
+        for key in self._root_keys(root_id):
+            if key not in self._spilled:
+                continue
+
+            index, name = self._spilled.pop(key)
+            path = self._spill_path(key)
+            if index is None:
+                with open(f"{path}.index.pkl", "rb") as f:
+                    index = pickle.load(f)
+
+            self._columns[key] = Series(read_column(path), index = index, name = name, copy = False)
+
+        self.stats["reloaded"] += 1
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{self._spill_prefix}.{key}")
+
+
+default_segment_dir = os.environ.get("VAR_SUMMARY_SEGMENT_DIR",
+                                     os.path.join(tempfile.gettempdir(), "var_summary_segments"))
+
+
+class SharedDatasetStore(DatasetStore):
+    """
+    A `DatasetStore` kept in a directory on the local disk, shared by the worker processes of the app:
+
+        columns/<key>.npy                     the values of a numeric, boolean or datetime column, or the codes of a
+                                              category column, memory mapped read only by every worker.
+        columns/<key>.pkl                     the categories of a category column, the values of any other column
+                                              (e.g. text) or a row index other than a range, loaded by each worker.
+        versions/<root id>.<version id>.json  the manifest of a version: its columns, row index, parent and redo.
+
+    Files are written under a temporary name and renamed, so no worker reads a partial file. The reference count of a
+    column file is the number of manifests listing it. A dataset whose versions were not read for `ttl_seconds`
+    expires: `collect_garbage()` deletes its manifests, then the column files no manifest references any more.
+    """
+    def __init__(self, segment_dir = default_segment_dir, ttl_seconds = default_ttl_seconds, gc_seconds = 300, max_frames = 2,
+                 max_samples = 4):
+        """
+        parameter
+        ---------
+        segment_dir [string] The directory of the column files and manifests, on a local disk.
+        ttl_seconds [number] A dataset none of whose versions was read for this long is deleted.
+        gc_seconds  [number] The minimum time between two runs of `collect_garbage()` started by `create()`.
+        """
+        super().__init__(max_frames = max_frames, max_samples = max_samples, memory_budget = None,
+                         ttl_seconds = ttl_seconds)
+
+        self.segment_dir = segment_dir
+        self.gc_seconds = gc_seconds
+
+        self._column_dir = os.path.join(segment_dir, "columns")
+        self._version_dir = os.path.join(segment_dir, "versions")
+        self._manifests = {}
+        self._touched = {}
+        self._collected = 0
+
+        os.makedirs(self._column_dir, exist_ok = True)
+        os.makedirs(self._version_dir, exist_ok = True)
+
+    def expire(self, now = None):
+        return self.collect_garbage(now = now)[0]
+
+    def get(self, version_id):
+        f_tbl = super().get(version_id)
+
+        if f_tbl is not None:
+            self._touch(version_id)
+
+        return f_tbl
+
+    def drop_dataset(self, version_id):
+        super().drop_dataset(version_id)
+        self.collect_garbage(force = True)
+
+    def column_nbytes(self):
+        """
+        return
+        ------
+        The number of bytes of the column files, shared by every worker.
+        """
+        return sum(self._size(os.path.join(self._column_dir, file_name)) for file_name in os.listdir(self._column_dir))
+
+    def metrics(self):
+        """
+        return
+        ------
+        A dictionary with the number of `expired` datasets, the `memory_bytes` of the column files and the number of
+        `datasets` with a manifest in the shared directory, whichever worker created them. Nothing is spilled, every
+        column is already on disk.
+        """
+        root_ids = {file_name.split(".")[0] for file_name in os.listdir(self._version_dir) if file_name.endswith(".json")}
+
+        with self._lock:
+            return {"expired": self.stats["expired"], "memory_bytes": self.column_nbytes(), "datasets": len(root_ids)}
+
+    # Reference counts and clean up ----------------------------------------------------------------------------------
+    def segment_refs(self):
+        """
+        return
+        ------
+        A dictionary of {column key: the number of manifests referencing the column file}.
+        """
+        refs = {}
+
+        for file_name in os.listdir(self._version_dir):
+            manifest = self._read_manifest(os.path.join(self._version_dir, file_name)) if file_name.endswith(".json") else None
+            if manifest is None:
+                continue
+
+            keys = [key for _, key in manifest["columns"]]
+            if isinstance(manifest["index"], str):
+                keys.append(manifest["index"])
+            for key in keys:
+                refs[key] = refs.get(key, 0) + 1
+
+        return refs
+
+    def collect_garbage(self, force = False, now = None, grace_seconds = 60):
+        """
+        Delete the datasets not read for `ttl_seconds`, then the column files that no manifest references. Runs at
+        most once every `gc_seconds` unless forced. Column files younger than `grace_seconds` are kept, the manifest
+        of their version may not be written yet.
+
+        return
+        ------
+        The number of deleted manifests and column files.
+        """
+        now = time.time() if now is None else now
+        if not force and now - self._collected < self.gc_seconds:
+            return 0, 0
+        self._collected = now
+
+        # The modification time of a manifest is the last time a worker read the version.
+        last_read = {}
+        for file_name in os.listdir(self._version_dir):
+            if file_name.endswith(".json"):
+                root_id = file_name.split(".")[0]
+                last_read[root_id] = max(last_read.get(root_id, 0),
+                                         self._mtime(os.path.join(self._version_dir, file_name)))
+
+        n_manifests = 0
+        for root_id, read_at in last_read.items():
+            if now - read_at > self.ttl_seconds:
+                with self._lock:
+                    self.stats["expired"] += 1
+                for vid in self._root_versions(root_id):
+                    self._delete_version(vid)
+                    n_manifests += 1
+
+        refs = self.segment_refs()
+        n_columns = 0
+        for file_name in os.listdir(self._column_dir):
+            path = os.path.join(self._column_dir, file_name)
+            if file_name.split(".")[0] not in refs and now - self._mtime(path) > grace_seconds:
+                remove_files(path)
+                n_columns += 1
+
+        with self._lock:
+            for key in [key for key in self._columns if key not in refs]:
+                del self._columns[key]
+                self._column_stats.pop(key, None)
+            for vid in [vid for vid in list(self._manifests) + list(self._frames) if vid not in self]:
+                self._manifests.pop(vid, None)
+                self._frames.pop(vid, None)
+            for key in [key for key in self._samples if key[0] not in self]:
+                del self._samples[key]
+
+        return n_manifests, n_columns
+
+    def _touch(self, version_id, every = 60):
+        if time.time() - self._touched.get(version_id, 0) < every:
+            return
+
+        version = self._version(version_id)
+        if version is not None:
+            try:
+                os.utime(self._manifest_path(version.root_id, version_id))
+            except OSError:
+                pass
+            self._touched[version_id] = time.time()
+
+    # Storage --------------------------------------------------------------------------------------------------------
+    def _version(self, version_id):
+        if version_id is None:
+            return None
+
+        # Another worker may have changed the redo of a version or deleted it since it was cached.
+        cached = self._manifests.get(version_id)
+        path = self._find_manifest(version_id) if cached is None else self._manifest_path(cached[1].root_id, version_id)
+        state = self._state(path)
+
+        if state is None:
+            self._manifests.pop(version_id, None)
+            return None
+        if cached is not None and cached[0] == state:
+            return cached[1]
+
+        manifest = self._read_manifest(path)
+        if manifest is None:
+            return None
+
+        version = DatasetVersion(manifest["version_id"], manifest["root_id"], manifest["parent_id"],
+                                 [tuple(column) for column in manifest["columns"]], manifest["description"],
+                                 n_rows = manifest["n_rows"], index = manifest["index"])
+        version.redo_id = manifest["redo_id"]
+        self._manifests[version_id] = (state, version)
+
+        return version
+
+    def _save_version(self, version):
+        path = self._manifest_path(version.root_id, version.version_id)
+        manifest = {"version_id": version.version_id, "root_id": version.root_id, "parent_id": version.parent_id,
+                    "columns": version.columns, "description": version.description, "n_rows": version.n_rows,
+                    "index": version.index, "redo_id": version.redo_id}
+
+        write_atomic(path, lambda f: f.write(json.dumps(manifest).encode()))
+        self._manifests[version.version_id] = (self._state(path), version)
+
+    def _root_versions(self, root_id):
+        return [file_name.split(".")[1] for file_name in os.listdir(self._version_dir)
+                if file_name.startswith(f"{root_id}.") and file_name.endswith(".json")]
+
+    def _delete_version(self, version_id):
+        version = self._version(version_id)
+        if version is not None:
+            remove_files(self._manifest_path(version.root_id, version_id))
+        self._manifests.pop(version_id, None)
+
+    def _column(self, key, version):
+        # The values are shared by every version listing the column, the index is the version's.
+        return Series(self._load(key), index = self._index(version), copy = False)
+
+    def _put_column(self, values):
+        key = uuid.uuid4().hex
+        write_column(os.path.join(self._column_dir, key), values)
+        return key
+
+    def _put_index(self, df, parent):
+        if isinstance(df.index, RangeIndex):
+            return [df.index.start, df.index.stop, df.index.step]
+
+        if parent is not None and isinstance(parent.index, str) and self._index(parent).equals(df.index):
+            return parent.index
+
+        key = uuid.uuid4().hex
+        write_atomic(self._column_path(key, "pkl"), lambda f: pickle.dump(df.index, f))
+        return key
+
+    def _retain(self, key):
+        pass                                             # counted from the manifests, see `segment_refs()`.
+
+    def _release_column(self, key):
+        pass                                             # deleted by `collect_garbage()`.
+
+    def _index(self, version):
+        if isinstance(version.index, list):
+            return RangeIndex(*version.index)
+
+        return self._load(version.index)
+
+    def _load(self, key):
+        with self._lock:
+            if key in self._columns:
+                return self._columns[key]
+
+        values = read_column(os.path.join(self._column_dir, key))
+
+        with self._lock:
+            self._columns[key] = values
+
+        return values
+
+    # Files ----------------------------------------------------------------------------------------------------------
+    def _column_path(self, key, extension):
+        return os.path.join(self._column_dir, f"{key}.{extension}")
+
+    def _manifest_path(self, root_id, version_id):
+        return os.path.join(self._version_dir, f"{root_id}.{version_id}.json")
+
+    def _find_manifest(self, version_id):
+        for file_name in os.listdir(self._version_dir):
+            if file_name.endswith(f".{version_id}.json"):
+                return os.path.join(self._version_dir, file_name)
+
+        return None
+
+    @staticmethod
+    def _state(path):
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            return None
+
+        return stat.st_ino, stat.st_size
+
+    @staticmethod
+    def _read_manifest(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return time.time()
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
@@ -0,0 +1,475 @@
+"""
+Background jobs for long running callbacks.
+
+A job is queued as a JSON file in a local directory and run by a pool of worker threads, so a long computation does
+not hold the request that started it. The job reports its progress (step N of M, rows processed) to a status file,
+the polling callbacks read the status and pick up the pickled result once the job is done. No external broker is
+needed, only a directory on local disk.
+
+The queue of each app process is in its memory, so the queue and running files name the process that owns them. Jobs
+whose owner is gone (a restarted or crashed worker) are marked failed rather than left queued or running forever.
+
+Tasks registered with `executor = "process"` run in a forked child process, so a job that is superseded by newer
+inputs of the same session can be cancelled and its CPU actually freed. The latest job of each session and slot is
+recorded in the job directory too, as the next request of the session may reach another worker: a queued job is
+cancelled by removing its queue file, a running one by a cancel file its owner checks while the child runs.
+"""
+from threading import Thread, Lock
+from queue import Queue
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import pickle
+import re
+import tempfile
+import time
+import traceback
+import uuid
+
+
+default_job_dir = os.environ.get("VAR_SUMMARY_JOB_DIR", os.path.join(tempfile.gettempdir(), "var_summary_jobs"))
+
+can_fork = "fork" in multiprocessing.get_all_start_methods()
+
+
+class Task:
+    def __init__(self, fn, executor, prepare, preload):
+        self.fn = fn
+        self.executor = executor if can_fork else "thread"
+        self.prepare = prepare
+        self.preload = preload
+
+
+class JobManager:
+    def __init__(self, job_dir = default_job_dir, max_workers = 2, keep_seconds = 3600, timeout_seconds = 600,
+                 poll_seconds = 0.2):
+        """
+        parameter
+        ---------
+        job_dir         [string] The directory holding the queue, status and result files.
+        max_workers     [integer] The number of worker threads, which is also the number of child processes that
+                        can run at the same time.
+        keep_seconds    [number] How long the files of a finished job are kept.
+        timeout_seconds [number] A job queued or started longer ago than this is failed by `status()` when no live
+                        process owns it.
+        poll_seconds    [number] How often the owner of a running child process checks for a cancel file.
+        """
+        self.job_dir = job_dir
+        self.max_workers = max_workers
+        self.keep_seconds = keep_seconds
+        self.timeout_seconds = timeout_seconds
+        self.poll_seconds = poll_seconds
+
+        self._tasks = {}
+        self._queue = Queue()
+        self._workers = []
+        self._processes = {}
+        self._cancelled = set()
+        self._lock = Lock()
+        self._fork_lock = Lock()
+
+        self.stats = {"submitted": 0, "done": 0, "failed": 0, "cancelled_queued": 0, "cancelled_running": 0,
+                      "cancelled_seconds": 0.0}
+
+        for sub_dir in ["queue", "running", "status", "results", "slots", "cancel"]:
+            os.makedirs(os.path.join(job_dir, sub_dir), exist_ok = True)
+
+        self.fail_orphans()
+
+    # Tasks ----------------------------------------------------------------------------------------------------------
+    def task(self, name, executor = "thread", prepare = None, preload = ()):
+        """
+        Register a function that can be run as a job. The function is called with the job arguments and a
+        `progress(step, total, rows = None, message = "")` keyword argument.
+
+        parameter
+        ---------
+        name     [string] The name of the task.
+        executor [string] Either "thread" to run the task in a worker thread or "process" to run it in a forked
+                 child process that can be cancelled.
+        prepare  [function (Optional)] Called in the parent process with the job arguments, returns the arguments
+                 passed to the task. Use it to resolve shared objects (such as stored tables) before the fork.
+        preload  [list (Optional)] Names of modules the task imports on first use, imported once in the parent before
+                 the fork rather than again in each child.
+        """
+        def register(fn):
+            self._tasks[name] = Task(fn, executor, prepare, preload)
+            return fn
+
+        return register
+
+    def submit(self, name, session = None, slot = None, **kwargs):
+        """
+        parameter
+        ---------
+        name    [string] The name of a registered task.
+        session [string (Optional)] The id of the user session submitting the job.
+        slot    [string (Optional)] A name for what the job computes (e.g. "summary"). A job submitted for a
+                session and slot supersedes, and cancels, the previous job of the same session and slot.
+        kwargs  The JSON serializable arguments of the task.
+
+        return
+        ------
+        The id of the queued job.
+        """
+        if name not in self._tasks:
+            raise KeyError(f"'{name}' is not a registered task")
+
+        self._start_workers()
+        self._remove_expired()
+        self.fail_orphans()
+
+        if session is not None and slot is not None:
+            self.cancel_slot(session, slot)
+
+        job_id = uuid.uuid4().hex
+        self._write_json(self._path("queue", job_id), {"job_id": job_id, "task": name, "kwargs": kwargs,
+                                                       "pid": os.getpid()})
+        self._write_status(job_id, {"status": "queued", "task": name, "step": 0, "total": None, "rows": None,
+                                    "message": "Queued", "submitted": time.time()})
+
+        if session is not None and slot is not None:
+            self._write_json(self._slot_path(session, slot), {"job_id": job_id})
+
+        with self._lock:
+            self.stats["submitted"] += 1
+
+        self._queue.put(job_id)
+        return job_id
+
+    # Cancellation ---------------------------------------------------------------------------------------------------
+    def cancel(self, job_id):
+        """
+        Cancel a queued job, or stop a running job of a "process" task, whichever worker process runs it. Jobs of
+        "thread" tasks that already started run to the end.
+
+        return
+        ------
+        True when the job was cancelled.
+        """
+        with self._lock:
+            try:
+                os.remove(self._path("queue", job_id))
+            except OSError:
+                pass
+            else:
+                self.stats["cancelled_queued"] += 1
+                self._write_status(job_id, {**(self.status(job_id) or {}), "status": "cancelled", "message": "Cancelled"})
+                return True
+
+            process = self._processes.get(job_id)
+            if process is not None:
+                if job_id in self._cancelled:
+                    return False
+
+                self._cancelled.add(job_id)
+                process.terminate()
+                return True
+
+        # Running elsewhere (another worker, or this one before the fork): its owner stops it on the cancel file.
+        status = self.status(job_id)
+        task = self._tasks.get((status or {}).get("task"))
+        if status is None or status["status"] != "running" or task is None or task.executor != "process":
+            return False
+
+        cancel_path = self._path("cancel", job_id)
+        if os.path.exists(cancel_path):
+            return False
+
+        self._write_json(cancel_path, {"job_id": job_id, "pid": os.getpid()})
+        return True
+
+    def cancel_slot(self, session, slot):
+        """
+        Cancel the latest job submitted for a session and slot, by any worker process.
+        """
+        slot_path = self._slot_path(session, slot)
+        claimed_path = f"{slot_path}.{uuid.uuid4().hex}.claimed"
+
+        # Renamed first, so of two requests cancelling the same slot only one reads the job id.
+        try:
+            os.rename(slot_path, claimed_path)
+        except OSError:
+            return False
+
+        try:
+            with open(claimed_path) as f:
+                job_id = json.load(f)["job_id"]
+        except (OSError, ValueError, KeyError):
+            return False
+        finally:
+            self._remove(claimed_path)
+
+        return self.cancel(job_id)
+
+    def holding_forks(self):
+        """
+        A thread importing a module holds the module's import lock, a child forked meanwhile inherits the held lock
+        and hangs as soon as it imports the same module. Code of the parent process that imports modules on first use,
+        such as building figures (plotly loads its validators lazily), runs in this context so no child is forked
+        meanwhile.
+
+        return
+        ------
+        A context manager.
+        """
+        return self._fork_lock
+
+    def metrics(self):
+        """
+        return
+        ------
+        A dictionary with the number of submitted, finished, failed and cancelled jobs and `cancelled_seconds`,
+        the time running jobs had spent before they were cancelled.
+        """
+        with self._lock:
+            return {**self.stats, "running_processes": len(self._processes), "queued": self._queue.qsize()}
+
+    # Polling --------------------------------------------------------------------------------------------------------
+    def status(self, job_id):
+        """
+        return
+        ------
+        A dictionary with the job `status` ("queued", "running", "done", "failed" or "cancelled"), the current
+        `step`, the `total` number of steps, the `rows` processed and a `message`. None when the job is unknown or
+        the id is not a valid job id.
+        """
+        try:
+            with open(self._path("status", job_id)) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        since = status.get("started") or status.get("submitted") or 0
+        if status.get("status") in ["queued", "running"] and time.time() - since > self.timeout_seconds:
+            if not any(self._owned(self._path(sub_dir, job_id)) for sub_dir in ["queue", "running"]):
+                status.update(status = "failed", message = "The job was lost by its server process",
+                              finished = time.time())
+                self._write_status(job_id, status)
+
+        return status
+
+    # Orphans --------------------------------------------------------------------------------------------------------
+    def fail_orphans(self):
+        """
+        Mark failed the queued and running jobs whose owner process is gone, and remove their queue and running files.
+
+        return
+        ------
+        The number of failed jobs.
+        """
+        n_failed = 0
+
+        for sub_dir in ["queue", "running"]:
+            dir_path = os.path.join(self.job_dir, sub_dir)
+
+            for file_name in os.listdir(dir_path):
+                path = os.path.join(dir_path, file_name)
+                if re.fullmatch(r"[0-9a-f]{32}\.json", file_name) is None or self._owned(path):
+                    continue
+
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue                               # claimed or removed elsewhere.
+
+                job_id = file_name[:-len(".json")]
+                status = self.status(job_id) or {}
+                status.update(status = "failed", message = "The job was lost by a restart of the server",
+                              finished = time.time())
+                self._write_status(job_id, status)
+                n_failed += 1
+
+        return n_failed
+
+    @staticmethod
+    def _owned(path):
+        # True while the process named in a queue or running file is alive.
+        try:
+            with open(path) as f:
+                pid = json.load(f).get("pid")
+        except (OSError, ValueError):
+            return False
+
+        if pid is None:
+            return False
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+
+        return True
+
+    def result(self, job_id):
+        """
+        return
+        ------
+        The value returned by a finished job.
+        """
+        with open(self._path("results", job_id, ".pkl"), "rb") as f, self.holding_forks():
+            return pickle.load(f)                          # unpickling figures imports plotly classes.
+
+    # Workers --------------------------------------------------------------------------------------------------------
+    def _start_workers(self):
+        with self._lock:
+            if self._workers != []:
+                return
+
+            for _ in range(self.max_workers):
+                worker = Thread(target = self._work, daemon = True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+
+            try:
+                os.rename(self._path("queue", job_id), self._path("running", job_id))
+            except OSError:
+                continue                                   # claimed or cancelled elsewhere.
+
+            try:
+                self._run(job_id)
+            finally:
+                os.remove(self._path("running", job_id))
+
+    def _run(self, job_id):
+        with open(self._path("running", job_id)) as f:
+            job = json.load(f)
+
+        task = self._tasks[job["task"]]
+
+        status = self.status(job_id) or {}
+        status.update(status = "running", started = time.time(), message = "Running")
+        self._write_status(job_id, status)
+
+        if task.executor == "thread":
+            self._execute(job_id, task.fn, job["kwargs"], status)
+            return
+
+        try:
+            kwargs = task.prepare(**job["kwargs"]) if task.prepare is not None else job["kwargs"]
+        except Exception as e:
+            self._finish(job_id, status, "failed", str(e))
+            return
+
+        with self._fork_lock:
+            for module in task.preload:
+                importlib.import_module(module)
+
+            # A job cancelled by another worker between its start and the fork is not forked at all.
+            with self._lock:
+                process = None
+                if not os.path.exists(self._path("cancel", job_id)):
+                    process = multiprocessing.get_context("fork").Process(target = self._execute,
+                                                                          args = (job_id, task.fn, kwargs, status),
+                                                                          daemon = True)
+                    process.start()
+                    self._processes[job_id] = process
+
+        if process is None:
+            self._remove(self._path("cancel", job_id))
+            self._finish(job_id, status, "cancelled", "Cancelled")
+            return
+
+        while process.exitcode is None:
+            process.join(timeout = self.poll_seconds)
+            if process.exitcode is None and os.path.exists(self._path("cancel", job_id)):
+                self.cancel(job_id)
+        self._remove(self._path("cancel", job_id))
+
+        with self._lock:
+            del self._processes[job_id]
+            cancelled = job_id in self._cancelled
+            self._cancelled.discard(job_id)
+
+            if cancelled:
+                self.stats["cancelled_running"] += 1
+                self.stats["cancelled_seconds"] += time.time() - status["started"]
+
+        if cancelled:
+            self._finish(job_id, status, "cancelled", "Cancelled")
+        elif process.exitcode != 0:
+            self._finish(job_id, status, "failed", f"Worker process exited with code {process.exitcode}")
+        else:
+            state = (self.status(job_id) or {}).get("status")
+            with self._lock:
+                self.stats["done" if state == "done" else "failed"] += 1
+
+    def _execute(self, job_id, fn, kwargs, status):
+        def progress(step, total, rows = None, message = ""):
+            status.update(step = step, total = total, rows = rows, message = message)
+            self._write_status(job_id, status)
+
+        try:
+            output = fn(progress = progress, **kwargs)
+
+            with open(self._path("results", job_id, ".pkl"), "wb") as f:
+                pickle.dump(output, f)
+
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(job_id, status, "failed", str(e))
+
+        else:
+            self._finish(job_id, status, "done", "Done")
+
+    def _finish(self, job_id, status, state, message):
+        status.update(status = state, message = message, finished = time.time())
+        self._write_status(job_id, status)
+
+        if multiprocessing.parent_process() is None and state in ["done", "failed"]:
+            with self._lock:
+                self.stats[state] += 1
+
+    # Files ----------------------------------------------------------------------------------------------------------
+    def _path(self, sub_dir, job_id, ext = ".json"):
+        # Job ids come back from the browser, only the ids made by `submit` may name a file.
+        if not isinstance(job_id, str) or re.fullmatch("[0-9a-f]{32}", job_id) is None:
+            raise ValueError(f"Invalid job id {job_id!r}")
+
+        return os.path.join(self.job_dir, sub_dir, job_id + ext)
+
+    def _slot_path(self, session, slot):
+        # Session ids come from the browser, the file is named by a hash.
+        key = hashlib.sha256(json.dumps([session, slot]).encode()).hexdigest()
+        return os.path.join(self.job_dir, "slots", key + ".json")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _write_status(self, job_id, status):
+        status["job_id"] = job_id
+        self._write_json(self._path("status", job_id), status)
+
+    @staticmethod
+    def _write_json(path, content):
+        # Write then rename so a poll never reads a half written file.
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp_path, path)
+
+    def _remove_expired(self):
+        expire_before = time.time() - self.keep_seconds
+
+        for sub_dir in ["status", "results", "slots", "cancel"]:
+            dir_path = os.path.join(self.job_dir, sub_dir)
+
+            for file_name in os.listdir(dir_path):
+                file_path = os.path.join(dir_path, file_name)
+                try:
+                    if os.path.getmtime(file_path) < expire_before:
+                        os.remove(file_path)
+                except OSError:
+                    pass
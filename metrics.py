@@ -0,0 +1,312 @@
+"""
+Callback latency and payload metrics in the Prometheus text format.
+
+`instrument_app()` times every server side callback of a Dash app and hooks into its Flask server to measure each
+`/_dash-update-component` request: the wall time, the time spent in the callback function, the time spent outside
+of it (dispatch and JSON serialization of the response), the time spent materializing stored tables, the request and
+response sizes and the number of rows and columns of the tables the callback read. With `trace_memory` (environment
+variable `VAR_SUMMARY_TRACE_MEMORY=1`) it also records the tracemalloc peak of each callback function; tracing slows
+every allocation down and concurrent callbacks of a worker add to each other's peaks, so it is meant for load tests.
+
+Each worker process keeps its own histograms and writes them to `<metrics_dir>/<pid>.json`, so the `/metrics`
+endpoint of any gunicorn worker reports the histograms and counters summed over all workers and the gauges of each
+worker with a `pid` label. The files of workers that exited are deleted, files not written for `stale_seconds` (e.g.
+left by a previous run whose pid was reused) are ignored.
+"""
+from bisect import bisect_left
+from threading import Lock
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from flask import g, request, Response, has_request_context
+
+
+default_metrics_dir = os.environ.get("VAR_SUMMARY_METRICS_DIR",
+                                     os.path.join(tempfile.gettempdir(), "var_summary_metrics"))
+
+seconds_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+bytes_buckets = [1e3, 1e4, 1e5, 1e6, 1e7, 1e8]
+rows_buckets = [10, 100, 1e3, 1e4, 1e5, 1e6, 1e7]
+columns_buckets = [1, 5, 10, 50, 100, 500, 1000, 5000]
+
+histograms = {
+    "callback_duration_seconds": ("Wall time of a callback request.", seconds_buckets),
+    "callback_function_seconds": ("Time spent in the callback function.", seconds_buckets),
+    "callback_serialize_seconds": ("Time spent outside the callback function, mostly response serialization.",
+                                   seconds_buckets),
+    "callback_table_load_seconds": ("Time spent materializing stored tables.", seconds_buckets),
+    "callback_request_bytes": ("Size of the callback request body.", bytes_buckets),
+    "callback_response_bytes": ("Size of the callback response body.", bytes_buckets),
+    "callback_table_rows": ("Rows of the tables read by a callback.", rows_buckets),
+    "callback_table_columns": ("Columns of the tables read by a callback.", columns_buckets),
+    "callback_peak_bytes": ("Peak memory allocated by the callback function (with trace_memory).", bytes_buckets),
+}
+
+
+class Metrics:
+    def __init__(self, metrics_dir = default_metrics_dir, flush_seconds = 1.0, stale_seconds = 86400,
+                 trace_memory = None):
+        """
+        parameter
+        ---------
+        metrics_dir   [string] The directory the worker processes write their metrics to.
+        flush_seconds [number] The minimum time between two writes of this process's metrics file.
+        stale_seconds [number] The files of other processes not written for this long are left out.
+        trace_memory  [boolean (Optional)] Record the allocation peak of the callbacks, defaults to the
+                      `VAR_SUMMARY_TRACE_MEMORY` environment variable.
+        """
+        self.metrics_dir = metrics_dir
+        self.flush_seconds = flush_seconds
+        self.stale_seconds = stale_seconds
+        self.trace_memory = (os.environ.get("VAR_SUMMARY_TRACE_MEMORY", "0") not in ["", "0"] if trace_memory is None
+                             else trace_memory)
+
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._collectors = []
+        self._flushed = 0.0
+        self._lock = Lock()
+
+        os.makedirs(metrics_dir, exist_ok = True)
+
+    # Recording ------------------------------------------------------------------------------------------------------
+    def observe(self, name, value, **labels):
+        """
+        Add a value to a histogram of `histograms`.
+        """
+        key = self._key(name, labels)
+        buckets = histograms[name][1]
+
+        with self._lock:
+            hist = self._histograms.setdefault(key, {"buckets": [0] * (len(buckets) + 1), "sum": 0.0, "count": 0})
+            hist["buckets"][bisect_left(buckets, value)] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def increment(self, name, value = 1, **labels):
+        with self._lock:
+            key = self._key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, collect):
+        """
+        Register a function returning a dictionary of {metric name: value}. The values are read when the metrics are
+        written, names ending with "_total" are reported as counters, the others as gauges.
+        """
+        self._collectors.append(collect)
+
+    # Worker files ---------------------------------------------------------------------------------------------------
+    def flush(self, force = False):
+        now = time.time()
+        if not force and now - self._flushed < self.flush_seconds:
+            return
+
+        for collect in self._collectors:
+            for name, value in collect().items():
+                with self._lock:
+                    target = self._counters if name.endswith("_total") else self._gauges
+                    target[self._key(name, {})] = value
+
+        with self._lock:
+            content = {"histograms": self._histograms, "counters": self._counters, "gauges": self._gauges}
+            path = os.path.join(self.metrics_dir, f"{os.getpid()}.json")
+            tmp_path = f"{path}.tmp"
+
+            with open(tmp_path, "w") as f:
+                json.dump(content, f)
+            os.replace(tmp_path, path)
+
+            self._flushed = now
+
+    def collect(self):
+        """
+        return
+        ------
+        The histograms and counters summed over the files of every live worker process, the gauges of each worker
+        with a `pid` label.
+        """
+        self.flush(force = True)
+        total = {"histograms": {}, "counters": {}, "gauges": {}}
+
+        for file_name in os.listdir(self.metrics_dir):
+            pid = file_name[:-len(".json")]
+            if not file_name.endswith(".json") or not pid.isdigit():
+                continue
+
+            path = os.path.join(self.metrics_dir, file_name)
+            try:
+                if int(pid) != os.getpid():
+                    if not self._alive(int(pid)):
+                        os.remove(path)
+                        continue
+                    if time.time() - os.path.getmtime(path) > self.stale_seconds:
+                        continue
+
+                with open(path) as f:
+                    content = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            for key, hist in content["histograms"].items():
+                summed = total["histograms"].setdefault(key, {"buckets": [0] * len(hist["buckets"]), "sum": 0.0,
+                                                              "count": 0})
+                summed["buckets"] = [a + b for a, b in zip(summed["buckets"], hist["buckets"])]
+                summed["sum"] += hist["sum"]
+                summed["count"] += hist["count"]
+
+            for key, value in content["counters"].items():
+                total["counters"][key] = total["counters"].get(key, 0) + value
+
+            for key, value in content["gauges"].items():
+                name, labels = json.loads(key)
+                total["gauges"][self._key(name, {**labels, "pid": pid})] = value
+
+        return total
+
+    def exposition(self):
+        """
+        return
+        ------
+        The metrics of every worker in the Prometheus text format.
+        """
+        total = self.collect()
+        lines = []
+
+        by_name = {}
+        for key, hist in total["histograms"].items():
+            by_name.setdefault(json.loads(key)[0], []).append((json.loads(key)[1], hist))
+
+        for name, series in sorted(by_name.items()):
+            help_text, buckets = histograms[name]
+            lines += [f"# HELP var_summary_{name} {help_text}", f"# TYPE var_summary_{name} histogram"]
+
+            for labels, hist in series:
+                cumulative = 0
+                for bound, count in zip(buckets + ["+Inf"], hist["buckets"]):
+                    cumulative += count
+                    lines.append(f"var_summary_{name}_bucket{self._labels({**labels, 'le': bound})} {cumulative}")
+                lines.append(f"var_summary_{name}_sum{self._labels(labels)} {hist['sum']}")
+                lines.append(f"var_summary_{name}_count{self._labels(labels)} {hist['count']}")
+
+        for kind, prom_type in [("counters", "counter"), ("gauges", "gauge")]:
+            by_name = {}
+            for key, value in total[kind].items():
+                name, labels = json.loads(key)
+                by_name.setdefault(name, []).append((labels, value))
+
+            for name, series in sorted(by_name.items()):
+                lines.append(f"# TYPE var_summary_{name} {prom_type}")
+                lines += [f"var_summary_{name}{self._labels(labels)} {value}" for labels, value in series]
+
+        return "\n".join(lines) + "\n"
+
+    # Dash and Flask -------------------------------------------------------------------------------------------------
+    def instrument_app(self, app, route = "/metrics"):
+        """
+        Time the callbacks registered on `app` from now on, measure its callback requests and serve the metrics
+        at `route`. Call it right after creating the app, before the callbacks are defined.
+        """
+        register = app.callback
+
+        def callback(*args, **kwargs):
+            decorator = register(*args, **kwargs)
+            return lambda fn: decorator(self.timed(fn))
+
+        app.callback = callback
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        server = app.server
+        server.before_request(self._start_request)
+        server.after_request(self._end_request)
+        server.add_url_rule(route, "metrics", lambda: Response(self.exposition(), mimetype = "text/plain; version=0.0.4"))
+
+    def timed(self, fn):
+        def wrapper(*args, **kwargs):
+            tracing = self.trace_memory and tracemalloc.is_tracing()
+            if tracing:
+                allocated, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if has_request_context():
+                    g.metrics_callback = fn.__name__
+                    g.metrics_function_seconds = time.perf_counter() - start
+                    if tracing:
+                        g.metrics_peak_bytes = max(tracemalloc.get_traced_memory()[1] - allocated, 0)
+
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+
+    def observe_table(self, version_id, df, seconds):
+        """
+        Record a table read from the dataset store during the current callback request.
+        """
+        if has_request_context():
+            g.metrics_tables = getattr(g, "metrics_tables", []) + [(df.shape[0], df.shape[1], seconds)]
+
+    @staticmethod
+    def _start_request():
+        g.metrics_start = time.perf_counter()
+
+    def _end_request(self, response):
+        if request.path.endswith("/_dash-update-component") and "metrics_start" in g:
+            name = getattr(g, "metrics_callback", None)
+
+            if name is not None:
+                wall = time.perf_counter() - g.metrics_start
+                function_seconds = g.metrics_function_seconds
+
+                self.observe("callback_duration_seconds", wall, callback = name)
+                self.observe("callback_function_seconds", function_seconds, callback = name)
+                self.observe("callback_serialize_seconds", max(wall - function_seconds, 0.0), callback = name)
+                self.observe("callback_request_bytes", request.content_length or 0, callback = name)
+                self.observe("callback_response_bytes", response.calculate_content_length() or 0, callback = name)
+
+                if "metrics_peak_bytes" in g:
+                    self.observe("callback_peak_bytes", g.metrics_peak_bytes, callback = name)
+
+                tables = getattr(g, "metrics_tables", [])
+                if tables != []:
+                    self.observe("callback_table_load_seconds", sum(seconds for _, _, seconds in tables),
+                                 callback = name)
+                for n_rows, n_columns, _ in tables:
+                    self.observe("callback_table_rows", n_rows, callback = name)
+                    self.observe("callback_table_columns", n_columns, callback = name)
+
+                self.increment("callback_requests_total", callback = name, status = str(response.status_code))
+                self.flush()
+
+        return response
+
+    # Internals ------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass                                         # alive, owned by another user.
+
+        return True
+
+    @staticmethod
+    def _key(name, labels):
+        return json.dumps([name, labels], sort_keys = True)
+
+    @staticmethod
+    def _labels(labels):
+        if labels == {}:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
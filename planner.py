@@ -0,0 +1,147 @@
+"""
+Cost based choice of how to compute a summary of `wrapper_summary()`.
+
+The cost of a summary is estimated from the number of rows, the classes of the selected variables, the number of
+unique values of its character variables and the output type, then the cheapest strategy that keeps the exact answer
+as far as possible within the latency budget is chosen:
+
+    exact    the whole table.
+    binned   plots of every point (scatter plots) get the numeric variables rounded to a grid of `bins` values and
+             duplicate points dropped. At plot resolution the picture is the same, only the overplotting is removed.
+    sampled  a uniform random sample small enough to fit the budget, the result is labelled with its margins of error.
+
+Aggregated outputs (tables, bar and line plots) are always exact: their size does not depend on the number of rows,
+counts and sums of a sample would be wrong and drawing the sample costs about as much as the aggregation it replaces.
+
+The costs per row were measured with `python -m benchmarks.summary`, and include building the figure, its JSON
+serialization and drawing it in the browser.
+"""
+import os
+
+from numpy import floor, float64
+
+
+default_latency_budget = float(os.environ.get("VAR_SUMMARY_LATENCY_BUDGET", "2.0"))
+
+# Seconds per row (and per selected variable for aggregates) of each kind of output.
+row_costs = {
+    "aggregate": 2e-7,
+    "histogram": 3e-6,
+    "datetime_histogram": 1.3e-5,
+    "scatter": 2e-6,
+}
+
+# Seconds per group of an aggregated output, e.g. per bar.
+group_cost = 1e-5
+
+min_sample_size = 10000
+
+
+def output_kind(classes, output_type):
+    """
+    parameter
+    ---------
+    classes     [list] The classes ('numeric', 'character' or 'datetime') of the selected variables.
+    output_type [string] 'plot' or 'table'.
+
+    return
+    ------
+    The kind of output `wrapper_summary()` creates: 'aggregate' when its size does not depend on the number of rows,
+    'histogram', 'datetime_histogram' or 'scatter' when it holds every row.
+    """
+    if output_type != "plot" or None in classes:
+        return "aggregate"
+
+    if classes == ["numeric"]:
+        return "histogram"
+    if classes == ["datetime"]:
+        return "datetime_histogram"
+    if len(classes) > 1 and sorted(classes) in [["numeric"] * len(classes), ["character", "numeric", "numeric"]]:
+        return "scatter"
+
+    return "aggregate"
+
+
+def plan_summary(n_rows, dtypes, nunique, summary_args, latency_budget = default_latency_budget, bins = 200):
+    """
+    parameter
+    ---------
+    n_rows         [integer] The number of rows of the table.
+    dtypes         [dictionary] The class of each variable, as in `custom_functions.table_schema()`.
+    nunique        [dictionary] The number of unique values of the character variables.
+    summary_args   [dictionary] The arguments of `wrapper_summary()`.
+    latency_budget [float] The time a summary should take, in seconds.
+    bins           [integer] The number of grid values of each numeric variable for the binned strategy.
+
+    return
+    ------
+    A dictionary with the `strategy`, the `estimated_seconds` of the exact summary and of the chosen strategy, the
+    `sample_size` (sampled) or `bins` (binned) and the `reason` of the choice.
+    """
+    variables = [var for var in [summary_args["first_variable"], summary_args["second_variable"],
+                                 summary_args["third_variable"]] if var is not None]
+    classes = [dtypes.get(var) for var in variables]
+    kind = output_kind(classes, summary_args["output_type"])
+
+    groups = 1
+    for var, cls in zip(variables, classes):
+        if cls == "character":
+            groups *= min(nunique.get(var, 1), summary_args.get("n_char_unique_value") or 10)
+
+    if kind == "aggregate":
+        exact_seconds = row_costs["aggregate"] * n_rows * len(variables) + group_cost * groups
+    else:
+        exact_seconds = row_costs[kind] * n_rows
+
+    plan = {"strategy": "exact", "kind": kind, "rows": n_rows, "estimated_seconds": exact_seconds,
+            "exact_seconds": exact_seconds, "latency_budget": latency_budget}
+
+    if exact_seconds <= latency_budget:
+        return {**plan, "reason": "within the latency budget"}
+
+    if kind == "aggregate":
+        return {**plan, "reason": "aggregates are computed on every row"}
+
+    if kind == "scatter":
+        n_numeric = classes.count("numeric")
+        n_points = min(n_rows, bins ** n_numeric * (groups if "character" in classes else 1))
+        binned_seconds = row_costs["aggregate"] * n_rows * len(variables) + row_costs["scatter"] * n_points
+
+        if binned_seconds <= latency_budget:
+            return {**plan, "strategy": "binned", "bins": bins, "estimated_seconds": binned_seconds,
+                    "reason": f"at most {n_points:,} distinct points after binning"}
+
+    per_row = exact_seconds / n_rows
+    sample_size = max(min_sample_size, int(latency_budget / per_row))
+
+    if sample_size >= n_rows:
+        return {**plan, "reason": "a sample would hold every row"}
+
+    return {**plan, "strategy": "sampled", "sample_size": sample_size, "estimated_seconds": per_row * sample_size,
+            "reason": "the exact summary exceeds the latency budget"}
+
+
+def bin_points(df, variables, bins = 200):
+    """
+    parameter
+    ---------
+    df        [pd.DataFrame]
+    variables [list] The selected variables, numeric ones are rounded to the middle of one of `bins` equal intervals.
+    bins      [integer]
+
+    return
+    ------
+    The selected variables of `df` with the numeric ones binned and the duplicated rows dropped.
+    """
+    variables = [var for var in variables if var is not None]
+    f_tbl = df[variables].copy()
+
+    for var in f_tbl.select_dtypes(["number"]).columns.to_list():
+        # The differences of small integer columns (int8 from `optimize_dtypes()`) overflow in their own type.
+        f_tbl[var] = f_tbl[var].astype(float64)
+        low, high = f_tbl[var].min(), f_tbl[var].max()
+        width = (high - low) / bins if high > low else 1
+
+        f_tbl[var] = low + (floor(((f_tbl[var] - low) / width).clip(upper = bins - 1)) + 0.5) * width
+
+    return f_tbl.drop_duplicates().reset_index(drop = True)
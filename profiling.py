@@ -0,0 +1,188 @@
+"""
+Opt-in profiling of the slow paths of the app.
+
+Profiling is off unless the environment variable `VAR_SUMMARY_PROFILE` is set: with `1` a single request asks for it
+(header `X-Profile: 1`), with `all` every call is profiled. When it is off the header is ignored and the `/profiles`
+routes are not served, a visitor can neither slow the app down nor read its profiles.
+
+Functions wrapped with `Profiler.wrap()` are run under cProfile and tracemalloc when profiling is requested. Each
+profiled call writes three files to the profile directory: the pstats dump (`.prof`, for snakeviz or
+`python -m pstats`), the 40 most expensive functions by cumulative time (`.txt`) and a summary with the wall time and
+the tracemalloc peak (`.json`). Only the most recent profiles are kept, `/profiles` lists them.
+"""
+from threading import Lock
+import cProfile
+import io
+import json
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+
+from flask import request, has_request_context, send_from_directory, abort
+
+
+default_profile_dir = os.environ.get("VAR_SUMMARY_PROFILE_DIR",
+                                     os.path.join(tempfile.gettempdir(), "var_summary_profiles"))
+
+profile_header = "X-Profile"
+
+
+class Profiler:
+    def __init__(self, profile_dir = default_profile_dir, keep = 50, enabled = None, always = None):
+        """
+        parameter
+        ---------
+        profile_dir [string] The directory the profiles are written to.
+        keep        [integer] The number of profiles to keep, older ones are deleted.
+        enabled     [boolean (Optional)] Honour the `X-Profile` header and serve the profiles, defaults to
+                    `VAR_SUMMARY_PROFILE` being set to `1` or `all`.
+        always      [boolean (Optional)] Profile every call, defaults to `VAR_SUMMARY_PROFILE` being set to `all`.
+        """
+        mode = os.environ.get("VAR_SUMMARY_PROFILE", "0")
+
+        self.profile_dir = profile_dir
+        self.keep = keep
+        self.always = mode == "all" if always is None else always
+        self.enabled = mode not in ["", "0"] if enabled is None else enabled or self.always
+
+        self._lock = Lock()          # cProfile can only profile one call of a process at a time.
+
+        if self.enabled:
+            os.makedirs(profile_dir, exist_ok = True)
+
+    def requested(self):
+        """
+        return
+        ------
+        True when profiling is enabled for every call or, when enabled, requested by the header of the current
+        request.
+        """
+        if self.always:
+            return True
+        if not self.enabled:
+            return False
+
+        return has_request_context() and request.headers.get(profile_header, "0") not in ["", "0"]
+
+    def wrap(self, name):
+        """
+        Decorator profiling a function when `requested()`. The wrapped function also accepts a `profile` keyword
+        argument to decide explicitly, e.g. in a background job started by a profiled request.
+        """
+        def decorator(fn):
+            def wrapper(*args, profile = None, **kwargs):
+                if not (self.requested() if profile is None else profile and self.enabled):
+                    return fn(*args, **kwargs)
+
+                return self.run(name, fn, *args, **kwargs)
+
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            return wrapper
+
+        return decorator
+
+    def run(self, name, fn, *args, **kwargs):
+        """
+        Call `fn` under cProfile and tracemalloc and save the profile under `name`.
+        """
+        if not self._lock.acquire(blocking = False):
+            return fn(*args, **kwargs)                   # another call of this process is being profiled.
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            if not tracing:
+                tracemalloc.stop()
+
+            try:
+                self._save(name, profiler, seconds, peak)
+            finally:
+                self._lock.release()
+
+    # Files ----------------------------------------------------------------------------------------------------------
+    def index(self):
+        """
+        return
+        ------
+        The summaries of the saved profiles, the most recent first.
+        """
+        entries = []
+
+        for file_name in os.listdir(self.profile_dir):
+            if file_name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.profile_dir, file_name)) as f:
+                        entries.append(json.load(f))
+                except (OSError, ValueError):
+                    pass
+
+        return sorted(entries, key = lambda entry: entry["time"], reverse = True)
+
+    def _save(self, name, profiler, seconds, peak):
+        base_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1e6) % 1000000:06d}-{name}-{os.getpid()}"
+        path = os.path.join(self.profile_dir, base_name)
+
+        profiler.dump_stats(path + ".prof")
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream = stream).sort_stats("cumulative").print_stats(40)
+        with open(path + ".txt", "w") as f:
+            f.write(stream.getvalue())
+
+        with open(path + ".json", "w") as f:
+            json.dump({"name": name, "file": base_name, "time": time.time(), "seconds": seconds,
+                       "peak_bytes": peak, "pid": os.getpid()}, f)
+
+        self._remove_old()
+
+    def _remove_old(self):
+        entries = self.index()
+
+        for entry in entries[self.keep:]:
+            for ext in [".json", ".prof", ".txt"]:
+                try:
+                    os.remove(os.path.join(self.profile_dir, entry["file"] + ext))
+                except OSError:
+                    pass
+
+    # Flask ----------------------------------------------------------------------------------------------------------
+    def add_routes(self, server, route = "/profiles"):
+        """
+        Serve an index of the recent profiles at `route` and their files at `route/<file name>`, only when profiling
+        is enabled.
+        """
+        if not self.enabled:
+            return
+
+        def profile_index():
+            rows = "".join(
+                f"<tr><td>{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['time']))}</td>"
+                f"<td>{entry['name']}</td><td>{entry['seconds']:.3f}</td><td>{entry['peak_bytes'] / 1e6:.1f}</td>"
+                f"<td><a href='{route}/{entry['file']}.txt'>text</a> | <a href='{route}/{entry['file']}.prof'>pstats</a></td></tr>"
+                for entry in self.index()
+            )
+            return (f"<html><body><h3>Recent profiles</h3><table border='1' cellpadding='4'>"
+                    f"<tr><th>Time</th><th>Function</th><th>Seconds</th><th>Peak MB</th><th>Files</th></tr>{rows}"
+                    f"</table></body></html>")
+
+        def profile_file(file_name):
+            if not file_name.endswith((".txt", ".prof")):
+                abort(404)
+            return send_from_directory(self.profile_dir, file_name, mimetype = "text/plain" if file_name.endswith(".txt")
+                                       else "application/octet-stream")
+
+        server.add_url_rule(route, "profile_index", profile_index)
+        server.add_url_rule(f"{route}/<file_name>", "profile_file", profile_file)
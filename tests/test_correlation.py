@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import correlation as corr
+
+
+@pytest.fixture(scope = "module")
+def measures():
+    rng = np.random.default_rng(0)
+    n_rows = 500
+
+    base = rng.normal(size = n_rows)
+    df = pd.DataFrame({f"x{i}": base * rng.uniform(-1, 1) + rng.normal(size = n_rows) for i in range(12)})
+    df["constant"] = 1.0
+    df["exp"] = np.exp(df["x0"]) + rng.normal(scale = 0.5, size = n_rows)
+
+    return df
+
+
+def with_missing(df, seed = 1, fraction = 0.1):
+    rng = np.random.default_rng(seed)
+    return df.mask(rng.random(df.shape) < fraction)
+
+
+def test_pearson_matches_pandas(measures):
+    df = with_missing(measures)
+    columns = df.columns.to_list()
+
+    pd.testing.assert_frame_equal(corr.correlation_frame(corr.column_values(df, columns), columns), df.corr(),
+                                  rtol = 1e-9, atol = 1e-12)
+
+
+def test_spearman_matches_pandas(measures):
+    columns = measures.columns.to_list()
+    values = corr.column_values(measures, columns, method = "spearman")
+
+    pd.testing.assert_frame_equal(corr.correlation_frame(values, columns), measures.corr(method = "spearman"),
+                                  rtol = 1e-9, atol = 1e-12)
+
+
+def test_pairs_without_enough_rows_are_missing():
+    df = pd.DataFrame({"a": [1.0, 2.0, np.nan, np.nan], "b": [np.nan, 1.0, 2.0, 3.0], "c": [1.0, 3.0, 2.0, 4.0]})
+    values = corr.pearson_matrix(corr.numeric_values(df))
+
+    assert np.isnan(values[0, 1])
+    np.testing.assert_allclose(values[1:, 1:], df[["b", "c"]].corr().to_numpy())
+
+
+def brute_force_pairs(df, method, k, threshold = None):
+    full = df.corr(method = method)
+    columns = full.columns.to_list()
+
+    pairs = [(columns[i], columns[j], full.iat[i, j]) for i in range(len(columns))
+             for j in range(i + 1, len(columns)) if not np.isnan(full.iat[i, j])]
+    if threshold is not None:
+        pairs = [pair for pair in pairs if abs(pair[2]) >= threshold]
+
+    return sorted(pairs, key = lambda pair: -abs(pair[2]))[:k]
+
+
+@pytest.mark.parametrize("block_size", [3, 5, 256])
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+def test_top_correlations_match_brute_force(measures, method, block_size):
+    df = measures if method == "spearman" else with_missing(measures)
+
+    pairs, corr_mtx = corr.top_correlations(df, method = method, k = 10, block_size = block_size)
+    expected = brute_force_pairs(df, method, k = 10)
+
+    assert [set(pair) for pair in zip(pairs["Variable 1"], pairs["Variable 2"])] == \
+           [{var_1, var_2} for var_1, var_2, _ in expected]
+    np.testing.assert_allclose(pairs["Correlation"], [value for _, _, value in expected], rtol = 1e-9)
+
+    involved = corr_mtx.columns.to_list()
+    pd.testing.assert_frame_equal(corr_mtx, df[involved].corr(method = method), rtol = 1e-9, atol = 1e-12)
+
+
+def test_top_correlations_threshold(measures):
+    pairs, _ = corr.top_correlations(measures, k = 50, threshold = 0.5, block_size = 4)
+    expected = brute_force_pairs(measures, "pearson", k = 50, threshold = 0.5)
+
+    assert len(pairs) == len(expected)
+    assert (pairs["Correlation"].abs() >= 0.5).all()
+    assert "constant" not in pairs[["Variable 1", "Variable 2"]].to_numpy()
@@ -0,0 +1,111 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset_store import DatasetStore, SharedDatasetStore
+
+
+def sales(n_rows = 1000, seed = 0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"Branch": pd.Categorical(rng.choice(["A", "B", "C"], n_rows)),
+                         "City": rng.choice(["Yangon", "Mandalay"], n_rows).astype(object),
+                         "Price": rng.normal(50, 10, n_rows),
+                         "Date": pd.date_range("2019-01-01", periods = n_rows, freq = "h")})
+
+
+@pytest.fixture(params = ["memory", "shared"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return DatasetStore(spill_dir = str(tmp_path / "spill"), memory_budget = None)
+    return SharedDatasetStore(segment_dir = str(tmp_path / "segments"))
+
+
+def test_commit_keeps_every_version(store):
+    df = sales()
+    root_id = store.create(df)
+
+    cleaned = df[df["Price"] > 50].reset_index(drop = True)
+    version_id = store.commit(root_id, cleaned, description = "Filter rows")
+
+    pd.testing.assert_frame_equal(store.get(root_id), df)
+    pd.testing.assert_frame_equal(store.get(version_id), cleaned)
+    assert store.history(version_id) == ["Upload", "Filter rows"]
+
+
+def test_unchanged_columns_are_shared(store):
+    df = sales()
+    root_id = store.create(df)
+    version_id = store.commit(root_id, df.assign(Price = df["Price"] * 2))
+
+    root_keys = dict(store.version(root_id).columns)
+    version_keys = dict(store.version(version_id).columns)
+
+    assert [var for var in df.columns if root_keys[var] == version_keys[var]] == ["Branch", "City", "Date"]
+
+
+def test_undo_and_redo(store):
+    df = sales()
+    root_id = store.create(df)
+    first_id = store.commit(root_id, df.drop(columns = "City"), description = "Drop City")
+    second_id = store.commit(first_id, df.drop(columns = ["City", "Date"]), description = "Drop Date")
+
+    assert store.undo(second_id) == first_id
+    assert store.undo(first_id) == root_id
+    assert store.undo(root_id) is None
+
+    assert store.redo(root_id) == first_id
+    assert store.redo(first_id) == second_id
+    assert store.redo(second_id) is None
+
+    # A new step from an undone version replaces the redo.
+    other_id = store.commit(root_id, df.drop(columns = "Price"), description = "Drop Price")
+    assert store.redo(root_id) == other_id
+
+
+def test_unknown_parent_is_rejected(store):
+    store.create(sales())
+
+    with pytest.raises(KeyError):
+        store.commit("0" * 32, sales())
+
+    root_id = store.create(sales())
+    store.drop_dataset(root_id)
+
+    assert store.get(root_id) is None
+    with pytest.raises(KeyError):
+        store.commit(root_id, sales())
+
+
+def test_spilled_datasets_are_reloaded(tmp_path):
+    spill_dir = tmp_path / "spill"
+    frames = [sales(seed = seed) for seed in range(3)]
+
+    store = DatasetStore(max_frames = 1, memory_budget = 1, spill_dir = str(spill_dir))
+    root_ids = [store.create(df) for df in frames]
+
+    # Only the most recently used dataset stays in memory.
+    assert store.stats["spilled"] == 2
+    assert store.column_nbytes() <= sum(df.memory_usage(index = False, deep = True).sum() for df in frames) / 2
+    assert os.listdir(spill_dir) != []
+
+    for root_id, df in zip(root_ids, frames):
+        pd.testing.assert_frame_equal(store.get(root_id), df)
+
+    assert store.stats["reloaded"] >= 2
+
+    for root_id in root_ids:
+        store.drop_dataset(root_id)
+    assert os.listdir(spill_dir) == []
+
+
+def test_unused_datasets_expire(tmp_path):
+    store = DatasetStore(spill_dir = str(tmp_path), memory_budget = None, ttl_seconds = 60)
+    root_ids = [store.create(sales(seed = seed)) for seed in range(2)]
+
+    assert store.expire(now = time.time() + 30) == 0
+    assert store.expire(now = time.time() + 120) == 2
+    assert not any(root_id in store for root_id in root_ids)
+    assert store.stats["expired"] == 2
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+import component_functions as comp_fun
+import custom_functions as cf
+
+
+@pytest.fixture
+def sales():
+    return pd.DataFrame({"City": ["Yangon", "Mandalay", "Naypyitaw", "Yangon", None, "Mandalay"],
+                         "Quantity": [1, 5, 3, 10, 7, 2]})
+
+
+@pytest.mark.parametrize("filter_query", ["{City} > 'Mandalay'", "{City} < 'Yangon'", "{City} >= 'Naypyitaw'",
+                                          "{City} <= 'Mandalay'", "{City} = 'Yangon'", "{City} != 'Yangon'",
+                                          "{City} contains 'an'", "{City} > 'Mandalay' && {Quantity} gt 2",
+                                          "{City} > 5"])
+def test_category_columns_filter_as_text(sales, filter_query):
+    compact, info = cf.optimize_dtypes(sales, max_unique_ratio = 1.0)
+    assert info["columns"]["City"] == ["object", "category"]
+
+    expected = comp_fun.filter_rows(sales, filter_query)
+    assert comp_fun.filter_rows(compact, filter_query).tolist() == expected.tolist()
+
+
+def test_category_comparison_keeps_matching_rows(sales):
+    compact, _ = cf.optimize_dtypes(sales, max_unique_ratio = 1.0)
+
+    assert comp_fun.filter_rows(compact, "{City} > 'Mandalay'").tolist() == [True, False, True, True, False, False]
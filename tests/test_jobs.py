@@ -0,0 +1,156 @@
+import json
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import JobManager
+
+
+def wait_for(condition, timeout = 10):
+    stop = time.time() + timeout
+    while not condition():
+        if time.time() > stop:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(job_dir = str(tmp_path / "jobs"), max_workers = 1, poll_seconds = 0.05)
+    release = threading.Event()
+
+    @manager.task("block")
+    def block(progress):
+        release.wait(10)
+        return "released"
+
+    @manager.task("echo")
+    def echo(value, progress):
+        progress(1, 1, rows = 1, message = "Echoed")
+        return value
+
+    @manager.task("sleep", executor = "process")
+    def sleep(seconds, progress):
+        time.sleep(seconds)
+        return seconds
+
+    manager.release = release
+    yield manager
+    release.set()
+
+
+def state(manager, job_id):
+    return (manager.status(job_id) or {}).get("status")
+
+
+def test_job_runs_to_the_end(manager):
+    job_id = manager.submit("echo", value = [1, 2])
+
+    wait_for(lambda: state(manager, job_id) == "done")
+    assert manager.result(job_id) == [1, 2]
+    assert manager.status(job_id)["message"] == "Done"
+
+
+def test_queued_job_is_cancelled(manager):
+    blocking_id = manager.submit("block")
+    wait_for(lambda: state(manager, blocking_id) == "running")
+
+    job_id = manager.submit("echo", value = 1)
+    assert manager.cancel(job_id)
+    assert state(manager, job_id) == "cancelled"
+
+    manager.release.set()
+    wait_for(lambda: state(manager, blocking_id) == "done")
+    assert state(manager, job_id) == "cancelled"
+    assert manager.metrics()["cancelled_queued"] == 1
+
+
+def test_new_job_supersedes_the_previous_one_of_its_slot(manager):
+    blocking_id = manager.submit("block")
+    wait_for(lambda: state(manager, blocking_id) == "running")
+
+    first_id = manager.submit("echo", session = "a", slot = "summary", value = 1)
+    other_id = manager.submit("echo", session = "b", slot = "summary", value = 2)
+    second_id = manager.submit("echo", session = "a", slot = "summary", value = 3)
+
+    assert state(manager, first_id) == "cancelled"
+
+    manager.release.set()
+    wait_for(lambda: state(manager, second_id) == "done" and state(manager, other_id) == "done")
+    assert manager.result(second_id) == 3
+
+
+@pytest.mark.skipif(not jobs.can_fork, reason = "process tasks need fork")
+def test_running_process_job_is_cancelled(manager):
+    job_id = manager.submit("sleep", session = "a", slot = "summary", seconds = 30)
+    wait_for(lambda: job_id in manager._processes)
+
+    started = time.time()
+    assert manager.cancel_slot("a", "summary")
+    wait_for(lambda: state(manager, job_id) == "cancelled")
+
+    assert time.time() - started < 5
+    assert manager.metrics()["cancelled_running"] == 1
+
+
+@pytest.mark.skipif(not jobs.can_fork, reason = "process tasks need fork")
+def test_running_job_is_cancelled_by_another_worker(manager):
+    job_id = manager.submit("sleep", seconds = 30)
+    wait_for(lambda: job_id in manager._processes)
+
+    other = JobManager(job_dir = manager.job_dir, max_workers = 1)
+    other.task("sleep", executor = "process")(lambda seconds, progress: seconds)
+
+    assert other.cancel(job_id)
+    wait_for(lambda: state(manager, job_id) == "cancelled")
+    assert manager.metrics()["cancelled_running"] == 1
+
+
+def test_jobs_of_a_dead_process_are_failed(tmp_path):
+    job_dir = tmp_path / "jobs"
+    manager = JobManager(job_dir = str(job_dir))
+
+    job_id = "a" * 32
+    (job_dir / "queue" / f"{job_id}.json").write_text(json.dumps({"job_id": job_id, "task": "echo", "kwargs": {},
+                                                                  "pid": dead_pid()}))
+    manager._write_status(job_id, {"status": "queued", "submitted": time.time()})
+
+    assert manager.fail_orphans() == 1
+    assert state(manager, job_id) == "failed"
+    assert not (job_dir / "queue" / f"{job_id}.json").exists()
+
+    # A restarted worker fails them as it starts.
+    running_id = "b" * 32
+    (job_dir / "running" / f"{running_id}.json").write_text(json.dumps({"job_id": running_id, "pid": dead_pid()}))
+    manager._write_status(running_id, {"status": "running", "started": time.time()})
+
+    JobManager(job_dir = str(job_dir))
+    assert state(manager, running_id) == "failed"
+
+
+def test_lost_jobs_fail_after_the_timeout(tmp_path):
+    manager = JobManager(job_dir = str(tmp_path / "jobs"), timeout_seconds = 60)
+
+    job_id = "c" * 32
+    manager._write_status(job_id, {"status": "running", "started": time.time() - 30})
+    assert state(manager, job_id) == "running"
+
+    manager._write_status(job_id, {"status": "running", "started": time.time() - 120})
+    assert state(manager, job_id) == "failed"
+
+
+def test_invalid_job_ids_are_rejected(manager):
+    assert manager.status("../../etc/passwd") is None
+
+    with pytest.raises(ValueError):
+        manager.result("../results/x")
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import custom_functions as cf
+
+
+@pytest.fixture(scope = "module")
+def prices():
+    rng = np.random.default_rng(0)
+    n_rows = 2_000_000
+
+    return pd.DataFrame({"Branch": rng.choice(["A", "B", "C"], n_rows),
+                         "Price": rng.integers(0, 200, n_rows) + 0.5,
+                         "Quantity": rng.integers(1, 10, n_rows)})
+
+
+def as_text(df):
+    return df.astype({var: object for var in df.columns if isinstance(df[var].dtype, pd.CategoricalDtype)})
+
+
+def test_floats_are_kept_in_float64(prices):
+    compact, info = cf.optimize_dtypes(prices)
+
+    assert compact["Price"].dtype == "float64"
+    assert info["columns"]["Branch"] == ["object", "category"]
+    assert compact["Quantity"].dtype == "int8"
+    assert compact["Price"].sum() == prices["Price"].sum()
+
+
+@pytest.mark.parametrize("variables", [{"first_variable": "Branch", "second_variable": "Price"},
+                                       {"first_variable": "Branch", "second_variable": "Quantity"}])
+@pytest.mark.parametrize("num_agg_type", ["sum", "mean"])
+def test_summaries_match_the_uploaded_table(prices, variables, num_agg_type):
+    compact, _ = cf.optimize_dtypes(prices)
+
+    expected = cf.wrapper_summary(w_df = prices, num_agg_type = num_agg_type, output_type = "table", **variables)
+    result = cf.wrapper_summary(w_df = compact, num_agg_type = num_agg_type, output_type = "table", **variables)
+
+    pd.testing.assert_frame_equal(as_text(result), expected, check_dtype = False, rtol = 0, atol = 0)
+
+
+def test_numeric_description_matches_the_uploaded_table(prices):
+    compact, _ = cf.optimize_dtypes(prices)
+
+    expected = cf.wrapper_summary(w_df = prices, first_variable = "Price", output_type = "table")
+    pd.testing.assert_frame_equal(cf.wrapper_summary(w_df = compact, first_variable = "Price", output_type = "table"),
+                                  expected, rtol = 0, atol = 0)
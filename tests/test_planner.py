@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import planner
+
+
+dtypes = {"Branch": "character", "City": "character", "Price": "numeric", "Quantity": "numeric", "Date": "datetime"}
+nunique = {"Branch": 3, "City": 1000}
+
+
+def summary_args(first_variable, second_variable = None, third_variable = None, output_type = "plot"):
+    return {"first_variable": first_variable, "second_variable": second_variable, "third_variable": third_variable,
+            "output_type": output_type, "n_char_unique_value": 10}
+
+
+@pytest.mark.parametrize("args", [summary_args("Price"), summary_args("Price", "Quantity"), summary_args("Date"),
+                                  summary_args("Branch", "Price")])
+def test_small_tables_are_exact(args):
+    plan = planner.plan_summary(1000, dtypes, nunique, args, latency_budget = 2.0)
+
+    assert plan["strategy"] == "exact"
+    assert plan["estimated_seconds"] == plan["exact_seconds"]
+
+
+@pytest.mark.parametrize("args", [summary_args("Branch", "Price"), summary_args("City"),
+                                  summary_args("Price", output_type = "table"),
+                                  summary_args("Price", "Quantity", output_type = "table")])
+def test_aggregates_are_always_exact(args):
+    plan = planner.plan_summary(10 ** 9, dtypes, nunique, args, latency_budget = 0.1)
+
+    assert plan["kind"] == "aggregate"
+    assert plan["strategy"] == "exact"
+    assert plan["exact_seconds"] > plan["latency_budget"]
+
+
+@pytest.mark.parametrize("args, kind", [(summary_args("Price"), "histogram"),
+                                        (summary_args("Date"), "datetime_histogram")])
+def test_large_histograms_are_sampled(args, kind):
+    plan = planner.plan_summary(10 ** 8, dtypes, nunique, args, latency_budget = 2.0)
+
+    assert plan["kind"] == kind
+    assert plan["strategy"] == "sampled"
+    assert planner.min_sample_size <= plan["sample_size"] < 10 ** 8
+    assert plan["estimated_seconds"] <= plan["latency_budget"]
+
+
+def test_large_scatter_plots_are_binned():
+    plan = planner.plan_summary(2 * 10 ** 6, dtypes, nunique, summary_args("Price", "Quantity"), latency_budget = 2.0,
+                                bins = 100)
+
+    assert plan["kind"] == "scatter"
+    assert plan["strategy"] == "binned"
+    assert plan["bins"] == 100
+    assert plan["estimated_seconds"] < plan["exact_seconds"]
+
+
+def test_scatter_plots_too_large_to_bin_are_sampled():
+    plan = planner.plan_summary(10 ** 9, dtypes, nunique, summary_args("Price", "Quantity"), latency_budget = 2.0)
+
+    assert plan["kind"] == "scatter"
+    assert plan["strategy"] == "sampled"
+
+
+def test_no_sample_smaller_than_the_minimum():
+    n_rows = planner.min_sample_size + 1000
+    plan = planner.plan_summary(n_rows, dtypes, nunique, summary_args("Date"), latency_budget = 1e-6)
+
+    assert plan["strategy"] == "sampled"
+    assert plan["sample_size"] == planner.min_sample_size
+
+    plan = planner.plan_summary(planner.min_sample_size, dtypes, nunique, summary_args("Date"), latency_budget = 1e-6)
+    assert plan["strategy"] == "exact"
+
+
+def test_bin_points_keeps_the_range_and_drops_duplicates():
+    df = pd.DataFrame({"Branch": ["A", "B"] * 500, "Quantity": (np.arange(1000) % 100).astype("int8"),
+                       "Price": np.linspace(0, 1, 1000)})
+
+    binned = planner.bin_points(df, ["Branch", "Quantity", "Price"], bins = 10)
+
+    assert len(binned) < len(df)
+    assert not binned.duplicated().any()
+    assert binned["Price"].between(0, 1).all()
+    assert binned["Quantity"].between(0, 99).all()
@@ -1,27 +1,124 @@
 import dash
 import pandas as pd
-from dash import Input, Output, State, dcc, html, dash_table, ctx
+from dash import Input, Output, State, ClientsideFunction, dcc, html, dash_table, ctx
 import dash_bootstrap_components as dbc
 from dash.dash_table.Format import Format, Scheme, Group
 
 import datetime
 import base64
 import io
+import json
+import os
+import uuid
+from collections import OrderedDict
+from stat import S_ISDIR
+from threading import Lock
 
 import custom_functions as cf
 import component_functions as comp_fun
+from dataset_store import DatasetStore, SharedDatasetStore, write_atomic
+from jobs import JobManager
+from metrics import Metrics
+from profiling import Profiler
+import planner
+from correlation import CorrelationCache, correlation_frame, column_values, top_correlations, max_matrix_columns
+
+
+# Demo data, read on the first "Use Demo Data" click rather than at import. The parsed table is cached as a pickle so
+# the other workers and later restarts skip the CSV parser. Loading a pickle runs code, the cache is only used in a
+# directory no other user can write to (VAR_SUMMARY_CACHE_DIR).
+demo_path = "m_sales.csv"
+demo_df = None
+cache_dir = os.environ.get("VAR_SUMMARY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "var_summary"))
+
+
+def private_dir(path):
+    """
+    Create the directory `path` for the current user only.
+
+    return
+    ------
+    `path`, or None when it can not be created or another user owns it or can write to it.
+    """
+    try:
+        os.makedirs(path, mode = 0o700, exist_ok = True)
+        stat = os.lstat(path)
+    except OSError:
+        return None
+
+    if not S_ISDIR(stat.st_mode):
+        return None
+    if hasattr(os, "getuid") and (stat.st_uid != os.getuid() or stat.st_mode & 0o022):
+        return None
+
+    return path
+
+
+def configured_workers():
+    """
+    return
+    ------
+    The number of gunicorn workers set by WEB_CONCURRENCY or by `-w` / `--workers` in GUNICORN_CMD_ARGS, 1 if neither.
+    """
+    args = os.environ.get("GUNICORN_CMD_ARGS", "").replace("=", " ").split()
+    workers = os.environ.get("WEB_CONCURRENCY", "1")
+
+    for flag, value in zip(args, args[1:]):
+        if flag in ["-w", "--workers"]:
+            workers = value
+
+    try:
+        return int(workers)
+    except ValueError:
+        return 1
+
 
+# Uploaded and cleaned tables, the `dcc.Store` components only hold version ids. A version id only exists in the
+# process that created it, so with several gunicorn workers the tables are kept in memory mapped files shared by the
+# workers (VAR_SUMMARY_SHARED_STORE, on by default when more than one worker is configured). Otherwise datasets past
+# VAR_SUMMARY_MEMORY_BUDGET bytes are spilled to disk, least recently used first. Datasets unused for
+# VAR_SUMMARY_DATASET_TTL seconds are deleted in both cases.
+shared_store = os.environ.get("VAR_SUMMARY_SHARED_STORE", "1" if configured_workers() > 1 else "0") not in ["", "0"]
+if not shared_store and configured_workers() > 1:
+    raise RuntimeError(f"VAR_SUMMARY_SHARED_STORE is off with {configured_workers()} workers: the workers would not "
+                       f"see each other's datasets. Turn it on or run a single worker.")
 
-# Read Demo data.
-demo_df = pd.read_csv("m_sales.csv")
+datasets = SharedDatasetStore() if shared_store else DatasetStore()
+
+# Cleaning and summaries run as background jobs, the page polls for their progress and result.
+jobs = JobManager()
+job_poll_interval = 500
+
+# Summaries started speculatively once the variables are selected, by summary key, so Run is usually a cache hit.
+speculative_jobs = OrderedDict()
+speculative_lock = Lock()
+max_speculative_jobs = 32
+
+# Full correlation matrices of recent versions, a subset of variables is a slice of the cached matrix.
+correlations = CorrelationCache()
 
 app = dash.Dash(__name__, external_stylesheets = [dbc.themes.LUX], suppress_callback_exceptions=True)
 server = app.server
 
+# Latency and payload histograms of every callback, served at /metrics in the Prometheus text format.
+metrics = Metrics()
+metrics.instrument_app(app)
+metrics.add_collector(lambda: {f"jobs_{name}_total" if name not in ["running_processes", "queued"] else f"jobs_{name}": value
+                               for name, value in jobs.metrics().items()})
+metrics.add_collector(lambda: {f"datasets_{name}_total" if name in ["spilled", "reloaded", "expired", "spilled_bytes"]
+                               else f"datasets_{name}": value for name, value in datasets.metrics().items()})
+datasets.observer = metrics.observe_table
+
+# cProfile and tracemalloc of the slow paths, off unless VAR_SUMMARY_PROFILE is set: "1" to profile the requests with
+# an "X-Profile: 1" header, "all" to profile every call. The profiles are served at /profiles only then.
+profiler = Profiler()
+profiler.add_routes(server)
+
 # Tabs =================================================================================================================
 # Upload Tab ---------------------------------------------------------------------------------------------------------|-
 tab_data_choice = dbc.Tab(
     id = "tab_data_choice",
+    tab_id = "tab_data_choice",
     label = "Data Choice",
     tab_class_name = "tab-style-23",
     active_tab_class_name = "tab-selected",
@@ -80,7 +177,7 @@ tab_data_choice = dbc.Tab(
                     children=dbc.Col(
                         [
                             html.Div(
-                                dcc.Store(id="store_data"),
+                                [dcc.Store(id="store_data"), dcc.Store(id="store_schema"), dcc.Store(id="check_data")],
                             ),
 
                             html.Div(
@@ -173,6 +270,13 @@ tab_data_inpection = dbc.Tab(
                                                                         dbc.Button(
                                                                             id="missing_values",
                                                                             children="Check Missing Values",
+                                                                        ),
+
+                                                                        html.Br(),
+
+                                                                        dbc.Button(
+                                                                            id="memory_usage",
+                                                                            children="Check Memory Usage",
                                                                         )
                                                                     ],
                                                                     vertical=True
@@ -405,6 +509,27 @@ tab_data_cleaning = dbc.Tab(
                                                     html.Br(),
                                                     html.Br(),
 
+                                                    html.Div(
+                                                        [
+                                                            html.H6("Preview Rows"),
+                                                            dbc.RadioItems(
+                                                                id="preview_sample_type",
+                                                                options=[
+                                                                    {"label": "First rows", "value": "head"},
+                                                                    {"label": "Stratified sample", "value": "stratified"}
+                                                                ],
+                                                                value="head",
+                                                            ),
+                                                            dbc.Input(
+                                                                id="preview_n_rows",
+                                                                type="number",
+                                                                min=10, value=100,
+                                                            ),
+                                                        ]
+                                                    ),
+
+                                                    html.Br(),
+
                                                     html.Div(
                                                         [
                                                             dbc.Button(
@@ -413,9 +538,30 @@ tab_data_cleaning = dbc.Tab(
                                                                 color="success",
                                                                 class_name="me-1"
                                                             ),
+                                                            dbc.ButtonGroup(
+                                                                [
+                                                                    dbc.Button(
+                                                                        children="Undo",
+                                                                        id="undo_clean",
+                                                                        outline=True,
+                                                                        color="secondary",
+                                                                    ),
+                                                                    dbc.Button(
+                                                                        children="Redo",
+                                                                        id="redo_clean",
+                                                                        outline=True,
+                                                                        color="secondary",
+                                                                    ),
+                                                                ],
+                                                                class_name="me-1"
+                                                            ),
                                                         ],
                                                         className="d-grid gap-2",
-                                                    )
+                                                    ),
+
+                                                    html.Br(),
+
+                                                    dcc.Markdown(id="cleaning_history", className="card-text"),
                                                 ]
                                             )
                                         ],
@@ -433,6 +579,9 @@ tab_data_cleaning = dbc.Tab(
                                     [
                                         html.Label("Data Preview", className="label-header"),
                                         html.Hr(),
+                                        html.Div(id="clean_progress"),
+                                        dcc.Store(id="clean_job"),
+                                        dcc.Interval(id="clean_poll", interval=job_poll_interval, disabled=True),
                                         dcc.Loading(
                                             id="data_cleaning_spinner",
                                             color="black",
@@ -597,6 +746,27 @@ tab_data_summary = dbc.Tab(
                                                                                 )
                                                                             ],
                                                                             title = "Unique Character Values"
+                                                                        ),
+
+                                                                        dbc.AccordionItem(
+                                                                            [
+                                                                                html.P("Summarize a random sample of large tables, "
+                                                                                       "Display Exactly uses every row."),
+                                                                                dbc.Checklist(
+                                                                                    id="approximate_mode",
+                                                                                    options=[{"label": "Use a sample", "value": "sample"}],
+                                                                                    value=[],
+                                                                                    switch=True,
+                                                                                ),
+                                                                                html.Br(),
+                                                                                html.P("Sample size (rows)"),
+                                                                                dbc.Input(
+                                                                                    id="sample_size",
+                                                                                    type="number",
+                                                                                    min=1000, step=1000, value=100000,
+                                                                                )
+                                                                            ],
+                                                                            title = "Approximate Mode"
                                                                         )
                                                                     ],
                                                                     start_collapsed=True,
@@ -639,6 +809,14 @@ tab_data_summary = dbc.Tab(
                                                                     id="run_summary",
                                                                     color="success",
                                                                     class_name="me-1"
+                                                                ),
+
+                                                                dbc.Button(
+                                                                    children="Display Exactly",
+                                                                    id="run_exact_summary",
+                                                                    color="success",
+                                                                    outline=True,
+                                                                    class_name="me-1"
                                                                 )
                                                             ],
                                                             className="d-grid gap-2",
@@ -659,6 +837,9 @@ tab_data_summary = dbc.Tab(
                             children=[
                                 html.Div(
                                     [
+                                        html.Div(id="summary_progress"),
+                                        dcc.Store(id="summary_job"),
+                                        dcc.Interval(id="summary_poll", interval=job_poll_interval, disabled=True),
                                         dcc.Loading(
                                             id="summary_spinner",
                                             color="black",
@@ -667,6 +848,7 @@ tab_data_summary = dbc.Tab(
                                             ]
                                         ),
                                         dcc.Store(id="summary_data"),
+                                        dcc.Store(id="summary_schema"),
                                     ],
                                     className= "div-card"
                                 ),
@@ -693,40 +875,49 @@ tab_data_summary = dbc.Tab(
 
 
 # Layout ===============================================================================================================
-app.layout = html.Div(
-    children = [
-        dbc.Row(
-            html.Div(
+def serve_layout():
+    # A new session id for every page load, background jobs are registered per session.
+    return html.Div(
+        children = [
+            dcc.Store(id = "session_id", data = uuid.uuid4().hex),
+
+            dbc.Row(
                 html.Div(
-                    html.H3("Data Variable Summary", className = "header-H2"),
-                    className = "header-inner"
-                ),
+                    html.Div(
+                        html.H3("Data Variable Summary", className = "header-H2"),
+                        className = "header-inner"
+                    ),
+                )
+            ),
+
+            dbc.Row(
+                children = [
+                    html.Div(
+                        [
+                            dbc.Tabs(
+                                id = "top_tab",
+                                active_tab = "tab_data_choice",
+                                children = [
+                                    tab_data_choice,
+                                    tab_data_inpection,
+                                    tab_data_cleaning,
+                                    tab_data_summary
+                                ]
+                            )
+                        ]
+                    ),
+                ]
             )
-        ),
+        ],
+        className= "body-background",
+    )
 
-        dbc.Row(
-            children = [
-                html.Div(
-                    [
-                        dbc.Tabs(
-                            id = "top_tab",
-                            children = [
-                                tab_data_choice,
-                                tab_data_inpection,
-                                tab_data_cleaning,
-                                tab_data_summary
-                            ]
-                        )
-                    ]
-                ),
-            ]
-        )
-    ],
-    className= "body-background",
-)
+
+app.layout = serve_layout
 
 
 # Output Functions =====================================================================================================
+@profiler.wrap("parse_contents")
 def parse_contents(contents, filename, date):
     content_type, content_string = contents.split(",")
 
@@ -734,7 +925,7 @@ def parse_contents(contents, filename, date):
 
     try:
         if "csv" in filename:
-            u_data = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
+            u_data = pd.read_csv(io.BytesIO(decoded), encoding = "utf-8")
         elif "xls" in filename:
             u_data = pd.read_excel(io.BytesIO(decoded))
 
@@ -745,6 +936,102 @@ def parse_contents(contents, filename, date):
     return u_data
 
 
+def demo_data():
+    global demo_df
+
+    if demo_df is None:
+        # Keyed by the CSV file and the pandas version, a pickle from another version may not load.
+        stat = os.stat(demo_path)
+        if private_dir(cache_dir) is None:
+            demo_df = pd.read_csv(demo_path)
+            return demo_df
+
+        cache_path = os.path.join(cache_dir, f"demo_{stat.st_size}_{int(stat.st_mtime)}_{pd.__version__}.pkl")
+        try:
+            demo_df = pd.read_pickle(cache_path)
+        except Exception:
+            demo_df = pd.read_csv(demo_path)
+            write_atomic(cache_path, lambda f: demo_df.to_pickle(f))
+
+    return demo_df
+
+
+@jobs.task("clean_data")
+@profiler.wrap("clean_data")
+def clean_data_job(version_id, plan, progress):
+    c_tbl = datasets.get(version_id)
+    profile = cf.cached_empty_value_profile(c_tbl, version_id) if plan["change_dtype"] != [] else None
+
+    d_tbl = cf.apply_cleaning_plan(df = c_tbl, plan = plan, profile = profile, progress = progress)
+
+    return datasets.commit(version_id, d_tbl, cf.describe_cleaning_plan(plan))
+
+
+def resolve_version(version_id, plan = None, **kwargs):
+    # Runs before the job process is forked, the child gets the table (or its cached sample) itself.
+    if plan is None or plan["strategy"] != "sampled":
+        return {"df": datasets.get(version_id), "plan": plan, **kwargs}
+
+    return {"df": datasets.sample(version_id, plan["sample_size"]), "plan": plan,
+            "total_rows": datasets.version(version_id).n_rows, **kwargs}
+
+
+@jobs.task("create_summary", executor = "process", prepare = resolve_version, preload = ["plotly.express"])
+@profiler.wrap("wrapper_summary")
+def create_summary_job(df, summary_args, progress, plan = None, total_rows = None):
+    variables = [summary_args["first_variable"], summary_args["second_variable"], summary_args["third_variable"]]
+
+    if plan is not None and plan["strategy"] == "binned":
+        progress(1, 3, rows = df.shape[0], message = "Binning points")
+        df = planner.bin_points(df, variables, bins = plan["bins"])
+
+    progress(2, 3, rows = df.shape[0], message = "Computing summary")
+    u_output = cf.wrapper_summary(w_df = df, **summary_args)
+    progress(3, 3, rows = df.shape[0], message = "Done")
+
+    if total_rows is None or df.shape[0] >= total_rows:
+        return {"output": u_output, "sample": None, "plan": plan}
+
+    return {"output": u_output, "sample": cf.sample_error(df, total_rows, variables), "plan": plan}
+
+
+def resolve_correlation_values(version_id, method, profile = False):
+    # The numeric values (or their ranks) are cached per version in the parent, the child only multiplies them.
+    cc_tbl = datasets.get(version_id)
+    names, values = correlations.values(version_id, cc_tbl[cf.get_matrix_var(cc_tbl)], method)
+
+    return {"names": names, "values": values, "profile": profile}
+
+
+@jobs.task("correlation_matrix", executor = "process", prepare = resolve_correlation_values)
+@profiler.wrap("corr_matrix")
+def correlation_matrix_job(names, values, progress):
+    progress(1, 2, rows = values.shape[0], message = "Computing correlation")
+
+    corr_mtx = correlation_frame(values, names)
+    progress(2, 2, rows = values.shape[0], message = "Done")
+
+    return corr_mtx
+
+
+def resolve_correlation_table(version_id, method, columns, k, threshold, profile = False):
+    # Wide tables are not copied to a float array up front, the child reads the columns one block at a time.
+    cc_tbl = datasets.get(version_id)
+
+    return {"df": cc_tbl, "columns": cf.get_matrix_var(cc_tbl) if columns is None else columns, "method": method,
+            "k": k, "threshold": threshold, "profile": profile}
+
+
+@jobs.task("correlation_search", executor = "process", prepare = resolve_correlation_table)
+@profiler.wrap("corr_matrix")
+def correlation_search_job(df, columns, method, k, threshold, progress):
+    if len(columns) <= max_matrix_columns:
+        progress(1, 1, rows = df.shape[0], message = "Computing correlation")
+        return None, correlation_frame(column_values(df, columns, method), columns)
+
+    return top_correlations(df, columns, method = method, k = k, threshold = threshold, progress = progress)
+
+
 
 
 # Callbacks ============================================================================================================
@@ -752,61 +1039,115 @@ def parse_contents(contents, filename, date):
 
 @app.callback(
     Output("store_data", "data"),
+    Output("store_schema", "data"),
     Input("use_demo_data", "n_clicks"),
     Input("upload_data", "contents"),
     State("upload_data", "filename"),
-    State("upload_data", "last_modified")
+    State("upload_data", "last_modified"),
+    State("store_data", "data")
 )
-def data_choice(click_demo, list_of_contents, list_of_names, list_of_dates):
+def data_choice(click_demo, list_of_contents, list_of_names, list_of_dates, previous_version):
+    f_tbl = None
+
     if click_demo and not list_of_contents:
-        return demo_df.to_json(date_format = "iso", orient = "split")
+        f_tbl = demo_data()
 
     elif click_demo and list_of_contents:
         if ctx.triggered_id is not None:
             button_id = ctx.triggered_id #[0]["prop_id"].split(".")[0]
 
             if button_id == "upload_data":
-                f_tbl = [parse_contents(c, n, d) for c, n, d in zip(list_of_contents, list_of_names, list_of_dates)]
-                return f_tbl[0].to_json(date_format = "iso", orient = "split")
+                f_tbl = [parse_contents(c, n, d) for c, n, d in zip(list_of_contents, list_of_names, list_of_dates)][0]
 
             elif button_id == "use_demo_data":
-                return demo_df.to_json(date_format = "iso", orient = "split")
+                f_tbl = demo_data()
 
     elif not click_demo  and list_of_contents:
-        f_tbl = [parse_contents(c, n, d) for c, n, d in zip(list_of_contents, list_of_names, list_of_dates)]
-        return f_tbl[0].to_json(date_format = "iso", orient = "split")
+        f_tbl = [parse_contents(c, n, d) for c, n, d in zip(list_of_contents, list_of_names, list_of_dates)][0]
+
+    if not isinstance(f_tbl, pd.DataFrame):
+        raise dash.exceptions.PreventUpdate
+
+    if previous_version is not None:
+        datasets.drop_dataset(previous_version)
+
+    f_tbl, memory_report = cf.optimize_dtypes(f_tbl)
+    data_version = datasets.create(f_tbl)
+
+    # Published next to the version id: the dropdowns only need the names and types, not the rows.
+    return data_version, {**cf.cached_table_schema(f_tbl, data_version), "memory": memory_report}
 
 
 @app.callback(
     Output("display_data", "children"),
     Input("store_data", "data"),
 )
-def display_data(jsonified_data):
-    if jsonified_data is not None:
-        c_tbl = pd.read_json(jsonified_data, orient = "split")
+def display_data(data_version):
+    if data_version in datasets:
+        c_tbl = datasets.get(data_version)
+
+        return comp_fun.create_dataframe(df = c_tbl, table_id = "data_table")
+
+
+@app.callback(
+    Output("data_table", "data"),
+    Output("data_table", "page_count"),
+    Input("data_table", "page_current"),
+    Input("data_table", "page_size"),
+    Input("data_table", "sort_by"),
+    Input("data_table", "filter_query"),
+    State("store_data", "data"),
+    prevent_initial_call = True,
+)
+def page_data_table(page_current, page_size, sort_by, filter_query, data_version):
+    if data_version not in datasets:
+        raise dash.exceptions.PreventUpdate
 
-        return comp_fun.create_dataframe(df = c_tbl)
+    return comp_fun.table_page(datasets.get(data_version), page_current, page_size, sort_by, filter_query)
 
 
 
+@app.callback(
+    Output("dtype_table", "data"),
+    Output("dtype_table", "page_count"),
+    Input("dtype_table", "page_current"),
+    Input("dtype_table", "page_size"),
+    Input("dtype_table", "sort_by"),
+    Input("dtype_table", "filter_query"),
+    State("check_data", "data"),
+    State("data_variable_type", "value"),
+    prevent_initial_call = True,
+)
+def page_dtype_table(page_current, page_size, sort_by, filter_query, data_version, variable_type):
+    if data_version not in datasets or variable_type is None:
+        raise dash.exceptions.PreventUpdate
+
+    c_tbl = datasets.get(data_version)
+    selected_dtype = c_tbl[cf.get_dtype(df = c_tbl, dtype = variable_type, return_names = True)]
+
+    return comp_fun.table_page(selected_dtype, page_current, page_size, sort_by, filter_query)
+
+
 @app.callback(
     Output("data_check_output", "children"),
-    Input("store_data", "data"),
+    Input("check_data", "data"),
     Input("data_variable_type", "value"),
     Input("unique_chr_value", "n_clicks"),
     Input("numeric_summary", "n_clicks"),
     Input("missing_values", "n_clicks"),
+    Input("memory_usage", "n_clicks"),
 )
-def check_for(jsonified_data, variable_type, unique_chr, num_summary, missing_vals):
-    if jsonified_data is not None:
-        c_tbl = pd.read_json(jsonified_data, orient = "split")
+def check_for(data_version, variable_type, unique_chr, num_summary, missing_vals, memory_usage):
+    if data_version in datasets:
+        c_tbl = datasets.get(data_version)
 
-        if variable_type is not None or unique_chr is not None or num_summary is not None or missing_vals is not None:
+        if (variable_type is not None or unique_chr is not None or num_summary is not None or missing_vals is not None
+                or memory_usage is not None):
             recent_id = ctx.triggered_id if not None else None
 
             if recent_id == "data_variable_type" and variable_type is not None:
                 selected_dtype = cf.get_dtype(df = c_tbl, dtype = variable_type, return_names = False)
-                return comp_fun.create_dataframe(selected_dtype)
+                return comp_fun.create_dataframe(selected_dtype, table_id = "dtype_table")
 
             elif recent_id == "unique_chr_value":
                 unique_chr_tbl = cf.chr_unique_value(df = c_tbl, max_n=10)
@@ -820,17 +1161,24 @@ def check_for(jsonified_data, variable_type, unique_chr, num_summary, missing_va
                 missing_vals_tbl = cf.get_missing_values(df = c_tbl)
                 return comp_fun.create_dataframe(missing_vals_tbl)
 
+            elif recent_id == "memory_usage":
+                memory_tbl = cf.memory_usage_table(datasets.column_stats(data_version, cf.column_memory))
+                return comp_fun.create_dataframe(memory_tbl, page_size = 20)
+
 
 
 @app.callback(
     Output("data_inspection_summary", "children"),
-    Input("store_data", "data")
+    Input("check_data", "data"),
+    State("store_schema", "data")
 )
-def update_data_inspection_summary(jsonified_data):
-    if jsonified_data is not None:
-        c_tbl = pd.read_json(jsonified_data, orient = "split")
+def update_data_inspection_summary(data_version, schema):
+    if data_version in datasets:
+        c_tbl = datasets.get(data_version)
+        memory_report = schema.get("memory") if schema is not None and schema["version"] == data_version else None
 
-        return cf.table_structure(c_tbl)
+        return cf.table_structure(c_tbl, memory_report = memory_report,
+                                  memory_stats = datasets.column_stats(data_version, cf.column_memory))
 
 
 @app.callback(
@@ -840,12 +1188,11 @@ def update_data_inspection_summary(jsonified_data):
      Output("change_boolean_var", "options"),
      Output("change_datetime_var", "options"),
      Output("datetime_variable", "options")],
-    Input("store_data", "data"),
+    Input("store_schema", "data"),
 )
-def update_variable_names(jsonified_data):
-    if jsonified_data is not None:
-        c_tbl = pd.read_json(jsonified_data, orient="split")
-        variable_names = c_tbl.columns.to_list()
+def update_variable_names(schema):
+    if schema is not None:
+        variable_names = schema["columns"]
 
         return variable_names, variable_names, variable_names, variable_names, variable_names, variable_names
     else:
@@ -855,50 +1202,38 @@ def update_variable_names(jsonified_data):
 @app.callback(
     Output("drop_empty_value", "children"),
     Output("drop_empty_value_modal", "is_open"),
-    Input("store_data", "data"),
     Input("close_drop_empty_value_modal", "n_clicks"),
     Input("clean", "n_clicks"),
-    [State("change_character_var", "value"),
+    [State("store_data", "data"),
+    State("store_cleaned_data", "data"),
+    State("change_character_var", "value"),
     State("change_integer_var", "value"),
     State("change_float_var", "value"),
     State("change_boolean_var", "value"),
     State("change_datetime_var", "value"),]
 )
-def dropped_empty_value_modal(jsonified_data, close_click, clean_click, change_chr, change_int, change_float, change_bool,
-                            change_date):
-    if jsonified_data is not None:
-        c_tbl = pd.read_json(jsonified_data, orient = "split")
-        d_tbl = c_tbl.copy()
-
+def dropped_empty_value_modal(close_click, clean_click, data_version, cleaned_version, change_chr, change_int, change_float,
+                              change_bool, change_date):
+    if data_version in datasets:
         if clean_click:
             cond = False if close_click else True
 
-            if change_chr is not None:
-                val = cf.check_for(what = "empty_values", df = d_tbl, variables= change_chr)
+            selected_vars = []
+            for change_vars in [change_chr, change_int, change_float, change_bool, change_date]:
+                if change_vars is not None:
+                    selected_vars += [var for var in change_vars if var not in selected_vars]
+
+            if selected_vars != []:
+                base_version = cleaned_version if cleaned_version in datasets else data_version
+                c_tbl = datasets.get(base_version)
+                profile = cf.cached_empty_value_profile(c_tbl, base_version)
+
+                selected_vars = [var for var in selected_vars if var in c_tbl.columns]
+                val = cf.check_for(what = "empty_values", df = c_tbl, variables = selected_vars, profile = profile)
                 if val["bool"]:
                     return comp_fun.have_empty_values_markdown(val), cond
                 else:
                     return dash.no_update
-            elif change_int is not None:
-                val = cf.check_for(what="empty_values", df=d_tbl, variables = change_int)
-                if val["bool"]:
-                    return comp_fun.have_empty_values_markdown(val), cond
-                return dash.no_update
-            elif change_float is not None:
-                val = cf.check_for(what="empty_values", df=d_tbl, variables=change_float)
-                if val["bool"]:
-                    return comp_fun.have_empty_values_markdown(val), cond
-                return dash.no_update
-            elif change_bool is not None:
-                val = cf.check_for(what="empty_values", df=d_tbl, variables=change_bool)
-                if val["bool"]:
-                    return comp_fun.have_empty_values_markdown(val), cond
-                return dash.no_update
-            elif change_date is not None:
-                val = cf.check_for(what="empty_values", df=d_tbl, variables=change_date)
-                if val["bool"]:
-                    return comp_fun.have_empty_values_markdown(val), cond
-                return dash.no_update
             else:
                 return dash.no_update
         else:
@@ -907,69 +1242,145 @@ def dropped_empty_value_modal(jsonified_data, close_click, clean_click, change_c
         return dash.no_update
 
 
+def cleaning_history_markdown(version_id):
+    steps = datasets.history(version_id)
+
+    return "  \n".join(f"{ind}. {step}" for ind, step in enumerate(steps))
+
+
 @app.callback(
     Output("data_cleaning_output", "children"),
     Output("store_cleaned_data", "data"),
+    Output("cleaning_history", "children"),
+    Output("clean_progress", "children"),
+    Output("clean_job", "data"),
+    Output("clean_poll", "disabled"),
     Input("store_data", "data"),
     Input("clean", "n_clicks"),
-    [State("drop_missing_values", "value"),
-    State("percent_non_missing", "value"),
-    State("change_character_var", "value"),
-    State("change_integer_var", "value"),
-    State("change_float_var", "value"),
-    State("change_boolean_var", "value"),
-    State("change_datetime_var", "value"),
-    State("datetime_variable", "value"),
-    State("type_datetime", "value")],
+    Input("clean_poll", "n_intervals"),
+    Input("undo_clean", "n_clicks"),
+    Input("redo_clean", "n_clicks"),
+    [Input("drop_missing_values", "value"),
+    Input("percent_non_missing", "value"),
+    Input("change_character_var", "value"),
+    Input("change_integer_var", "value"),
+    Input("change_float_var", "value"),
+    Input("change_boolean_var", "value"),
+    Input("change_datetime_var", "value"),
+    Input("datetime_variable", "value"),
+    Input("type_datetime", "value"),
+    Input("preview_sample_type", "value"),
+    Input("preview_n_rows", "value")],
+    State("store_cleaned_data", "data"),
+    State("clean_job", "data"),
 )
-def clean_data(jsonified_data, click, drop_missing, percent_missing,
-               change_chr, change_int, change_float, change_bool, change_date, date_var, typ_date):
-    if jsonified_data is not None:
-        c_tbl = pd.read_json(jsonified_data, orient = "split")
-        d_tbl = c_tbl.copy()
-
-        if drop_missing is not None:
-            if drop_missing != "percent_missing":
-                d_tbl = cf.drop_missing_values(df = d_tbl, how = drop_missing, percentage = None)
-            else:
-                if percent_missing is not None:
-                    d_tbl = cf.drop_missing_values(df = d_tbl, how = drop_missing, percentage = percent_missing)
-                else:
-                    dash.no_update
-
-        if change_chr is not None:
-            d_tbl = cf.change_dtype(df = d_tbl, variables = change_chr, to_type = "character")
-        if change_int is not None:
-            d_tbl = cf.change_dtype(df = d_tbl, variables = change_int, to_type = "integer")
-        if change_float is not None:
-            d_tbl = cf.change_dtype(df = d_tbl, variables = change_float, to_type = "float")
-        if change_bool is not None:
-            d_tbl = cf.change_dtype(df = d_tbl, variables = change_bool, to_type = "boolean")
-        if change_date is not None:
-            d_tbl = cf.change_dtype(df = d_tbl, variables = change_date, to_type = "date")
-
-        if date_var is not None:
-            if typ_date is not None:
-                d_tbl = cf.extract_datetime(df = d_tbl, date_col = date_var, which = typ_date)
+def clean_data(data_version, click, n_polls, undo_click, redo_click, drop_missing, percent_missing,
+               change_chr, change_int, change_float, change_bool, change_date, date_var, typ_date,
+               preview_type, preview_rows, cleaned_version, job_id):
+    no_job_update = dash.no_update, dash.no_update, dash.no_update
+
+    if data_version in datasets:
+        if ctx.triggered_id == "clean_poll":
+            status = jobs.status(job_id) if job_id is not None else None
+
+            if status is None:
+                return dash.no_update, dash.no_update, dash.no_update, [], None, True
+
+            elif status["status"] == "done":
+                new_version = jobs.result(job_id)
+                d_tbl = datasets.get(new_version)
+
+                return comp_fun.create_dataframe(d_tbl, page_size = 20, tbl_height = "600px", table_id = "cleaned_data_table"), new_version, \
+                       cleaning_history_markdown(new_version), [], None, True
+
+            elif status["status"] == "failed":
+                return comp_fun.preview_note(f"Cleaning failed: {status['message']}"), dash.no_update, dash.no_update, \
+                       [], None, True
+
+            return dash.no_update, dash.no_update, dash.no_update, comp_fun.job_progress(status), dash.no_update, dash.no_update
+
+        # Every cleaning step is applied to the current version, a new upload starts from its root version.
+        if ctx.triggered_id == "store_data" or cleaned_version not in datasets:
+            cleaned_version = data_version
+
+        if ctx.triggered_id == "store_data":
+            return [], None, cleaning_history_markdown(data_version), [], None, True
+
+        if ctx.triggered_id in ["undo_clean", "redo_clean"]:
+            if ctx.triggered_id == "undo_clean":
+                to_version = datasets.undo(cleaned_version)
             else:
-                d_tbl
+                to_version = datasets.redo(cleaned_version)
 
-        if click:
-            return comp_fun.create_dataframe(d_tbl, page_size = 20, tbl_height = "600px"), d_tbl.to_json(date_format = "iso", orient = "split")
-        else:
+            if to_version is None:
+                raise dash.exceptions.PreventUpdate
+
+            d_tbl = datasets.get(to_version)
+            return (comp_fun.create_dataframe(d_tbl, page_size = 20, tbl_height = "600px", table_id = "cleaned_data_table"), to_version,
+                    cleaning_history_markdown(to_version)) + no_job_update
+
+        c_tbl = datasets.get(cleaned_version)
+
+        plan = cf.cleaning_plan(drop_missing = drop_missing, percentage = percent_missing,
+                                change_chr = change_chr, change_int = change_int, change_float = change_float,
+                                change_bool = change_bool, change_date = change_date,
+                                date_var = date_var, which = typ_date)
+
+        if ctx.triggered_id == "clean":
+            new_job = jobs.submit("clean_data", version_id = cleaned_version, plan = plan,
+                                  profile = profiler.requested())
+
+            return dash.no_update, dash.no_update, dash.no_update, comp_fun.job_progress(jobs.status(new_job)), new_job, False
+
+        # Preview: apply the pending plan to a sample only, `store_cleaned_data` is left untouched.
+        if cf.is_empty_plan(plan):
             raise dash.exceptions.PreventUpdate
 
+        preview_rows = 100 if preview_rows is None else preview_rows
+        p_tbl = cf.sample_rows(df = c_tbl, n_rows = preview_rows, how = preview_type)
+
+        try:
+            p_tbl = cf.apply_cleaning_plan(df = p_tbl, plan = plan)
+        except (ValueError, TypeError, IndexError, KeyError) as e:
+            return (comp_fun.preview_note(f"The pending cleaning steps can not be applied: {e}"), dash.no_update,
+                    dash.no_update) + no_job_update
+
+        return html.Div(
+            [
+                comp_fun.preview_note(f"Preview on {p_tbl.shape[0]:,} of {c_tbl.shape[0]:,} rows. Click Clean to apply it to the full data."),
+                comp_fun.create_dataframe(p_tbl, page_size = 20, tbl_height = "600px"),
+            ]
+        ), dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
     else:
-        return dash.no_update, dash.no_update
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
+
+@app.callback(
+    Output("cleaned_data_table", "data"),
+    Output("cleaned_data_table", "page_count"),
+    Input("cleaned_data_table", "page_current"),
+    Input("cleaned_data_table", "page_size"),
+    Input("cleaned_data_table", "sort_by"),
+    Input("cleaned_data_table", "filter_query"),
+    State("store_cleaned_data", "data"),
+    prevent_initial_call = True,
+)
+def page_cleaned_data_table(page_current, page_size, sort_by, filter_query, cleaned_version):
+    if cleaned_version not in datasets:
+        raise dash.exceptions.PreventUpdate
+
+    return comp_fun.table_page(datasets.get(cleaned_version), page_current, page_size, sort_by, filter_query)
+
 
 
 @app.callback(
     Output("table_summary", "children"),
     Input("store_cleaned_data", "data"),
 )
-def update_cleaned_data_summary(cleaned_jsonified_data):
-    if cleaned_jsonified_data is not None:
-        clean_df = pd.read_json(cleaned_jsonified_data, orient = "split")
+def update_cleaned_data_summary(cleaned_version):
+    if cleaned_version in datasets:
+        clean_df = datasets.get(cleaned_version)
 
         return cf.table_structure(clean_df)
 
@@ -979,9 +1390,9 @@ def update_cleaned_data_summary(cleaned_jsonified_data):
     Output("data_type_output", "children"),
     Input("store_cleaned_data", "data"),
 )
-def create_data_type_table(cleaned_jsonified_data):
-    if cleaned_jsonified_data is not None:
-        clean_df = pd.read_json(cleaned_jsonified_data, orient = "split")
+def create_data_type_table(cleaned_version):
+    if cleaned_version in datasets:
+        clean_df = datasets.get(cleaned_version)
 
         desc_output = cf.create_data_type_table(clean_df)
         return comp_fun.create_dataframe(desc_output, page_size = 20, tbl_height = "400px")
@@ -991,34 +1402,41 @@ def create_data_type_table(cleaned_jsonified_data):
 
 
 
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace = "var_summary", function_name = "open_tab"),
+    Output("check_data", "data"),
     Output("summary_data", "data"),
-    Input("store_cleaned_data", "data"),
+    Input("top_tab", "active_tab"),
     Input("store_data", "data"),
+    Input("store_cleaned_data", "data"),
+    State("check_data", "data"),
+    State("summary_data", "data"),
 )
-def update_summary_data(cleaned_jsonified_data, jsonified_data):
-    if cleaned_jsonified_data is None and jsonified_data is not None:
-        return jsonified_data
-    elif cleaned_jsonified_data is not None and jsonified_data is not None:
-        return cleaned_jsonified_data
-    else:
-        raise dash.exceptions.PreventUpdate
 
 
 
+@app.callback(
+    Output("summary_schema", "data"),
+    Input("summary_data", "data"),
+)
+def update_summary_schema(summary_version):
+    if summary_version in datasets:
+        return cf.cached_table_schema(datasets.get(summary_version), summary_version)
+    else:
+        return None
+
+
 @app.callback(
     Output("first_variable", "options"),
     Output("second_variable", "options"),
     Output("second_variable", "value"),
     Output("third_variable", "options"),
     Output("third_variable", "value"),
-    Input("summary_data", "data"),
+    Input("summary_schema", "data"),
 )
-def update_cleaned_variable_names(jsonified_summary_data):
-    if jsonified_summary_data is not None:
-        s_tbl = pd.read_json(jsonified_summary_data, orient = "split")
-
-        variable_names = s_tbl.columns.to_list()
+def update_cleaned_variable_names(schema):
+    if schema is not None:
+        variable_names = schema["columns"]
         variable_names_no_sel = variable_names + ["No Selection"]
 
         return variable_names, variable_names_no_sel, "No Selection", variable_names_no_sel, "No Selection"
@@ -1027,7 +1445,8 @@ def update_cleaned_variable_names(jsonified_summary_data):
         return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
 
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace = "var_summary", function_name = "toggle_duplicate_modal"),
     Output("modal_id", "is_open"),
     Input("first_variable", "value"),
     Input("second_variable", "value"),
@@ -1035,84 +1454,28 @@ def update_cleaned_variable_names(jsonified_summary_data):
     Input("close_modal", "n_clicks"),
     State("modal_id", "is_open")
 )
-def toggle_duplicate_modal(first_var, second_var, third_var, close_click, is_open):
-    if first_var is not None and second_var is not None and third_var is not None:
-        if second_var != "No Selection" and third_var == "No Selection":
-            if first_var == second_var:
-                return not is_open
-            elif close_click:
-                return is_open
-
-        elif second_var != "No Selection" and third_var != "No Selection":
-            if first_var == second_var or  first_var == third_var or second_var == third_var:
-                return not is_open
-
-            elif close_click:
-                return is_open
-    else:
-        dash.no_update
 
-@app.callback(
+
+app.clientside_callback(
+    ClientsideFunction(namespace = "var_summary", function_name = "duplicate_message"),
     Output("duplicate_input", "children"),
     Input("first_variable", "value"),
     Input("second_variable", "value"),
     Input("third_variable", "value"),
 )
-def update_duplicate_message(first_var, second_var, third_var):
-    def markdown_output(variable_type):
-        return f"""  
-                All variables supplied must be unique.  
-                  
-                | variable | | value |
-                | --- | --- | ---: |
-                | first | = | {first_var} |
-                | second | = | {second_var} |
-                | Third | = | {third_var} |  
-                
-                {var_type} are similar.
-               """
-
-    if first_var is not None and second_var is not None and third_var is not None:
-        if second_var != "No Selection" and third_var == "No Selection":
-            duplicate_value = ["first", "second"]
-
-            var_type = f"The {duplicate_value[0]} and {duplicate_value[1]} variable"
-            return markdown_output(var_type)
-
-        elif second_var != "No Selection" and third_var != "No Selection":
-            if first_var == second_var and first_var == third_var:
-                duplicate_value = "All"
-            elif first_var == third_var:
-                duplicate_value = ["first", "third"]
-            elif second_var == third_var:
-                duplicate_value = ["second", "third"]
-            elif first_var == second_var:
-                duplicate_value = ["first", "second"]
-            else:
-                duplicate_value = ""
-
-            if isinstance(duplicate_value, list):
-                var_type = f"The {duplicate_value[0]} and {duplicate_value[1]} variable"
-            else:
-                var_type = "All variables"
-
-            return markdown_output(var_type)
-    else:
-        return dash.no_update
 
 
 @app.callback(
     Output("plot_type", "options"),
     Output("agg_function", "options"),
     Output("agg_function", "value"),
-    Input("summary_data", "data"),
+    Input("summary_schema", "data"),
     Input("first_variable", "value"),
     Input("second_variable", "value"),
     Input("third_variable", "value"),
 )
-def update_plot_agg_type(jsonified_summary_data, first_var, second_var, third_var):
-    if jsonified_summary_data is not None:
-        s_tbl = pd.read_json(jsonified_summary_data, orient = "split")
+def update_plot_agg_type(schema, first_var, second_var, third_var):
+    if schema is not None:
 
         second_var = None if second_var == "No Selection" else second_var
         third_var = None if third_var == "No Selection" else third_var
@@ -1120,10 +1483,12 @@ def update_plot_agg_type(jsonified_summary_data, first_var, second_var, third_va
         if first_var is not None:
             supplied_variables = [first_var, second_var, third_var]
 
-            for_plot_type = cf.check_dtype(df = s_tbl, variables = supplied_variables, ckeck_for = "plot_type")
-            for_agg_value = cf.check_dtype(df = s_tbl, variables = supplied_variables, ckeck_for = "agg_fun")
+            for_plot_type = cf.check_dtype(df = None, variables = supplied_variables, ckeck_for = "plot_type",
+                                           dtypes = schema["dtypes"])
+            for_agg_value = cf.check_dtype(df = None, variables = supplied_variables, ckeck_for = "agg_fun",
+                                           dtypes = schema["dtypes"])
 
-            unique_len = s_tbl[first_var].nunique()
+            unique_len = schema["nunique"].get(first_var)
 
             if for_plot_type == "character":
                 if unique_len <= 5:
@@ -1169,56 +1534,183 @@ def update_plot_agg_type(jsonified_summary_data, first_var, second_var, third_va
 
 
 
+def summary_arguments(first_var, second_var, third_var, plot_type, agg_fun, drop_outlier, n_chr_unique_val,
+                      output_type):
+    return {"first_variable": first_var,
+            "second_variable": None if second_var == "No Selection" else second_var,
+            "third_variable": None if third_var == "No Selection" else third_var,
+            "plt_type": plot_type,
+            "num_agg_type": agg_fun,
+            "outlier_type": drop_outlier,
+            "n_char_unique_value": n_chr_unique_val,
+            "output_type": output_type}
+
+
+def summary_key(data_version, summary_args, plan = None):
+    return json.dumps([data_version, summary_args, plan], sort_keys = True, default = str)
+
+
+def summary_plan(data_version, summary_args, approximate_mode, sample_size, exact = False):
+    """
+    How the summary is computed, see `planner.plan_summary()`. Approximate mode and Display Exactly override the
+    planner.
+    """
+    n_rows = datasets.version(data_version).n_rows
+
+    if exact:
+        return {"strategy": "exact", "rows": n_rows, "reason": "requested"}
+
+    if "sample" in (approximate_mode or []) and sample_size:
+        return {"strategy": "sampled", "rows": n_rows, "sample_size": int(sample_size), "reason": "approximate mode"}
+
+    schema = cf.cached_table_schema(datasets.get(data_version), data_version)
+    return planner.plan_summary(n_rows, schema["dtypes"], schema["nunique"], summary_args)
+
+
+def speculate_summary(session_id, data_version, summary_args, plan):
+    """
+    Start computing the summary of the current selection before Run is clicked. A newer selection supersedes, and
+    cancels, the speculative job of the session.
+    """
+    key = summary_key(data_version, summary_args, plan)
+
+    # Held through the submit, so two callbacks of the same selection don't both start a job.
+    with speculative_lock:
+        job_id = speculative_jobs.get(key)
+        status = jobs.status(job_id) if job_id is not None else None
+
+        if status is not None and status["status"] in ["queued", "running", "done"]:
+            speculative_jobs.move_to_end(key)
+            if status["status"] == "done":
+                jobs.cancel_slot(session_id, "speculative")
+            return
+
+        speculative_jobs[key] = jobs.submit("create_summary", session = session_id, slot = "speculative",
+                                            version_id = data_version, summary_args = summary_args,
+                                            plan = plan, profile = profiler.requested())
+
+        while len(speculative_jobs) > max_speculative_jobs:
+            speculative_jobs.popitem(last = False)
+
+    metrics.increment("summary_strategy_total", strategy = plan["strategy"], speculative = "true")
+
+
+def summary_output(result, output_type, n_rows):
+    if output_type == "plot":
+        u_output = comp_fun.create_graph(result["output"])
+    elif output_type == "table":
+        u_output = comp_fun.create_dataframe(df = result["output"], page_size = n_rows)
+
+    notes = []
+    if result["plan"] is not None and result["plan"]["strategy"] != "exact":
+        notes.append(comp_fun.strategy_note(result["plan"]))
+    if result["sample"] is not None:
+        notes.append(comp_fun.sample_note(result["sample"]))
+
+    return html.Div(notes + [u_output]) if notes != [] else u_output
+
+
 @app.callback(
     Output("summary_output", "children"),
+    Output("summary_progress", "children"),
+    Output("summary_job", "data"),
+    Output("summary_poll", "disabled"),
     Input("summary_data", "data"),
     Input("run_summary", "n_clicks"),
-    State("first_variable", "value"),
-    State("second_variable", "value"),
-    State("third_variable", "value"),
-    State("plot_type", "value"),
-    State("agg_function", "value"),
-    State("drop_outlier", "value"),
-    State("num_unique_obs", "value"),
-    State("output_type", "value"),
-    State("num_rows", "value")
+    Input("summary_poll", "n_intervals"),
+    Input("first_variable", "value"),
+    Input("second_variable", "value"),
+    Input("third_variable", "value"),
+    Input("plot_type", "value"),
+    Input("agg_function", "value"),
+    Input("drop_outlier", "value"),
+    Input("num_unique_obs", "value"),
+    Input("output_type", "value"),
+    Input("num_rows", "value"),
+    Input("approximate_mode", "value"),
+    Input("sample_size", "value"),
+    Input("run_exact_summary", "n_clicks"),
+    State("summary_job", "data"),
+    State("session_id", "data"),
 )
-def create_summary(jsonified_data, clicks, first_var, second_var, third_var, plot_type, agg_fun, drop_outlier, n_chr_unique_val,
-                   output_type, n_rows):
-    if jsonified_data is not None:
-        cc_tbl = pd.read_json(jsonified_data, orient = "split")
-
-        if clicks:
-            second_var = None if second_var == "No Selection" else second_var
-            third_var = None if third_var == "No Selection" else third_var
-
-            u_output = cf.wrapper_summary(w_df = cc_tbl,
-                                          first_variable  = first_var,
-                                          second_variable = second_var,
-                                          third_variable  = third_var,
-                                          plt_type = plot_type,
-                                          num_agg_type = agg_fun,
-                                          outlier_type = drop_outlier,
-                                          n_char_unique_value = n_chr_unique_val,
-                                          output_type  = output_type)
-
-            if output_type == "plot":
-                return comp_fun.create_graph(u_output)
-            elif output_type == "table":
-                return comp_fun.create_dataframe(df = u_output, page_size = n_rows)
+def create_summary(data_version, clicks, n_polls, first_var, second_var, third_var, plot_type, agg_fun, drop_outlier,
+                   n_chr_unique_val, output_type, n_rows, approximate_mode, sample_size, exact_clicks, summary_job,
+                   session_id):
+    if data_version in datasets:
+        # A poll only reads the status of the job, the plan it runs with is in `summary_job`.
+        if ctx.triggered_id == "summary_poll":
+            status = jobs.status(summary_job["job_id"]) if summary_job is not None else None
+
+            if status is None:
+                return dash.no_update, [], None, True
+
+            elif status["status"] == "done":
+                result = jobs.result(summary_job["job_id"])
+                return summary_output(result, summary_job["output_type"], summary_job["n_rows"]), [], None, True
+
+            elif status["status"] == "failed":
+                return comp_fun.preview_note(f"The summary could not be created: {status['message']}"), [], None, True
+
+            elif status["status"] == "cancelled":
+                return dash.no_update, [], None, True
+
+            return dash.no_update, comp_fun.job_progress(status), dash.no_update, dash.no_update
+
+        if ctx.triggered_id in [None, "summary_data"] and not (clicks or exact_clicks):
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
+        # Planning reads the table and its schema, only done for a new selection, Run or Display Exactly.
+        summary_args = summary_arguments(first_var, second_var, third_var, plot_type, agg_fun, drop_outlier,
+                                         n_chr_unique_val, output_type)
+        plan = summary_plan(data_version, summary_args, approximate_mode, sample_size,
+                            exact = ctx.triggered_id == "run_exact_summary")
+
+        if ctx.triggered_id not in [None, "summary_data", "run_summary", "run_exact_summary"]:
+            # The inputs changed, a summary still running for the old inputs is no longer needed.
+            cancelled = summary_job is not None and jobs.cancel_slot(session_id, "summary")
+
+            if first_var is not None and output_type is not None:
+                speculate_summary(session_id, data_version, summary_args, plan)
+
+            if cancelled:
+                return dash.no_update, [], None, True
+            raise dash.exceptions.PreventUpdate
+
+        if clicks or exact_clicks:
+            # The plan is part of the response, e.g. to see which strategy a slow summary used.
+            summary_job = {"output_type": output_type, "n_rows": n_rows, "plan": plan}
+            metrics.increment("summary_strategy_total", strategy = plan["strategy"], speculative = "false")
+
+            with speculative_lock:
+                job_id = speculative_jobs.get(summary_key(data_version, summary_args, plan))
+            status = jobs.status(job_id) if job_id is not None else None
+
+            if status is not None and status["status"] == "done":
+                return summary_output(jobs.result(job_id), output_type, n_rows), [], None, True
+
+            elif status is not None and status["status"] in ["queued", "running"]:
+                # Already being computed, poll the speculative job instead of starting another one.
+                return dash.no_update, comp_fun.job_progress(status), {**summary_job, "job_id": job_id}, False
+
+            job_id = jobs.submit("create_summary", session = session_id, slot = "summary",
+                                 version_id = data_version, summary_args = summary_args, plan = plan,
+                                 profile = profiler.requested())
+
+            return dash.no_update, comp_fun.job_progress(jobs.status(job_id)), {**summary_job, "job_id": job_id}, False
+        else:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
     else:
-        return dash.no_update
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
 
 
 @app.callback(
     Output("add_corr_div", "children"),
-    Input("summary_data", "data"),
+    Input("summary_schema", "data"),
 )
-def corr_div_output(jsonified_data):
-    if jsonified_data is not None:
-        cc_tbl = pd.read_json(jsonified_data, orient = "split")
-        cols = cf.get_matrix_var(cc_tbl)
+def corr_div_output(schema):
+    if schema is not None:
+        cols = [var for var in schema["columns"] if schema["dtypes"][var] == "numeric"]
 
         if cols != [] and len(cols) >= 2:
             return html.Div(
@@ -1239,6 +1731,17 @@ def corr_div_output(jsonified_data):
                                                 ),
                                                 html.Br(),
 
+                                                dbc.RadioItems(
+                                                    id="corr_method",
+                                                    options=[
+                                                        {"label": "Pearson", "value": "pearson"},
+                                                        {"label": "Spearman", "value": "spearman"}
+                                                    ],
+                                                    value="pearson",
+                                                    inline=True,
+                                                ),
+                                                html.Br(),
+
                                                 html.Label("Select variables(Optional)"),
                                                 dcc.Dropdown(
                                                     id="matrix_vars",
@@ -1247,6 +1750,32 @@ def corr_div_output(jsonified_data):
                                                     placeholder="Nothing Selected",
                                                     multi = True,
                                                 ),
+
+                                                html.Div(
+                                                    [
+                                                        html.Br(),
+                                                        html.Label("Strongest pairs to show"),
+                                                        dbc.Input(
+                                                            id="corr_top_k",
+                                                            type="number",
+                                                            min=1,
+                                                            max=500,
+                                                            step=1,
+                                                            value=50,
+                                                        ),
+                                                        html.Br(),
+                                                        html.Label("Minimum absolute correlation(Optional)"),
+                                                        dbc.Input(
+                                                            id="corr_threshold",
+                                                            type="number",
+                                                            min=0,
+                                                            max=1,
+                                                            step=0.05,
+                                                        ),
+                                                    ],
+                                                    # Only wide tables are searched for their strongest pairs.
+                                                    hidden=len(cols) <= max_matrix_columns,
+                                                ),
                                             ]
                                         ),
                                         color=cf.card_color
@@ -1260,6 +1789,9 @@ def corr_div_output(jsonified_data):
                                 [
                                     html.Div(
                                         [
+                                            html.Div(id="corr_progress"),
+                                            dcc.Store(id="corr_job"),
+                                            dcc.Interval(id="corr_poll", interval=job_poll_interval, disabled=True),
                                             dcc.Loading(
                                                 id="other_spinner",
                                                 color="black",
@@ -1284,24 +1816,94 @@ def corr_div_output(jsonified_data):
 
 
 
+def correlation_search_key(columns, k, threshold):
+    return None if columns is None else tuple(columns), k, threshold
+
+
 @app.callback(
     Output("other_output", "children"),
+    Output("corr_progress", "children"),
+    Output("corr_job", "data"),
+    Output("corr_poll", "disabled"),
     Input("summary_data", "data"),
     Input("plot_corr", "value"),
-    Input("matrix_vars", "value")
+    Input("matrix_vars", "value"),
+    Input("corr_method", "value"),
+    Input("corr_poll", "n_intervals"),
+    Input("corr_top_k", "value"),
+    Input("corr_threshold", "value"),
+    State("corr_job", "data"),
+    State("session_id", "data"),
 )
-def create_correlation(jsonified_data, b_value, variables):
-    if jsonified_data is not None:
-        cc_tbl = pd.read_json(jsonified_data, orient="split")
+def create_correlation(data_version, b_value, variables, method, n_polls, top_k, threshold, corr_job, session_id):
+    if data_version in datasets:
+        if ctx.triggered_id == "corr_poll":
+            status = jobs.status(corr_job["job_id"]) if corr_job is not None else None
+
+            if status is None or status["status"] == "cancelled":
+                return dash.no_update, [], None, True
 
-        if b_value:
-            corr_plt = cf.corr_matrix(df=cc_tbl, variables=variables)
+            elif status["status"] == "done":
+                search = [] if "search" not in corr_job else correlation_search_key(**corr_job["search"])
+                correlations.store_matrix(corr_job["version"], corr_job["method"], jobs.result(corr_job["job_id"]),
+                                          *search)
 
-            return comp_fun.create_graph(corr_plt)
+            elif status["status"] == "failed":
+                return comp_fun.preview_note(f"The correlation could not be created: {status['message']}"), [], None, True
+
+            else:
+                return dash.no_update, comp_fun.job_progress(status), dash.no_update, dash.no_update
+
+        if b_value and len(cf.get_matrix_var(datasets.get(data_version))) > max_matrix_columns:
+            # Too many variables for a full matrix: search the selected (or all) variables block by block.
+            search = {"columns": variables if variables is not None and len(variables) >= 2 else None,
+                      "k": top_k or 50, "threshold": threshold}
+            result = correlations.matrix(data_version, method, *correlation_search_key(**search))
+
+            if result is not None:
+                jobs.cancel_slot(session_id, "correlation")
+                pairs, corr_mtx = result
+                with jobs.holding_forks():
+                    corr_plt = comp_fun.create_graph(cf.plot_corr_matrix(corr_mtx))
+
+                if pairs is None:
+                    return corr_plt, [], None, True
+
+                pairs = pairs.assign(Correlation = pairs["Correlation"].round(4))
+                return [comp_fun.create_dataframe(pairs, page_size = 10), html.Br(), corr_plt], [], None, True
+
+            job_id = jobs.submit("correlation_search", session = session_id, slot = "correlation",
+                                 version_id = data_version, method = method, profile = profiler.requested(), **search)
+
+            return dash.no_update, comp_fun.job_progress(jobs.status(job_id)), \
+                   {"job_id": job_id, "version": data_version, "method": method, "search": search}, False
+
+        elif b_value:
+            corr_mtx = correlations.matrix(data_version, method)
+
+            if corr_mtx is not None:
+                # Any subset of variables is a slice of the cached matrix.
+                jobs.cancel_slot(session_id, "correlation")
+                with jobs.holding_forks():
+                    corr_plt = cf.corr_matrix(df = None, variables = variables, corr_mtx = corr_mtx)
+
+                return comp_fun.create_graph(corr_plt), [], None, True
+
+            # The full matrix is computed once per version and method, a newer request supersedes a running one.
+            job_id = jobs.submit("correlation_matrix", session = session_id, slot = "correlation",
+                                 version_id = data_version, method = method, profile = profiler.requested())
+
+            return dash.no_update, comp_fun.job_progress(jobs.status(job_id)), \
+                   {"job_id": job_id, "version": data_version, "method": method}, False
         else:
-            return dash.no_update
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
     else:
-        return dash.no_update
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
+
+@server.route("/jobs/metrics")
+def job_metrics():
+    return jobs.metrics()
 
 
 